@@ -3,12 +3,22 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from .schemas import TokenData
+from . import models
+from sqlalchemy import event, inspect
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# стоимость bcrypt; при изменении хэши пересчитываются прозрачно при следующем входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 SECRET_KEY = os.getenv("JWT_SECRET", "unsafe-secret")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
@@ -19,6 +29,105 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    # (верен ли пароль, новый хэш если текущие настройки стоимости отличаются)
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except ValueError:
+        # в hashed_password не хэш (например, пользователь заведён скриптом с открытым паролем)
+        return False, None
+
+
+# ---- password executor ----
+# bcrypt занимает ~250 мс CPU; в общем threadpool это душит остальные запросы.
+# Хэширование уходит в отдельный пул процессов с ограничением очереди.
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+
+
+class PasswordQueueFull(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.rehashed = 0
+        self.total_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # пул создаётся при старте приложения; spawn, а не fork: к этому моменту в процессе
+        # уже есть потоки, цикл событий и соединения пула БД, и fork унаследовал бы их замки и сокеты
+        if self._executor is None and self.workers > 0:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    @property
+    def executor(self):
+        # workers=0 — без отдельных процессов (default executor цикла событий);
+        # без события startup (скрипты, TestClient без with) пул создаётся при первом вызове
+        return self.start()
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordQueueFull()
+            self.pending += 1
+            self.submitted += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.total_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        ok, new_hash = await self._run(verify_and_update_password, plain_password, hashed_password)
+        if ok and new_hash:
+            with self._lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "rehashed": self.rehashed,
+            "seconds_total": round(self.total_seconds, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     now = datetime.utcnow()
@@ -37,7 +146,89 @@ def decode_token(token: str) -> TokenData | None:
         role: str = payload.get("role")
         if email is None:
             return None
-        token_data = TokenData(email=email, role=role)
+        token_data = TokenData(email=email, role=role, user_id=payload.get("uid"))
         return token_data
     except JWTError:
         return None
+
+
+# ---- principal cache ----
+# get_current_user выполняется на каждый запрос; чтобы не ходить в users каждый раз,
+# держим короткоживущий снимок пользователя по subject токена (email).
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+# доверять роли и uid из подписанного токена на read-only маршрутах (без запроса в БД);
+# если снимка пользователя нет в кэше процесса, смена роли / блокировка вступит в силу
+# на этих маршрутах только после истечения токена
+TRUST_ROLE_CLAIMS = os.getenv("TRUST_ROLE_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+
+class Principal:
+    # снимок пользователя, не привязанный к сессии БД
+    __slots__ = ("id", "email", "full_name", "role", "is_active")
+
+    def __init__(self, id, email, full_name=None, role="researcher", is_active=True):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.role = role
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.email, user.full_name, user.role, user.is_active is not False)
+
+
+class PrincipalCache:
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, maxsize: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(email)
+            if item is None or item[0] < now:
+                self._items.pop(email, None)
+                self.misses += 1
+                return None
+            self._items.move_to_end(email)
+            self.hits += 1
+            return item[1]
+
+    def put(self, principal: Principal):
+        if self.ttl <= 0:
+            return principal
+        with self._lock:
+            self._items[principal.email] = (time.monotonic() + self.ttl, principal)
+            self._items.move_to_end(principal.email)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return principal
+
+    def invalidate(self, email: str = None):
+        with self._lock:
+            if email is None:
+                self._items.clear()
+            else:
+                self._items.pop(email, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items)}
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    # смена роли, is_active или email — снимок сбрасывается сразу, не дожидаясь TTL
+    principal_cache.invalidate(target.email)
+    history = inspect(target).attrs.email.history
+    for old_email in history.deleted or ():
+        principal_cache.invalidate(old_email)
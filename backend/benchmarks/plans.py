@@ -0,0 +1,218 @@
+# backend/benchmarks/plans.py
+# Проверка планов горячих запросов на PostgreSQL: каждое SELECT / UPDATE / DELETE, выполненное
+# функцией crud (обход генограммы, каскадное удаление пациента, keyset-страницы, очередь задач),
+# перехватывается и прогоняется через EXPLAIN (FORMAT JSON) с enable_seqscan = off. Если планировщик
+# и тогда выбирает Seq Scan по таблице из WATCHED — подходящего индекса нет (удалён, не совпадают
+# колонки, условие не попадает под частичный индекс). Итог не зависит от объёма данных и статистики.
+# EXPLAIN не показывает запросы проверок внешних ключей (их делают триггеры PostgreSQL при удалении):
+# их покрытие проверяет unindexed_foreign_keys — по схеме, на любой СУБД.
+#
+#   DATABASE_URL=postgresql://.../pedigree_bench python -m backend.benchmarks.plans --seed-patients 20000
+import argparse
+import json
+import sys
+
+from sqlalchemy import event, func, inspect, select, text
+
+from .. import cohort, crud, families, jobs, linkage, models, schemas, synthetic
+from ..auth import Principal
+from ..database import SessionLocal, engine
+from .suite import bench_user
+
+WATCHED = {"patients", "relations", "patient_links", "traits", "import_keys", "patient_matches", "jobs"}
+
+HOT = []
+
+
+def hot(name: str):
+    def register(fn):
+        HOT.append((name, fn))
+        return fn
+    return register
+
+
+# ---- schema ----
+def unindexed_foreign_keys(bind, tables=WATCHED):
+    # ["таблица(колонки)"] — внешние ключи, с которых не начинается ни один индекс
+    insp = inspect(bind)
+    missing = []
+    for table in sorted(tables):
+        if not insp.has_table(table):
+            continue
+        covered = [ix["column_names"] for ix in insp.get_indexes(table)]
+        covered += [uc["column_names"] for uc in insp.get_unique_constraints(table)]
+        covered.append(insp.get_pk_constraint(table)["constrained_columns"])
+        for fk in insp.get_foreign_keys(table):
+            columns = fk["constrained_columns"]
+            if not any(set(c[:len(columns)]) == set(columns) for c in covered if None not in c):
+                missing.append(f"{table}({', '.join(columns)})")
+    return missing
+
+
+# ---- plans ----
+def seq_scans(plan, tables=WATCHED):
+    # имена таблиц из tables, которые план читает последовательным сканированием
+    found = []
+    nodes = [plan[0]["Plan"] if isinstance(plan, list) else plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in tables:
+            found.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", ()))
+    return sorted(found)
+
+
+class StatementLog:
+    # SQL-выражения с параметрами, выполненные внутри with (кроме вставок)
+    def __init__(self):
+        self.statements = []
+
+    def _hook(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._hook)
+
+
+def explain(conn, statement: str, parameters):
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+class Seed:
+    """Пробанд самой большой семьи, член этой семьи, исследователь — её автор."""
+
+    def __init__(self, db):
+        family_id, _ = db.execute(
+            select(models.Patient.family_id, func.count()).group_by(models.Patient.family_id)
+            .order_by(func.count().desc()).limit(1)
+        ).one()
+        self.family_id = family_id
+        self.proband = family_id
+        self.member = db.execute(
+            select(models.Patient.id).where(models.Patient.family_id == family_id, models.Patient.id != family_id)
+            .limit(1)
+        ).scalar()
+        creator_id = db.get(models.Patient, self.proband).created_by_id
+        self.creator_id = creator_id
+        self.researcher = Principal(creator_id, "plans@example.com", role="researcher")
+
+
+@hot("crud.find_component[family]")
+def _(db, s):
+    crud.find_component(db, s.proband, traversal="family")
+
+
+@hot("crud.find_component[cte]")
+def _(db, s):
+    crud.find_component(db, s.proband, traversal="cte")
+
+
+@hot("crud.load_pedigree[depth=2]")
+def _(db, s):
+    crud.load_pedigree(db, s.proband, view=crud.PedigreeView(depth=2))
+
+
+@hot("crud.load_kinship")
+def _(db, s):
+    crud.load_kinship(db, s.proband)
+
+
+@hot("families.family_edges")
+def _(db, s):
+    families.family_edges(db, s.family_id)
+
+
+@hot("crud.page_patients[researcher]")
+def _(db, s):
+    crud.page_patients(db, s.researcher, sort="family_name", limit=100)
+
+
+@hot("crud.delete_patient")
+def _(db, s):
+    crud.delete_patient(db, s.member)
+
+
+@hot("linkage.candidates")
+def _(db, s):
+    linkage.candidates(db, db.get(models.Patient, s.proband))
+
+
+@hot("crud.list_matches[researcher]")
+def _(db, s):
+    crud.list_matches(db, s.researcher)
+
+
+@hot("cohort.query[researcher]")
+def _(db, s):
+    q = schemas.CohortQuery(family_hyperchol=True, traits=[{"name": "LDLR", "max_onset_age": 40}])
+    cohort.run(db, s.researcher, q)
+
+
+@hot("jobs.claim")
+def _(db, s):
+    jobs.enqueue(db, "export.patients", {"format": "csv"}, s.creator_id)
+    jobs.claim(db, "plans")
+
+
+def check(only=None):
+    # {имя случая: ["таблица: выражение"]} — только случаи с последовательным сканированием
+    with SessionLocal() as db:
+        seed = Seed(db)
+    problems = {}
+    for name, fn in HOT:
+        if only and name not in only:
+            continue
+        # во внешней транзакции: commit внутри crud закрывает только SAVEPOINT, данные откатываются
+        with engine.connect() as conn:
+            outer = conn.begin()
+            db = SessionLocal(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                with StatementLog() as log:
+                    fn(db, seed)
+            finally:
+                db.close()
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for statement, parameters in log.statements:
+                for table in seq_scans(explain(conn, statement, parameters)):
+                    problems.setdefault(name, []).append(f"{table}: {' '.join(statement.split())[:200]}")
+            outer.rollback()
+    return problems
+
+
+def seed_database(patients: int):
+    # синтетические семьи до нужного числа пациентов, затем свежая статистика
+    with SessionLocal() as db:
+        have = db.execute(select(func.count(models.Patient.id))).scalar()
+        if have < patients:
+            user = bench_user(db)
+            synthetic.load(db, synthetic.generate(patients - have, seed=0), user.id)
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Планы горячих запросов: Seq Scan вместо индекса — ошибка")
+    parser.add_argument("--seed-patients", type=int, default=5000, help="досоздать синтетических пациентов до")
+    parser.add_argument("--only", nargs="*", help="имена случаев")
+    args = parser.parse_args(argv)
+    if engine.dialect.name != "postgresql":
+        print(f"EXPLAIN-проверка — только для PostgreSQL, а не {engine.dialect.name}", file=sys.stderr)
+        return 2
+    seed_database(args.seed_patients)
+    failures = [f"foreign key without index: {fk}" for fk in unindexed_foreign_keys(engine)]
+    for name, lines in check(args.only).items():
+        failures += [f"{name}: Seq Scan on {line}" for line in lines]
+    for line in failures:
+        print("PLAN " + line, file=sys.stderr)
+    print(f"checked {len(HOT)} hot queries, {len(failures)} problems", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
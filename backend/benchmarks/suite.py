@@ -0,0 +1,382 @@
+# backend/benchmarks/suite.py
+# Бенчмарки горячих путей crud и эндпоинтов на синтетических семьях (backend/synthetic.py).
+# Для каждого случая — медиана / p95 / минимум времени и число SQL-запросов за вызов.
+# Сравнение с сохранённым baseline: регрессия — рост медианы больше чем на --tolerance
+# (и больше чем на NOISE_MS) или любой рост числа запросов. Код выхода 1 при регрессиях.
+#
+#   DATABASE_URL=postgresql://.../pedigree_bench python -m backend.benchmarks.suite --generate 100000
+#   python -m backend.benchmarks.suite --manifest families.json --baseline backend/benchmarks/baseline.json
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from sqlalchemy import event
+
+from .. import auth, cohort, crud, kinship, linkage, models, schemas, synthetic
+from ..cache import pedigree_cache
+from ..database import SessionLocal, engine, async_engine
+
+BENCH_USER = "bench@example.com"
+# разница меньше этого — шум таймера и планировщика, не регрессия
+NOISE_MS = 1.0
+
+CASES = []
+
+
+def case(name: str):
+    def register(fn):
+        CASES.append((name, fn))
+        return fn
+    return register
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.engines = (engine, async_engine.sync_engine)
+
+    def _hook(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        for e in self.engines:
+            event.listen(e, "before_cursor_execute", self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        for e in self.engines:
+            event.remove(e, "before_cursor_execute", self._hook)
+
+
+def measure(fn, repeat: int, warmup: int = 1):
+    for _ in range(warmup):
+        fn()
+    times, queries = [], []
+    for _ in range(repeat):
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count)
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "min_ms": round(times[0], 3),
+        "queries": int(statistics.median(queries)),
+        "runs": repeat,
+    }
+
+
+class Context:
+    """Общие данные случаев: сессия, пользователь, пробанды разных размеров, HTTP-клиент."""
+
+    def __init__(self, manifest, user: auth.Principal):
+        families = sorted(manifest["families"], key=lambda f: f["size"])
+        self.largest = families[-1]["proband"]
+        self.median = families[len(families) // 2]["proband"]
+        self.user = user
+        self.db = SessionLocal()
+        self.surname = self.db.get(models.Patient, self.largest).family_name
+        self._client = None
+        self.token = auth.create_access_token({"sub": user.email, "role": user.role, "uid": user.id})
+
+    @property
+    def client(self):
+        if self._client is None:
+            from fastapi.testclient import TestClient
+            from ..main import app
+
+            self._client = TestClient(app)
+        return self._client
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def close(self):
+        self.db.close()
+
+
+# ---- crud ----
+@case("crud.build_pedigree[largest]")
+def _(ctx):
+    return lambda: crud.build_pedigree(ctx.db, ctx.largest)
+
+
+@case("crud.build_pedigree[median]")
+def _(ctx):
+    return lambda: crud.build_pedigree(ctx.db, ctx.median)
+
+
+@case("crud.build_pedigree[depth=2]")
+def _(ctx):
+    view = crud.PedigreeView(depth=2)
+    return lambda: crud.build_pedigree(ctx.db, ctx.largest, view=view)
+
+
+@case("crud.find_component[family]")
+def _(ctx):
+    return lambda: crud.find_component(ctx.db, ctx.largest, traversal="family")
+
+
+@case("crud.find_component[cte]")
+def _(ctx):
+    return lambda: crud.find_component(ctx.db, ctx.largest, traversal="cte")
+
+
+@case("crud.find_component[bfs]")
+def _(ctx):
+    return lambda: crud.find_component(ctx.db, ctx.largest, traversal="bfs")
+
+
+@case("kinship.family_kinship[largest]")
+def _(ctx):
+    def run():
+        component, relations, links = crud.load_kinship(ctx.db, ctx.largest)
+        kinship.family_kinship(ctx.largest, component, relations, links)
+    return run
+
+
+@case("layout.genogram_layout[largest]")
+def _(ctx):
+    from ..layout import genogram_layout
+
+    payload = crud.build_pedigree(ctx.db, ctx.largest)
+    return lambda: genogram_layout(payload)
+
+
+# ---- serialization ----
+# доля сериализации в ответе /pedigree: прежний путь FastAPI (валидация по response_model,
+# dump в python, json.dumps) против orjson по готовому dict; попадание в кэш отдаёт готовые байты
+@case("serialize.pedigree[pydantic+json]")
+def _(ctx):
+    from pydantic import TypeAdapter
+    from .. import schemas
+
+    payload = crud.build_pedigree(ctx.db, ctx.largest)
+    adapter = TypeAdapter(schemas.PedigreeOut)
+
+    def run():
+        content = adapter.dump_python(adapter.validate_python(payload), mode="json")
+        json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return run
+
+
+@case("serialize.pedigree[orjson]")
+def _(ctx):
+    from ..responses import dumps
+
+    payload = crud.build_pedigree(ctx.db, ctx.largest)
+    return lambda: dumps(payload)
+
+
+@case("serialize.pedigree[columns+msgpack]")
+def _(ctx):
+    from ..responses import MSGPACK, encode
+
+    data = crud.load_pedigree(ctx.db, ctx.largest)
+    # сборка колонок из графа + MessagePack против assemble_pedigree + orjson выше
+    return lambda: encode(crud.assemble_columns(ctx.largest, *data), MSGPACK)
+
+
+@case("crud.page_patients[first]")
+def _(ctx):
+    return lambda: crud.page_patients(ctx.db, ctx.user, limit=100)
+
+
+@case("crud.page_patients[deep]")
+def _(ctx):
+    cursor = crud.encode_cursor("family_name", ctx.surname, ctx.largest)
+    return lambda: crud.page_patients(ctx.db, ctx.user, sort="family_name", cursor=cursor, limit=100)
+
+
+@case("crud.search_patients_page[surname]")
+def _(ctx):
+    return lambda: crud.search_patients_page(ctx.db, ctx.user, ctx.surname, limit=100)
+
+
+@case("crud.count_patients[exact]")
+def _(ctx):
+    return lambda: crud.count_patients(ctx.db, ctx.user)
+
+
+@case("crud.create_patient")
+def _(ctx):
+    def run():
+        # во внешней транзакции: commit внутри crud закрывает только SAVEPOINT, данные откатываются
+        with engine.connect() as conn:
+            outer = conn.begin()
+            db = SessionLocal(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                crud.create_patient(db, schemas.PatientCreate(given_name="Bench", family_name="Бенчмарков"), ctx.user.id)
+            finally:
+                db.close()
+                outer.rollback()
+    return run
+
+
+@case("linkage.scan[registry]")
+def _(ctx):
+    def run():
+        # пакетный поиск дублей по всему регистру; найденные пары откатываются, как в crud.create_patient
+        with engine.connect() as conn:
+            outer = conn.begin()
+            db = SessionLocal(bind=conn, join_transaction_mode="create_savepoint")
+            try:
+                linkage.scan(db)
+            finally:
+                db.close()
+                outer.rollback()
+    return run
+
+
+# ---- cohorts ----
+@case("cohort.query[registry]")
+def _(ctx):
+    # без фильтров: фасеты по всему регистру
+    q = schemas.CohortQuery()
+    return lambda: cohort.run(ctx.db, ctx.user, q)
+
+
+@case("cohort.query[fh+LDLR<40]")
+def _(ctx):
+    q = schemas.CohortQuery(family_hyperchol=True, traits=[{"name": "LDLR", "max_onset_age": 40}])
+    return lambda: cohort.run(ctx.db, ctx.user, q)
+
+
+@case("cohort.query[proband generations]")
+def _(ctx):
+    q = schemas.CohortQuery(proband_id=ctx.largest, generations=[0, 1])
+    return lambda: cohort.run(ctx.db, ctx.user, q)
+
+
+# ---- endpoints ----
+@case("api.GET /pedigree/{id}[cold]")
+def _(ctx):
+    def run():
+        pedigree_cache.invalidate(ctx.largest)
+        assert ctx.client.get(f"/pedigree/{ctx.largest}", headers=ctx.headers).status_code == 200
+    return run
+
+
+@case("api.GET /pedigree/{id}[cached]")
+def _(ctx):
+    return lambda: ctx.client.get(f"/pedigree/{ctx.largest}", headers=ctx.headers)
+
+
+@case("api.GET /patients[limit=100]")
+def _(ctx):
+    return lambda: ctx.client.get("/patients", params={"limit": 100}, headers=ctx.headers)
+
+
+@case("api.GET /patients[search]")
+def _(ctx):
+    return lambda: ctx.client.get("/patients", params={"search": ctx.surname, "limit": 100}, headers=ctx.headers)
+
+
+# ---- baseline ----
+def compare(results, baseline, tolerance: float):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        limit = base["median_ms"] * (1 + tolerance)
+        if current["median_ms"] > limit and current["median_ms"] - base["median_ms"] > NOISE_MS:
+            regressions.append(f"{name}: median {current['median_ms']:.2f} ms > {base['median_ms']:.2f} ms")
+        if current["queries"] > base["queries"]:
+            regressions.append(f"{name}: queries {current['queries']} > {base['queries']}")
+    return regressions
+
+
+def environment(manifest):
+    return {
+        "dialect": engine.dialect.name,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "patients": sum(f["size"] for f in manifest["families"]),
+        "families": len(manifest["families"]),
+        "seed": manifest.get("seed"),
+    }
+
+
+def bench_user(db):
+    user = crud.get_user_by_email(db, BENCH_USER)
+    if user is None:
+        user = models.User(email=BENCH_USER, hashed_password=auth.get_password_hash(os.urandom(8).hex()),
+                           full_name="Benchmark", role="admin")
+        db.add(user)
+        db.commit()
+    return auth.Principal.from_user(user)
+
+
+def run(manifest, user, repeat: int, only=None):
+    ctx = Context(manifest, user)
+    results = {}
+    try:
+        for name, factory in CASES:
+            if only and not fnmatch.fnmatch(name, only):
+                continue
+            results[name] = measure(factory(ctx), repeat)
+            print(f"{name:40s} {results[name]['median_ms']:10.2f} ms {results[name]['queries']:6d} q", file=sys.stderr)
+    finally:
+        ctx.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки crud и API на синтетических семьях")
+    parser.add_argument("--manifest", help="манифест семей из python -m backend.synthetic")
+    parser.add_argument("--generate", type=int, help="сначала создать столько синтетических пациентов")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="шаблон имён случаев, например 'crud.*'")
+    parser.add_argument("--baseline", help="сравнить с baseline и вернуть 1 при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост медианы (доля)")
+    parser.add_argument("--save-baseline", help="записать результаты как новый baseline")
+    args = parser.parse_args(argv)
+    if not args.manifest and not args.generate:
+        parser.error("нужен --manifest или --generate")
+
+    db = SessionLocal()
+    try:
+        user = bench_user(db)
+        if args.generate:
+            families = synthetic.generate(args.generate, seed=args.seed)
+            manifest = {"seed": args.seed, "families": synthetic.load(db, families, user.id)}
+            if args.manifest:
+                with open(args.manifest, "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+        else:
+            with open(args.manifest, encoding="utf-8") as f:
+                manifest = json.load(f)
+    finally:
+        db.close()
+
+    results = run(manifest, user, args.repeat, args.only)
+    report = {"environment": environment(manifest), "results": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("dialect") != engine.dialect.name:
+            print("baseline снят на другой СУБД — сравнение времени не показательно", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,493 @@
+# backend/bulk_import.py
+# Потоковый импорт когорт: пациенты, трейты, связи (CSV / NDJSON) и файлы LINKAGE .ped.
+# Память постоянна: файл читается построчно, в памяти держится только текущая пачка.
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from . import families, models, schemas
+from .cache import pedigree_cache
+from .search import search_columns
+
+BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# в отчёт попадают первые N ошибок, остальные только считаются
+MAX_REPORTED_ERRORS = 1000
+
+KINDS = ("patients", "traits", "relations", "links", "ped")
+
+_TRUE = {"1", "true", "t", "yes", "y", "да", "д", "+"}
+_FALSE = {"0", "false", "f", "no", "n", "нет", "н", "-"}
+_RU_DATE = re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})$")
+
+BOOL_FIELDS = {"family_hyperchol", "smoking", "hypertension", "diabetes"}
+
+
+class ImportReport:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.processed = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def snapshot(self):
+        return self.inserted, self.error_count, len(self.errors)
+
+    def restore(self, state):
+        # откат счётчиков неудавшейся пачки перед построчным повтором
+        self.inserted, self.error_count, n = state
+        del self.errors[n:]
+
+    def error(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+# ---- readers ----
+def detect_format(filename: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt.lower()
+    name = (filename or "").lower()
+    if name.endswith(".ped"):
+        return "ped"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream, fmt: str):
+    # (номер строки, dict) без загрузки файла целиком
+    if fmt == "ndjson":
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError("ожидался JSON-объект")
+    else:
+        header = stream.readline()
+        # выгрузки из русского Excel разделены точкой с запятой
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        fieldnames = [h.strip() for h in next(csv.reader([header], delimiter=delimiter), [])]
+        reader = csv.DictReader(stream, fieldnames=fieldnames, delimiter=delimiter)
+        for row in reader:
+            yield reader.line_num + 1, {k: v for k, v in row.items() if k}
+
+
+def read_ped(stream):
+    # LINKAGE: family individual father mother sex phenotype [генотипы...]
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        cols = line.split()
+        if len(cols) < 6:
+            yield line_no, ValueError("в строке .ped меньше 6 колонок")
+            continue
+        yield line_no, cols[:6]
+
+
+def open_text(binary):
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+
+# ---- value coercion ----
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _coerce_patient(row: dict) -> dict:
+    data = {}
+    for key, value in row.items():
+        value = _clean(value)
+        if key in BOOL_FIELDS and isinstance(value, str):
+            low = value.lower()
+            value = True if low in _TRUE else False if low in _FALSE else value
+        elif key in ("dob", "baseline_visit_date") and isinstance(value, str):
+            m = _RU_DATE.match(value)
+            if m:
+                value = f"{m.group(3)}-{int(m.group(2)):02d}-{int(m.group(1)):02d}"
+        data[key] = value
+    return data
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+# ---- reference resolution ----
+def resolve_refs(db: Session, source: str, refs):
+    # refs: набор ("id", int) / ("key", str); ключ — external_id этого source или СНИЛС
+    ids = {v for t, v in refs if t == "id"}
+    keys = {v for t, v in refs if t == "key"}
+    resolved = {}
+    if ids:
+        for pid in db.execute(select(models.Patient.id).where(models.Patient.id.in_(ids))).scalars():
+            resolved[("id", pid)] = pid
+    if keys:
+        for ext, pid in db.execute(
+            select(models.ImportKey.external_id, models.ImportKey.patient_id)
+            .where(models.ImportKey.source == source, models.ImportKey.external_id.in_(keys))
+        ):
+            resolved[("key", ext)] = pid
+        missing = [k for k in keys if ("key", k) not in resolved]
+        if missing:
+            for snils, pid in db.execute(
+                select(models.Patient.snils, models.Patient.id).where(models.Patient.snils.in_(missing))
+            ):
+                resolved[("key", snils)] = pid
+    return resolved
+
+
+def _ref(row: dict, role: str):
+    # {role}_id — id в БД, {role} — external_id из импорта или СНИЛС
+    raw_id = _clean(row.get(f"{role}_id"))
+    if raw_id is not None:
+        try:
+            return ("id", int(raw_id))
+        except (TypeError, ValueError):
+            raise ValueError(f"{role}_id должен быть числом")
+    key = _clean(row.get(role))
+    if key is None:
+        raise ValueError(f"не указан {role} / {role}_id")
+    return ("key", str(key))
+
+
+# ---- writers ----
+def copy_rows(db: Session, model, rows):
+    # PostgreSQL + psycopg2: COPY FROM STDIN, иначе executemany
+    if not rows:
+        return
+    conn = db.connection()
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        columns = list(rows[0])
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for r in rows:
+            writer.writerow(["\\N" if r[c] is None else r[c] for c in columns])
+        buf.seek(0)
+        statement = f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buf)
+        except conn.dialect.dbapi.Error as e:
+            # сырой курсор psycopg2 бросает psycopg2.errors.*; оборачиваем как SQLAlchemy
+            # (IntegrityError / DataError), чтобы _flush перешёл к построчной записи
+            raise DBAPIError.instance(statement, None, e, conn.dialect.dbapi.Error) from e
+        finally:
+            cursor.close()
+    else:
+        db.execute(insert(model), rows)
+
+
+def _insert_patients(db: Session, batch, source: str, creator_id: int, report: ImportReport):
+    # batch: [(line, PatientCreate, external_id)] -> {external_id: id} вставленных
+    snils = [p.snils for _, p, _ in batch if p.snils]
+    taken = set()
+    if snils:
+        taken = set(db.execute(select(models.Patient.snils).where(models.Patient.snils.in_(snils))).scalars())
+    externals = [ext for _, _, ext in batch if ext]
+    known = set()
+    if externals:
+        known = set(db.execute(
+            select(models.ImportKey.external_id)
+            .where(models.ImportKey.source == source, models.ImportKey.external_id.in_(externals))
+        ).scalars())
+
+    rows = []
+    for line, patient, ext in batch:
+        if patient.snils and patient.snils in taken:
+            report.error(line, f"пациент со СНИЛС {patient.snils} уже существует")
+            continue
+        if ext and ext in known:
+            report.error(line, f"external_id {ext} уже импортирован в источник {source}")
+            continue
+        if patient.snils:
+            taken.add(patient.snils)
+        if ext:
+            known.add(ext)
+        rows.append((line, patient, ext))
+    if not rows:
+        return {}
+
+    values = []
+    for _, p, _ in rows:
+        data = p.model_dump(exclude={"traits"})
+        values.append({**data, **search_columns(data), "created_by_id": creator_id})
+    ids = db.execute(
+        insert(models.Patient).returning(models.Patient.id, sort_by_parameter_order=True),
+        values,
+    ).scalars().all()
+    families.assign_new(db, ids)
+
+    keys, traits = [], []
+    for (line, patient, ext), pid in zip(rows, ids):
+        if ext:
+            keys.append({"source": source, "external_id": ext, "patient_id": pid})
+        for t in patient.traits or []:
+            traits.append({"patient_id": pid, **t.model_dump()})
+    copy_rows(db, models.ImportKey, keys)
+    copy_rows(db, models.Trait, traits)
+    report.inserted += len(ids)
+    return {ext: pid for (_, _, ext), pid in zip(rows, ids) if ext}
+
+
+def _flush(db: Session, write, batch, report: ImportReport):
+    # пачка пишется одной транзакцией; при конфликте — построчно через SAVEPOINT.
+    # write возвращает id пациентов, чьи семьи надо сбросить в кэше после коммита
+    if not batch:
+        return
+    state = report.snapshot()
+    try:
+        touched = write(batch)
+        db.commit()
+    except (IntegrityError, DataError):
+        db.rollback()
+        report.restore(state)
+        touched = set()
+        for item in batch:
+            try:
+                with db.begin_nested():
+                    touched |= write([item]) or set()
+            except IntegrityError as e:
+                report.error(item[0], f"нарушение ограничения БД: {e.orig}")
+            except DataError as e:
+                # например, link_type длиннее VARCHAR(50)
+                report.error(item[0], f"недопустимое значение: {e.orig}")
+        db.commit()
+    if touched:
+        pedigree_cache.invalidate(*touched)
+
+
+def import_patients(db: Session, rows, source: str, creator_id: int, report: ImportReport):
+    batch = []
+
+    def write(items):
+        _insert_patients(db, items, source, creator_id, report)
+
+    for line, row in rows:
+        report.processed += 1
+        if isinstance(row, Exception):
+            report.error(line, str(row))
+            continue
+        ext = _clean(row.pop("external_id", None))
+        try:
+            patient = schemas.PatientCreate(**_coerce_patient(row))
+        except ValidationError as e:
+            report.error(line, _validation_message(e))
+            continue
+        batch.append((line, patient, str(ext) if ext is not None else None))
+        if len(batch) >= BATCH_SIZE:
+            _flush(db, write, batch, report)
+            batch = []
+    _flush(db, write, batch, report)
+
+
+def _import_edges(db: Session, rows, source: str, report: ImportReport, roles, build, pedigree=True):
+    # общий путь для traits / relations / links: разрешить ссылки пачкой и вставить
+    batch = []
+
+    def write(items):
+        refs = {ref for _, row_refs, _ in items for ref in row_refs}
+        resolved = resolve_refs(db, source, refs)
+        out, touched = {}, set()
+        for line, row_refs, row in items:
+            missing = [v for t, v in row_refs if (t, v) not in resolved]
+            if missing:
+                report.error(line, f"не найдены пациенты: {', '.join(map(str, missing))}")
+                continue
+            pids = [resolved[r] for r in row_refs]
+            try:
+                model, values = build(row, pids)
+            except (ValueError, ValidationError) as e:
+                report.error(line, _validation_message(e) if isinstance(e, ValidationError) else str(e))
+                continue
+            out.setdefault(model, []).append(values)
+            touched.update(pids)
+        for model, values in out.items():
+            copy_rows(db, model, values)
+            report.inserted += len(values)
+        pairs = [(v["parent_id"], v["child_id"]) for v in out.get(models.Relation, ())]
+        pairs += [(v["patient1_id"], v["patient2_id"]) for v in out.get(models.PatientLink, ())]
+        families.union(db, pairs)
+        return touched if pedigree else set()
+
+    for line, row in rows:
+        report.processed += 1
+        if isinstance(row, Exception):
+            report.error(line, str(row))
+            continue
+        try:
+            row_refs = tuple(_ref(row, role) for role in roles)
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        batch.append((line, row_refs, row))
+        if len(batch) >= BATCH_SIZE:
+            _flush(db, write, batch, report)
+            batch = []
+    _flush(db, write, batch, report)
+
+
+def _build_trait(row, pids):
+    t = schemas.TraitCreate(**{k: _clean(row.get(k)) for k in ("name", "onset_age", "details")})
+    return models.Trait, {"patient_id": pids[0], **t.model_dump()}
+
+
+def _build_relation(row, pids):
+    if pids[0] == pids[1]:
+        raise ValueError("родитель и ребёнок совпадают")
+    return models.Relation, {
+        "parent_id": pids[0],
+        "child_id": pids[1],
+        "relationship_type": _clean(row.get("relationship_type")) or "parent",
+    }
+
+
+def _build_link(row, pids):
+    link_type = _clean(row.get("link_type"))
+    if not link_type:
+        raise ValueError("не указан link_type")
+    if pids[0] == pids[1]:
+        raise ValueError("связь пациента с самим собой")
+    return models.PatientLink, {"patient1_id": pids[0], "patient2_id": pids[1], "link_type": link_type}
+
+
+def _ped_key(family: str, individual: str):
+    # в .ped id уникальны только внутри семьи; 0 — родитель неизвестен
+    if individual in ("0", "-", "."):
+        return None
+    return f"{family}:{individual}"
+
+
+def import_ped(db: Session, rows, source: str, creator_id: int, report: ImportReport):
+    # семьи идут блоками: копим блоки до BATCH_SIZE строк, пишем пациентов, затем связи
+    pending = []
+
+    def write(items):
+        people = [(line, p, ext) for line, p, ext, _, _ in items]
+        inserted = _insert_patients(db, people, source, creator_id, report)
+        refs = set()
+        for _, _, ext, father, mother in items:
+            refs.update(("key", k) for k in (father, mother) if k)
+        resolved = resolve_refs(db, source, refs)
+        relations, links, spouses, touched = [], [], set(), set()
+        for line, _, ext, father, mother in items:
+            # связи создаём только для вставленных сейчас — повторный импорт их не дублирует
+            child = inserted.get(ext)
+            if child is None:
+                continue
+            for parent in (father, mother):
+                if not parent:
+                    continue
+                pid = resolved.get(("key", parent))
+                if pid is None:
+                    report.error(line, f"родитель {parent} не найден")
+                    continue
+                relations.append({"parent_id": pid, "child_id": child, "relationship_type": "parent"})
+                touched.update((pid, child))
+            f, m = resolved.get(("key", father)), resolved.get(("key", mother))
+            if f and m and (f, m) not in spouses:
+                spouses.add((f, m))
+                links.append({"patient1_id": f, "patient2_id": m, "link_type": "spouse"})
+        copy_rows(db, models.Relation, relations)
+        copy_rows(db, models.PatientLink, links)
+        families.union(db, [(r["parent_id"], r["child_id"]) for r in relations])
+        return touched
+
+    current_family = None
+    for line, cols in rows:
+        report.processed += 1
+        if isinstance(cols, Exception):
+            report.error(line, str(cols))
+            continue
+        family, individual, father, mother, sex, phenotype = cols
+        if family != current_family and len(pending) >= BATCH_SIZE:
+            _flush(db, write, pending, report)
+            pending = []
+        current_family = family
+        patient = schemas.PatientCreate(
+            given_name=individual,
+            sex={"1": "male", "2": "female"}.get(sex),
+            family_hyperchol=phenotype == "2",
+        )
+        pending.append((line, patient, _ped_key(family, individual), _ped_key(family, father), _ped_key(family, mother)))
+    _flush(db, write, pending, report)
+
+
+def run_import(db: Session, kind: str, stream, fmt: str, source: str, creator_id: int) -> dict:
+    report = ImportReport(kind)
+    if kind == "ped":
+        import_ped(db, read_ped(stream), source, creator_id, report)
+        return report.as_dict()
+    rows = read_rows(stream, fmt)
+    if kind == "patients":
+        import_patients(db, rows, source, creator_id, report)
+    elif kind == "traits":
+        _import_edges(db, rows, source, report, ("patient",), _build_trait, pedigree=False)
+    elif kind == "relations":
+        _import_edges(db, rows, source, report, ("parent", "child"), _build_relation)
+    elif kind == "links":
+        _import_edges(db, rows, source, report, ("patient1", "patient2"), _build_link)
+    else:
+        raise ValueError(f"неизвестный тип импорта: {kind}")
+    return report.as_dict()
+
+
+# ---- CLI ----
+# python -m backend.bulk_import patients cohort.csv --source site-1 --creator admin@example.com
+def main(argv=None):
+    from .database import SessionLocal
+    from .crud import get_user_by_email
+
+    parser = argparse.ArgumentParser(description="Потоковый импорт когорт в Pedigree")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "ndjson"))
+    parser.add_argument("--source", default="default", help="пространство external_id (сайт / когорта)")
+    parser.add_argument("--creator", required=True, help="email пользователя-владельца записей")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, args.creator)
+        if not user:
+            parser.error(f"пользователь {args.creator} не найден")
+        fmt = "ped" if args.kind == "ped" else detect_format(args.path, args.format)
+        with open(args.path, "rb") as f:
+            report = run_import(db, args.kind, open_text(f), fmt, args.source, user.id)
+    finally:
+        db.close()
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if report["error_count"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
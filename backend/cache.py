@@ -0,0 +1,240 @@
+# backend/cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .responses import JSON, decode, encode
+
+try:
+    import redis
+except ImportError:  # общий бэкенд нужен только при нескольких воркерах
+    redis = None
+
+
+# ---- backends ----
+# Бэкенд хранит три вида данных:
+#   entries  — готовые ответы по ключу (пробанд + вариант)
+#   members  — пациент -> ключи семей (компонент связности), в которые он попал при построении
+#   versions — счётчик версии семьи и глобальная эпоха инвалидаций
+
+class LRUBackend:
+    """Ограниченный по размеру кэш внутри процесса."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (family, value)
+        self._family_entries = {}      # family -> set(key)
+        self._family_members = {}      # family -> set(patient_id)
+        self._members = {}             # patient_id -> set(family)
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def epoch(self):
+        return self._epoch
+
+    def version(self, family):
+        return self._versions.get(family, 0)
+
+    def families_of(self, patient_id):
+        return set(self._members.get(patient_id, ()))
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, family, members):
+        with self._lock:
+            if key in self._entries:
+                old_family, _ = self._entries.pop(key)
+                self._forget(key, old_family)
+            self._entries[key] = (family, value)
+            self._family_entries.setdefault(family, set()).add(key)
+            own = self._family_members.setdefault(family, set())
+            for pid in members:
+                self._members.setdefault(pid, set()).add(family)
+                own.add(pid)
+            while len(self._entries) > self.maxsize:
+                old_key, (old_family, _) = self._entries.popitem(last=False)
+                self._forget(old_key, old_family)
+
+    def touch(self):
+        with self._lock:
+            self._epoch += 1
+
+    def bump(self, family):
+        with self._lock:
+            version = self._versions[family] = self._versions.get(family, 0) + 1
+            # в процессе можно сразу освободить память устаревшей семьи
+            for key in list(self._family_entries.get(family, ())):
+                self._entries.pop(key, None)
+                self._forget(key, family)
+            return version
+
+    def size(self):
+        return len(self._entries)
+
+    def _forget(self, key, family):
+        keys = self._family_entries.get(family)
+        if keys is None:
+            return
+        keys.discard(key)
+        if keys:
+            return
+        # последняя запись семьи ушла — membership больше не нужен
+        del self._family_entries[family]
+        for pid in self._family_members.pop(family, ()):
+            families = self._members.get(pid)
+            if families is not None:
+                families.discard(family)
+                if not families:
+                    del self._members[pid]
+        self._versions.pop(family, None)
+
+
+class RedisBackend:
+    """Общий кэш для нескольких воркеров uvicorn (PEDIGREE_CACHE_URL=redis://...)."""
+
+    def __init__(self, url: str, ttl: int = 3600, prefix: str = "pedigree:"):
+        if redis is None:
+            raise RuntimeError("PEDIGREE_CACHE_URL задан, но пакет redis не установлен")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _k(self, *parts):
+        return self.prefix + ":".join(str(p) for p in parts)
+
+    def epoch(self):
+        return int(self.client.get(self._k("epoch")) or 0)
+
+    def version(self, family):
+        return int(self.client.get(self._k("version", family)) or 0)
+
+    def families_of(self, patient_id):
+        return {int(f) for f in self.client.smembers(self._k("member", patient_id))}
+
+    def get(self, key):
+        # запись: JSON метаданных, перевод строки, готовое тело ответа; payload восстанавливается из тела
+        raw = self.client.get(self._k("entry", key))
+        if raw is None:
+            return None
+        meta, body = raw.split(b"\n", 1)
+        meta = json.loads(meta)
+        return {**meta, "body": body, "payload": decode(body, meta.get("media_type", JSON))}
+
+    def set(self, key, value, family, members):
+        meta = {k: v for k, v in value.items() if k not in ("body", "payload")}
+        pipe = self.client.pipeline()
+        pipe.set(self._k("entry", key), json.dumps(meta).encode("utf-8") + b"\n" + value["body"], ex=self.ttl)
+        for pid in members:
+            pipe.sadd(self._k("member", pid), family)
+            pipe.expire(self._k("member", pid), self.ttl)
+        pipe.execute()
+
+    def touch(self):
+        self.client.incr(self._k("epoch"))
+
+    def bump(self, family):
+        return self.client.incr(self._k("version", family))
+
+    def size(self):
+        return None
+
+
+# ---- pedigree cache ----
+def make_etag(body: bytes) -> str:
+    # по готовому телу ответа: payload строится детерминированно, одинаковые данные — одинаковые байты
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match or not etag:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class PedigreeCache:
+    """Кэш ответов /pedigree по семье (компоненте связности) с версией семьи."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def begin(self):
+        # эпоха до построения: если за время построения была инвалидация, результат не кэшируем
+        return self.backend.epoch()
+
+    def get(self, patient_id: int, variant: str = ""):
+        entry = self.backend.get(f"{patient_id}{variant}")
+        if entry is not None and self.backend.version(entry["family"]) == entry["version"]:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, patient_id: int, payload, token=None, variant: str = "", members=None, media_type: str = JSON):
+        if members is None:
+            members = [n["id"] for n in payload.get("nodes", [])]
+        members = list(members) or [patient_id]
+        family = min(members)
+        # тело ответа сериализуется один раз здесь, попадания в кэш отдают готовые байты
+        body = encode(payload, media_type)
+        entry = {
+            "family": family,
+            "version": self.backend.version(family),
+            "etag": make_etag(body),
+            "media_type": media_type,
+            "payload": payload,
+            "body": body,
+        }
+        if token is None or token == self.backend.epoch():
+            self.backend.set(f"{patient_id}{variant}", entry, family, members)
+            self.stores += 1
+        return entry
+
+    def invalidate(self, *patient_ids):
+        # эпоху двигаем всегда: семья может строиться прямо сейчас и ещё не попасть в members
+        self.backend.touch()
+        families = set()
+        for pid in patient_ids:
+            if pid is not None:
+                families |= self.backend.families_of(pid)
+        for family in families:
+            self.backend.bump(family)
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "size": self.backend.size(),
+        }
+
+
+def make_backend():
+    url = os.getenv("PEDIGREE_CACHE_URL")
+    if url:
+        return RedisBackend(url, ttl=int(os.getenv("PEDIGREE_CACHE_TTL", "3600")))
+    return LRUBackend(maxsize=int(os.getenv("PEDIGREE_CACHE_SIZE", "256")))
+
+
+pedigree_cache = PedigreeCache(make_backend())
@@ -0,0 +1,122 @@
+# backend/cohort.py
+# Когорты: пациенты по факторам риска (булевы колонки patients), диапазонам массы и роста и признакам
+# (traits: имя и возраст начала), при необходимости — только семья пробанда и её поколения.
+# Один ответ API: страница (keyset по id), общее число и фасеты по всей когорте.
+#   страница  — условия + id > cursor по порядку id; частичные индексы по факторам риска
+#               (ix_patients_<фактор> ... WHERE <фактор>) отдают строки уже по порядку id;
+#   признаки  — id IN (patient_id по traits (name, onset_age, patient_id)): покрывающий индекс;
+#   число, факторы риска и пол — одно выражение: GROUP BY sex и count(*) FILTER (WHERE фактор);
+#   фасет признаков — GROUP BY traits.name по пациентам когорты, COHORT_TRAIT_FACETS самых частых;
+#   поколения — граф семьи пробанда в памяти (pedigree.PedigreeGraph), семья берётся по family_id.
+import os
+from collections import Counter
+
+from sqlalchemy import desc, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import families, models
+from .crud import visible_patients
+from .pedigree import PedigreeGraph
+
+COHORT_TRAIT_FACETS = int(os.getenv("COHORT_TRAIT_FACETS", "20"))
+
+P, T = models.Patient, models.Trait
+
+RISK_FACTORS = ("family_hyperchol", "smoking", "hypertension", "diabetes")
+COLUMNS = (P.id, P.family_name, P.given_name, P.middle_name, P.dob, P.sex, P.family_id,
+           *(getattr(P, f) for f in RISK_FACTORS), P.weight, P.height)
+
+
+def _flag(column, value: bool):
+    # «= true», а не «IS true»: PostgreSQL упрощает его до «column» и берёт частичный индекс
+    if value:
+        return column == True  # noqa: E712
+    # NULL у старых строк — «нет»
+    return or_(column == False, column.is_(None))  # noqa: E712
+
+
+def conditions(q) -> list:
+    # q — schemas.CohortQuery; без семьи и поколений
+    where = [_flag(getattr(P, f), getattr(q, f)) for f in RISK_FACTORS if getattr(q, f) is not None]
+    if q.sex is not None:
+        where.append(P.sex == q.sex)
+    for column, low, high in ((P.weight, q.min_weight, q.max_weight), (P.height, q.min_height, q.max_height)):
+        if low is not None:
+            where.append(column >= low)
+        if high is not None:
+            where.append(column <= high)
+    for trait in q.traits:
+        # некоррелированный IN: множество пациентов строится один раз по покрывающему индексу,
+        # а не поиском по индексу для каждой строки patients
+        match = [T.name == trait.name]
+        if trait.min_onset_age is not None:
+            match.append(T.onset_age >= trait.min_onset_age)
+        if trait.max_onset_age is not None:
+            match.append(T.onset_age <= trait.max_onset_age)
+        where.append(P.id.in_(select(T.patient_id).where(*match)))
+    return where
+
+
+# ---- generations ----
+def load_family(db: Session, proband_id: int):
+    # (family_id, рёбра семьи) — концы ребра в одной семье, условие на один конец
+    r, l = models.Relation, models.PatientLink
+    family_id = families.family_of(db, proband_id)
+    relations = db.execute(
+        select(r.parent_id, r.child_id).join(P, P.id == r.parent_id).where(P.family_id == family_id)
+    ).all()
+    links = db.execute(
+        select(l.patient1_id, l.patient2_id, l.link_type).join(P, P.id == l.patient1_id).where(P.family_id == family_id)
+    ).all()
+    return family_id, relations, links
+
+
+def generations(proband_id: int, relations, links) -> dict:
+    # чистый CPU: crud_async выполняет в threadpool
+    return PedigreeGraph.from_edges(relations, links, nodes=[proband_id]).assign_generations(proband_id)
+
+
+# ---- query ----
+def _facets(db: Session, user, where, generation=None):
+    # -> (число пациентов когорты, фасеты)
+    flags = [func.count().filter(getattr(P, f) == True).label(f) for f in RISK_FACTORS]  # noqa: E712
+    rows = db.execute(visible_patients(select(P.sex, func.count().label("n"), *flags), user).where(*where)
+                      .group_by(P.sex)).all()
+    facets = {f: sum(getattr(r, f) for r in rows) for f in RISK_FACTORS}
+    facets["sex"] = {(r.sex or ""): r.n for r in rows}
+    members = visible_patients(select(P.id), user).where(*where)
+    patients = func.count(func.distinct(T.patient_id)).label("n")
+    facets["traits"] = dict(db.execute(
+        select(T.name, patients).where(T.patient_id.in_(members)).group_by(T.name)
+        .order_by(desc("n"), T.name).limit(COHORT_TRAIT_FACETS)
+    ).all())
+    if generation is not None:
+        counts = Counter(generation.get(pid) for pid in db.execute(members).scalars())
+        facets["generation"] = {g: n for g, n in sorted(counts.items()) if g is not None}
+    return sum(r.n for r in rows), facets
+
+
+def query(db: Session, user, q, family_id: int = None, generation: dict = None) -> dict:
+    # family_id / generation — из load_family и generations при q.proband_id
+    where = conditions(q)
+    if family_id is not None:
+        where.append(P.family_id == family_id)
+        if q.generations is not None:
+            wanted = set(q.generations)
+            where.append(P.id.in_([pid for pid, g in generation.items() if g in wanted]))
+    page = visible_patients(select(*COLUMNS), user).where(*where)
+    if q.cursor is not None:
+        page = page.where(P.id > q.cursor)
+    rows = db.execute(page.order_by(P.id).limit(q.limit + 1)).all()
+    next_cursor = str(rows[q.limit - 1].id) if len(rows) > q.limit else None
+    items = [{**row._asdict(), "generation": generation.get(row.id) if generation else None} for row in rows[:q.limit]]
+    total, facets = _facets(db, user, where, generation)
+    return {"total": total, "items": items, "next_cursor": next_cursor, "facets": facets}
+
+
+def run(db: Session, user, q) -> dict:
+    # синхронный путь целиком (скрипты, тесты); видимость пробанда проверяет вызывающий код
+    if q.proband_id is None:
+        return query(db, user, q)
+    family_id, relations, links = load_family(db, q.proband_id)
+    return query(db, user, q, family_id, generations(q.proband_id, relations, links))
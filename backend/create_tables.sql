@@ -31,6 +31,32 @@ CREATE TABLE IF NOT EXISTS patients (
     created_by_id INTEGER REFERENCES users(id) ON DELETE SET NULL
 );
 
+-- Индексы для keyset-пагинации /patients (ключ сортировки + id)
+CREATE INDEX IF NOT EXISTS ix_patients_family_name_id ON patients(family_name, id);
+CREATE INDEX IF NOT EXISTS ix_patients_dob_id ON patients(dob, id);
+CREATE INDEX IF NOT EXISTS ix_patients_created_by_id_id ON patients(created_by_id, id);
+CREATE INDEX IF NOT EXISTS ix_patients_created_by_id_family_name_id ON patients(created_by_id, family_name, id);
+CREATE INDEX IF NOT EXISTS ix_patients_created_by_id_dob_id ON patients(created_by_id, dob, id);
+
+-- Поиск: нормализованные ФИО / СНИЛС (заполняет приложение; для старых строк —
+-- python -m backend.search reindex) и индексы под них
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS search_name TEXT;
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS snils_digits VARCHAR(20);
+CREATE INDEX IF NOT EXISTS ix_patients_search_name_trgm ON patients USING gin (search_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_patients_snils_digits ON patients (snils_digits text_pattern_ops);
+-- блок поиска дублей (backend/linkage.py): фонетическая фамилия + год рождения
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS link_key VARCHAR(255);
+CREATE INDEX IF NOT EXISTS ix_patients_link_key ON patients (link_key);
+-- семья пациента (backend/families.py); для старых строк — python -m backend.families backfill
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS family_id INTEGER;
+CREATE INDEX IF NOT EXISTS ix_patients_family_id ON patients (family_id);
+-- когорты (backend/cohort.py): частичные индексы по факторам риска
+CREATE INDEX IF NOT EXISTS ix_patients_family_hyperchol ON patients (id) WHERE family_hyperchol;
+CREATE INDEX IF NOT EXISTS ix_patients_smoking ON patients (id) WHERE smoking;
+CREATE INDEX IF NOT EXISTS ix_patients_hypertension ON patients (id) WHERE hypertension;
+CREATE INDEX IF NOT EXISTS ix_patients_diabetes ON patients (id) WHERE diabetes;
+
 -- Таблица отношений (родитель-ребенок)
 CREATE TABLE IF NOT EXISTS relations (
     id SERIAL PRIMARY KEY,
@@ -38,6 +64,9 @@ CREATE TABLE IF NOT EXISTS relations (
     child_id INTEGER REFERENCES patients(id) ON DELETE CASCADE,
     relationship_type VARCHAR(50) DEFAULT 'parent'
 );
+-- связь родитель — ребёнок одна; индексы в обе стороны: дети и родители
+CREATE UNIQUE INDEX IF NOT EXISTS uq_relations_parent_child ON relations (parent_id, child_id);
+CREATE INDEX IF NOT EXISTS ix_relations_child_parent ON relations (child_id, parent_id);
 
 -- Горизонтальные(братья/сестры) и супружеские связи
 CREATE TABLE IF NOT EXISTS patient_links (
@@ -47,6 +76,7 @@ CREATE TABLE IF NOT EXISTS patient_links (
     link_type VARCHAR(50) NOT NULL, -- sibling / spouse
     UNIQUE(patient1_id, patient2_id, link_type)
 );
+CREATE INDEX IF NOT EXISTS ix_patient_links_patient2 ON patient_links (patient2_id, patient1_id);
 
 
 -- Таблица черт/трейтов (заболевания, мутации и др.)
@@ -57,3 +87,51 @@ CREATE TABLE IF NOT EXISTS traits (
     onset_age INTEGER,
     details TEXT
 );
+CREATE INDEX IF NOT EXISTS ix_traits_patient_id ON traits (patient_id);
+CREATE INDEX IF NOT EXISTS ix_traits_name_onset_age_patient_id ON traits (name, onset_age, patient_id);
+
+-- Внешние идентификаторы из файлов массового импорта (в пределах источника)
+CREATE TABLE IF NOT EXISTS import_keys (
+    id SERIAL PRIMARY KEY,
+    source VARCHAR(255) NOT NULL,
+    external_id VARCHAR(255) NOT NULL,
+    patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    UNIQUE(source, external_id)
+);
+CREATE INDEX IF NOT EXISTS ix_import_keys_patient_id ON import_keys(patient_id);
+
+-- Возможные дубли пациентов (python -m backend.linkage scan и проверка при создании)
+CREATE TABLE IF NOT EXISTS patient_matches (
+    id SERIAL PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    candidate_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending / dismissed
+    UNIQUE(patient_id, candidate_id)
+);
+CREATE INDEX IF NOT EXISTS ix_patient_matches_candidate_id ON patient_matches(candidate_id);
+CREATE INDEX IF NOT EXISTS ix_patient_matches_pending ON patient_matches (id) WHERE status = 'pending';
+
+-- Фоновые задачи (backend/jobs.py): очередь без внешнего брокера, воркеры забирают с SKIP LOCKED
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    params JSON,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued / running / succeeded / failed / cancelled
+    progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    message TEXT,
+    result JSON,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    worker VARCHAR(255),
+    created_by_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    run_after TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS ix_jobs_created_by_id ON jobs(created_by_id);
@@ -1,33 +1,55 @@
 # backend/crud.py
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from . import models, schemas
-from .auth import get_password_hash, verify_password
-from datetime import datetime
-from sqlalchemy import or_, func
+from .pedigree import PedigreeGraph
+from .layout import genogram_layout
+from .responses import JSON, MSGPACK
+from .cache import pedigree_cache
+from . import search as search_index
+from . import kinship
+from . import families
+from . import linkage
+from . import wire
+from .auth import get_password_hash
+from datetime import datetime, date
+from sqlalchemy import or_, and_, func, select, insert, union_all, literal, cast, tuple_, Integer
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
+import os
+import json
+import base64
+
+def invalidate_pedigrees(db: Session, *patient_ids):
+    # вызывается после commit. Под AsyncSession (crud_async) сброс откладывается:
+    # обращение к Redis не должно выполняться в цикле событий
+    deferred = db.info.get("deferred_invalidations")
+    if deferred is not None:
+        deferred.extend(patient_ids)
+    else:
+        pedigree_cache.invalidate(*patient_ids)
 
 # users
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    hashed = hashed_password or get_password_hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed, full_name=user.full_name, role=user.role)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = get_user_by_email(db, email)
-    if not user:
-        return None
-    if not verify_password(password, user.hashed_password):
-        return None
+def update_password_hash(db: Session, user, hashed_password: str):
+    # пересчёт хэша под текущую стоимость bcrypt без сброса пароля
+    user.hashed_password = hashed_password
+    db.commit()
     return user
 
 # patients
+# проверка на дубли при вставке (иначе — только пакетный python -m backend.linkage scan)
+LINKAGE_ON_INSERT = os.getenv("LINKAGE_ON_INSERT", "true").lower() in ("1", "true", "yes")
+
 def create_patient(db: Session, patient: schemas.PatientCreate, creator_id: int):
     # если указан СНИЛС — проверяем уникальность заранее
     if patient.snils:
@@ -56,6 +78,12 @@ def create_patient(db: Session, patient: schemas.PatientCreate, creator_id: int)
     )
     db.add(db_patient)
     try:
+        db.flush()
+        # новый пациент — отдельная семья (backend/families.py)
+        db_patient.family_id = db_patient.id
+        if LINKAGE_ON_INSERT:
+            # возможные дубли без СНИЛС — в patient_matches (backend/linkage.py)
+            linkage.check_new(db, [db_patient.id])
         db.commit()
         db.refresh(db_patient)
     except IntegrityError:
@@ -72,32 +100,236 @@ def create_patient(db: Session, patient: schemas.PatientCreate, creator_id: int)
     return db_patient
 
 
-def get_patient(db: Session, patient_id: int):
-    return db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-
-def list_patients(db: Session, user, search: str = None, skip: int = 0, limit: int = 100):
+def get_patient(db: Session, patient_id: int, load_relations: bool = False):
     query = db.query(models.Patient)
+    if load_relations:
+        query = query.options(*patient_load_options("detail"))
+    return query.filter(models.Patient.id == patient_id).first()
+
+
+# ---- projections ----
+# поля, которые можно запросить через fields=, и связи для include=
+PATIENT_FIELDS = ["id", *schemas.PatientBase.model_fields, "created_by_id", "family_id"]
+PATIENT_RELATIONS = ("traits", "relations_as_parent", "relations_as_child")
+PATIENT_INCLUDES = {
+    "traits": ("traits",),
+    "relations": ("relations_as_parent", "relations_as_child"),
+    "relations_as_parent": ("relations_as_parent",),
+    "relations_as_child": ("relations_as_child",),
+}
+
+def parse_fields(fields: str = None):
+    if not fields:
+        return list(PATIENT_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in PATIENT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(["id", *names]))
+
+def parse_include(include: str = None):
+    if not include:
+        return ()
+    result = []
+    for name in (i.strip() for i in include.split(",")):
+        if not name:
+            continue
+        if name not in PATIENT_INCLUDES:
+            raise HTTPException(status_code=400, detail=f"Unknown include: {name}")
+        result.extend(PATIENT_INCLUDES[name])
+    return tuple(dict.fromkeys(result))
+
+def patient_load_options(route: str):
+    # все связи — коллекции, поэтому selectinload и для списка, и для карточки: один запрос на связь.
+    # joinedload трёх коллекций сразу дал бы декартово произведение traits × родители × дети
+    return [selectinload(getattr(models.Patient, rel)) for rel in PATIENT_RELATIONS]
 
-    # если не админ — фильтруем по created_by_id
+def _project(query, columns, extra=()):
+    # columns=None — полные ORM-объекты со связями; иначе только колонки, без ORM-объектов
+    if columns is None:
+        return query.options(*patient_load_options("list"))
+    names = dict.fromkeys(["id", *columns, *extra])
+    return query.with_entities(*[getattr(models.Patient, n) for n in names])
+
+def patient_rows(db: Session, rows, columns, include=()):
+    # строки-проекции -> dict; связи догружаются пачкой по id страницы
+    out = [{c: row._mapping[c] for c in columns} for row in rows]
+    if not out or not include:
+        return out
+    by_id = {r["id"]: r for r in out}
+    ids = list(by_id)
+    for rel in include:
+        for r in out:
+            r[rel] = []
+    if "traits" in include:
+        t = models.Trait
+        for row in db.execute(
+            select(t.id, t.patient_id, t.name, t.onset_age, t.details).where(t.patient_id.in_(ids)).order_by(t.id)
+        ):
+            by_id[row.patient_id]["traits"].append(dict(row._mapping))
+    r = models.Relation
+    if "relations_as_parent" in include:
+        for row in db.execute(
+            select(r.parent_id, r.child_id, r.relationship_type).where(r.parent_id.in_(ids)).order_by(r.id)
+        ):
+            by_id[row.parent_id]["relations_as_parent"].append(
+                {"child_id": row.child_id, "relationship_type": row.relationship_type}
+            )
+    if "relations_as_child" in include:
+        for row in db.execute(
+            select(r.parent_id, r.child_id, r.relationship_type).where(r.child_id.in_(ids)).order_by(r.id)
+        ):
+            by_id[row.child_id]["relations_as_child"].append(
+                {"parent_id": row.parent_id, "relationship_type": row.relationship_type}
+            )
+    return out
+
+def get_patient_row(db: Session, patient_id: int, columns, include=()):
+    query = _project(db.query(models.Patient), columns).filter(models.Patient.id == patient_id)
+    rows = patient_rows(db, query.all(), columns, include)
+    return rows[0] if rows else None
+
+def visible_patients(query, user, patient=models.Patient):
+    # если не админ — видны только созданные пользователем пациенты
     if user.role != "admin":
-        query = query.filter(models.Patient.created_by_id == user.id)
+        query = query.filter(patient.created_by_id == user.id)
+    return query
+
+def is_patient_visible(db: Session, patient_id: int, user) -> bool:
+    query = visible_patients(db.query(models.Patient.id), user).filter(models.Patient.id == patient_id)
+    return query.first() is not None
 
-    # поиск по ФИО и СНИЛС
+def _patients_query(db: Session, user, search: str = None):
+    query = visible_patients(db.query(models.Patient), user)
+
+    # поиск по ФИО и СНИЛС (нормализованные колонки + индексы, см. search.py)
     if search:
-        like_pattern = f"%{search}%"
-        query = query.filter(
-            or_(
-                func.concat(
-                    models.Patient.family_name, ' ',
-                    models.Patient.given_name, ' ',
-                    func.coalesce(models.Patient.middle_name, '')
-                ).ilike(like_pattern),
-                models.Patient.snils.ilike(like_pattern)
-            )
-        )
+        query = search_index.match_filter(query, search, db.get_bind().dialect.name)
 
+    return query
+
+def list_patients(db: Session, user, search: str = None, skip: int = 0, limit: int = 100, columns=None):
+    if search and not search_index.ranks_in_sql(db):
+        return rank_search_offset(search_matches(db, user, search, columns), search, skip, limit)
+    query = _project(_patients_query(db, user, search), columns, extra=("search_name", "snils_digits") if search else ())
+    if search:
+        # результаты поиска упорядочены по релевантности
+        return search_index.ranked(db, query, search, skip=skip, limit=limit)
     return query.order_by(models.Patient.id).offset(skip).limit(limit).all()
 
+# без pg_trgm совпадения выбираются из БД, а ранжируются в процессе (crud_async делает это вне цикла событий)
+def search_matches(db: Session, user, search: str, columns=None):
+    return _project(_patients_query(db, user, search), columns, extra=("search_name", "snils_digits")).all()
+
+def rank_search_offset(matches, search: str, skip: int, limit: int):
+    return [row for row, _ in search_index.rank_rows(matches, search)[skip:skip + limit]]
+
+
+# ---- keyset pagination ----
+PATIENT_SORTS = {
+    "id": models.Patient.id,
+    "family_name": models.Patient.family_name,
+    "dob": models.Patient.dob,
+}
+
+def encode_cursor(sort: str, value, last_id: int) -> str:
+    if isinstance(value, date):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, last_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cur_sort, value, last_id = json.loads(raw)
+        if cur_sort != sort or not isinstance(last_id, int):
+            raise ValueError
+        if sort == "dob" and value is not None:
+            value = date.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, last_id
+
+def _after_cursor(col, value, last_id: int, descending: bool):
+    # NULL всегда в конце (NULLS LAST): после последнего не-NULL значения идут строки с NULL
+    pid = models.Patient.id
+    if col is pid:
+        return pid < last_id if descending else pid > last_id
+    if value is None:
+        return and_(col.is_(None), pid < last_id if descending else pid > last_id)
+    key, bound = tuple_(col, pid), tuple_(literal(value), literal(last_id))
+    return or_(key < bound if descending else key > bound, col.is_(None))
+
+def page_patients(db: Session, user, search: str = None, sort: str = "id", cursor: str = None, limit: int = 100, columns=None):
+    # keyset-пагинация: стоимость страницы не зависит от её номера
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    col = PATIENT_SORTS.get(key)
+    if col is None:
+        raise HTTPException(status_code=400, detail="Unsupported sort")
+    query = _project(_patients_query(db, user, search), columns, extra=(key,))
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        query = query.filter(_after_cursor(col, value, last_id, descending))
+    pid = models.Patient.id
+    if col is pid:
+        order = [pid.desc() if descending else pid.asc()]
+    else:
+        order = [(col.desc() if descending else col.asc()).nulls_last(), pid.desc() if descending else pid.asc()]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, key), last.id)
+    return rows, next_cursor
+
+def search_cursor(cursor: str = None):
+    if not cursor:
+        return None
+    after = decode_cursor(cursor, "rank")
+    if not isinstance(after[0], (int, float)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+def _search_page_result(page, limit: int):
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last, rank = page[-1]
+        next_cursor = encode_cursor("rank", float(rank), last.id)
+    return [row for row, _ in page], next_cursor
+
+def rank_search_page(matches, search: str, after, limit: int):
+    return _search_page_result(search_index.rank_rows(matches, search, after)[:limit + 1], limit)
+
+def search_patients_page(db: Session, user, search: str, cursor: str = None, limit: int = 100, columns=None):
+    # поиск тоже листается курсором: ключ — (релевантность, id), порядок как в list_patients
+    after = search_cursor(cursor)
+    if not search_index.ranks_in_sql(db):
+        return rank_search_page(search_matches(db, user, search, columns), search, after, limit)
+    query = _project(_patients_query(db, user, search), columns, extra=("search_name", "snils_digits"))
+    return _search_page_result(search_index.ranked_page(db, query, search, after=after, limit=limit), limit)
+
+def driver_params(compiled):
+    # параметры для exec_driver_sql: asyncpg и прочие позиционные драйверы ждут кортеж, а не словарь
+    if compiled.positional:
+        return tuple(compiled.params[name] for name in compiled.positiontup)
+    return compiled.params
+
+def count_patients(db: Session, user, search: str = None, estimate: bool = False):
+    query = _patients_query(db, user, search)
+    bind = db.get_bind()
+    if estimate and bind.dialect.name == "postgresql":
+        # оценка планировщика вместо полного count(*)
+        stmt = query.with_entities(models.Patient.id).statement
+        compiled = stmt.compile(dialect=bind.dialect)
+        plan = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), driver_params(compiled)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"]), True
+    return query.with_entities(func.count(models.Patient.id)).scalar(), False
+
 def update_patient(db: Session, patient_id: int, patient_in: schemas.PatientUpdate):
     db_patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if not db_patient:
@@ -106,6 +338,7 @@ def update_patient(db: Session, patient_id: int, patient_in: schemas.PatientUpda
         setattr(db_patient, field, value)
     db.commit()
     db.refresh(db_patient)
+    invalidate_pedigrees(db, patient_id)
     return db_patient
 
 
@@ -118,17 +351,43 @@ def delete_patient(db: Session, patient_id: int):
     db_patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if not db_patient:
         return None
+    family_id = db_patient.family_id
+    # у соседей меняется граница (has_more) срезов семьи, в которые удалённый не входил
+    neighbours = _neighbours(db, patient_id)
+    # связи parent/child удаляются каскадом ORM, patient_links — явно
+    db.query(models.PatientLink).filter(
+        or_(models.PatientLink.patient1_id == patient_id, models.PatientLink.patient2_id == patient_id)
+    ).delete(synchronize_session=False)
+    db.query(models.PatientMatch).filter(
+        or_(models.PatientMatch.patient_id == patient_id, models.PatientMatch.candidate_id == patient_id)
+    ).delete(synchronize_session=False)
     db.delete(db_patient)
+    db.flush()
+    # семья могла распасться на части — пересчёт только внутри неё
+    families.split(db, [family_id])
     db.commit()
+    invalidate_pedigrees(db, patient_id, *neighbours)
     return True
 
 
+def _neighbours(db: Session, patient_id: int):
+    edges = _component_edges()
+    return db.execute(select(edges.c.b).where(edges.c.a == patient_id).distinct()).scalars().all()
+
+
 # relations
 def create_relation(db: Session, rel: schemas.RelationCreate):
     db_rel = models.Relation(parent_id=rel.parent_id, child_id=rel.child_id, relationship_type=rel.relationship_type)
     db.add(db_rel)
-    db.commit()
+    try:
+        families.union(db, [(rel.parent_id, rel.child_id)])
+        db.commit()
+    except IntegrityError:
+        # uq_relations_parent_child
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Связь уже существует")
     db.refresh(db_rel)
+    invalidate_pedigrees(db, rel.parent_id, rel.child_id)
     return db_rel
 
 def list_relations(db: Session):
@@ -141,69 +400,404 @@ def create_patient_link(db: Session, link: schemas.PatientLinkCreate):
         link_type=link.link_type
     )
     db.add(db_link)
-    db.commit()
+    try:
+        families.union(db, [(link.patient1_id, link.patient2_id)])
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Связь уже существует")
     db.refresh(db_link)
+    invalidate_pedigrees(db, link.patient1_id, link.patient2_id)
     return db_link
 
 def list_patient_links(db: Session):
     return db.query(models.PatientLink).all()
 
+def _delete_edge(db: Session, model, edge_id: int, a, b):
+    edge = db.get(model, edge_id)
+    if edge is None:
+        return None
+    ends = (getattr(edge, a), getattr(edge, b))
+    family_id = families.family_of(db, ends[0])
+    db.delete(edge)
+    db.flush()
+    families.split(db, [family_id])
+    db.commit()
+    invalidate_pedigrees(db, *ends)
+    return True
+
+def delete_relation(db: Session, relation_id: int):
+    return _delete_edge(db, models.Relation, relation_id, "parent_id", "child_id")
+
+def delete_patient_link(db: Session, link_id: int):
+    return _delete_edge(db, models.PatientLink, link_id, "patient1_id", "patient2_id")
+
+
+# ---- batch ----
+# пакетная запись — всё или ничего: сначала проверяется весь пакет, затем по одному
+# insert ... returning на таблицу и один commit. Ошибки проверки возвращаются все сразу
+# списком {"loc", "msg"} (как 422 у FastAPI), loc — (раздел, индекс, поле)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "2000"))
+
+def _insert_ids(db: Session, model, values):
+    if not values:
+        return []
+    return db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), values).scalars().all()
+
+def _validate_batch(db: Session, patients, relations, links):
+    errors = []
+
+    def error(loc, msg):
+        errors.append({"loc": list(loc), "msg": msg})
+
+    temp, snils = {}, {}
+    for i, (temp_id, p) in enumerate(patients):
+        if temp_id in temp:
+            error(("patients", i, "temp_id"), f"temp_id {temp_id} повторяется")
+        temp.setdefault(temp_id, i)
+        if p.snils:
+            if p.snils in snils:
+                error(("patients", i, "snils"), f"СНИЛС {p.snils} повторяется в запросе")
+            snils.setdefault(p.snils, i)
+    if snils:
+        for taken in db.execute(select(models.Patient.snils).where(models.Patient.snils.in_(list(snils)))).scalars():
+            error(("patients", snils[taken], "snils"), "Пациент с таким СНИЛС уже существует")
+
+    existing = {}  # id существующего пациента -> места ссылок на него
+
+    def ref(loc, value):
+        if isinstance(value, str):
+            if value not in temp:
+                error(loc, f"неизвестный temp_id {value}")
+        else:
+            existing.setdefault(value, []).append(loc)
+        return value
+
+    pairs, parents = set(), {}
+    for i, r in enumerate(relations):
+        parent = ref(("relations", i, "parent_id"), r.parent_id)
+        child = ref(("relations", i, "child_id"), r.child_id)
+        if parent == child:
+            error(("relations", i), "пациент не может быть своим родителем")
+        elif (parent, child) in pairs:
+            error(("relations", i), "связь повторяется в запросе")
+        pairs.add((parent, child))
+        parents.setdefault(child, []).append(i)
+    for child, items in parents.items():
+        if len(items) > 2:
+            error(("relations", items[2], "child_id"), "больше двух родителей у одного ребёнка")
+    keys = set()
+    for i, link in enumerate(links):
+        a = ref(("links", i, "patient1_id"), link.patient1_id)
+        b = ref(("links", i, "patient2_id"), link.patient2_id)
+        if a == b:
+            error(("links", i), "связь пациента с самим собой")
+        elif (a, b, link.link_type) in keys:
+            error(("links", i), "связь повторяется в запросе")
+        keys.add((a, b, link.link_type))
+
+    if existing:
+        found = set(db.execute(select(models.Patient.id).where(models.Patient.id.in_(list(existing)))).scalars())
+        for pid in existing.keys() - found:
+            for loc in existing[pid]:
+                error(loc, f"пациент {pid} не найден")
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    return list(existing)
+
+def write_batch(db: Session, patients=(), relations=(), links=(), creator_id: int = None):
+    # patients — пары (temp_id, PatientCreate); в relations / links строка — temp_id, число — id в БД.
+    # Возвращает ({temp_id: id}, id связей родитель-ребёнок, id связей пациентов)
+    if len(patients) + len(relations) + len(links) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не больше {BATCH_MAX_ITEMS} записей за запрос")
+    touched = _validate_batch(db, patients, relations, links)
+    try:
+        values = []
+        for _, p in patients:
+            data = p.model_dump(exclude={"traits", "temp_id"})
+            values.append({**data, **search_index.search_columns(data), "created_by_id": creator_id})
+        ids = dict(zip((temp_id for temp_id, _ in patients), _insert_ids(db, models.Patient, values)))
+        families.assign_new(db, ids.values())
+        if LINKAGE_ON_INSERT:
+            linkage.check_new(db, ids.values())
+        traits = [{"patient_id": ids[temp_id], **t.model_dump()} for temp_id, p in patients for t in p.traits or []]
+        if traits:
+            db.execute(insert(models.Trait), traits)
+
+        def resolve(value):
+            return ids[value] if isinstance(value, str) else value
+
+        relation_ids = _insert_ids(db, models.Relation, [
+            {"parent_id": resolve(r.parent_id), "child_id": resolve(r.child_id), "relationship_type": r.relationship_type}
+            for r in relations
+        ])
+        link_ids = _insert_ids(db, models.PatientLink, [
+            {"patient1_id": resolve(l.patient1_id), "patient2_id": resolve(l.patient2_id), "link_type": l.link_type}
+            for l in links
+        ])
+        families.union(db, [(resolve(r.parent_id), resolve(r.child_id)) for r in relations]
+                       + [(resolve(l.patient1_id), resolve(l.patient2_id)) for l in links])
+        db.commit()
+    except IntegrityError as e:
+        # гонка с параллельной записью (СНИЛС, повтор связи): пакет откатывается целиком
+        db.rollback()
+        raise HTTPException(status_code=400, detail=[{"loc": [], "msg": f"нарушение ограничения БД: {e.orig}"}])
+    # новые пациенты в кэше ещё не лежат — сбрасываются только семьи уже существующих
+    if touched:
+        invalidate_pedigrees(db, *touched)
+    return ids, relation_ids, link_ids
+
+def create_patients_batch(db: Session, patients, creator_id: int):
+    ids, _, _ = write_batch(db, patients=[(str(i), p) for i, p in enumerate(patients)], creator_id=creator_id)
+    return list(ids.values())
+
+def create_relations_batch(db: Session, relations):
+    return write_batch(db, relations=relations)[1]
+
+def create_links_batch(db: Session, links):
+    return write_batch(db, links=links)[2]
+
+def submit_family(db: Session, family: schemas.FamilySubmit, creator_id: int):
+    ids, relation_ids, link_ids = write_batch(
+        db, [(p.temp_id, p) for p in family.patients], family.relations, family.links, creator_id
+    )
+    return {"patients": ids, "relations": relation_ids, "links": link_ids}
+
+
+# ---- component discovery ----
+# family — по сохранённому patients.family_id (backend/families.py),
+# cte — рекурсивный запрос в БД, bfs — обход по уровням (по запросу на уровень)
+PEDIGREE_TRAVERSAL = os.getenv("PEDIGREE_TRAVERSAL", "family")
+# предел числа людей в одном ответе /pedigree; при обрезке ответ помечается truncated,
+# а узлы на границе — has_more
+PEDIGREE_MAX_NODES = int(os.getenv("PEDIGREE_MAX_NODES", "2000"))
+
+# диалекты с WITH RECURSIVE; на остальных сразу обход по уровням
+RECURSIVE_CTE_DIALECTS = {"postgresql", "sqlite", "mysql", "mariadb", "mssql", "oracle"}
+
+
+def supports_recursive_cte(dialect) -> bool:
+    # решение по возможностям диалекта, а не по ошибке запроса: сбой сети или statement_timeout
+    # не должен навсегда переводить процесс на BFS
+    if dialect.name not in RECURSIVE_CTE_DIALECTS:
+        return False
+    if dialect.name == "sqlite":
+        return dialect.dbapi.sqlite_version_info >= (3, 8, 3)
+    if dialect.name in ("mysql", "mariadb"):
+        version = dialect.server_version_info or ()
+        return version >= ((10, 2) if getattr(dialect, "is_mariadb", False) else (8, 0))
+    return True
+
+
+def _component_edges():
+    # неориентированный список рёбер: (a -> b) для relations и patient_links в обе стороны
+    r, l = models.Relation, models.PatientLink
+    return union_all(
+        select(r.parent_id.label("a"), r.child_id.label("b")),
+        select(r.child_id.label("a"), r.parent_id.label("b")),
+        select(l.patient1_id.label("a"), l.patient2_id.label("b")),
+        select(l.patient2_id.label("a"), l.patient1_id.label("b")),
+    ).subquery("edges")
+
+
+def _find_component_cte(db: Session, patient_id: int, max_nodes: int):
+    edges = _component_edges()
+    component = select(cast(literal(patient_id), Integer).label("id")).cte("component", recursive=True)
+    # UNION (а не UNION ALL) отбрасывает уже найденные id, поэтому рекурсия конечна на циклах
+    component = component.union(
+        select(edges.c.b)
+        .join(component, edges.c.a == component.c.id)
+        .where(edges.c.b.isnot(None))
+    )
+    # LIMIT останавливает рекурсию, как только набрано max_nodes
+    ids = db.execute(select(component.c.id).limit(max_nodes)).scalars().all()
+    return set(ids)
+
+
+def _find_component_bfs(db: Session, patient_id: int, max_nodes: int):
+    r, l = models.Relation, models.PatientLink
+    component = {patient_id}
+    frontier = {patient_id}
+    while frontier and len(component) < max_nodes:
+        found = set()
+        for a, b in db.execute(
+            select(r.parent_id, r.child_id).where(or_(r.parent_id.in_(frontier), r.child_id.in_(frontier)))
+        ):
+            found.update((a, b))
+        for a, b in db.execute(
+            select(l.patient1_id, l.patient2_id).where(or_(l.patient1_id.in_(frontier), l.patient2_id.in_(frontier)))
+        ):
+            found.update((a, b))
+        found.discard(None)
+        frontier = set()
+        for pid in sorted(found - component):
+            if len(component) >= max_nodes:
+                break
+            component.add(pid)
+            frontier.add(pid)
+    return component
+
+
+def _find_component_family(db: Session, patient_id: int, max_nodes: int):
+    # одна выборка по индексу patients.family_id; пусто — family_id ещё не заполнен (до backfill)
+    family = select(models.Patient.family_id).where(models.Patient.id == patient_id).scalar_subquery()
+    ids = db.execute(
+        select(models.Patient.id).where(models.Patient.family_id == family).order_by(models.Patient.id).limit(max_nodes)
+    ).scalars().all()
+    return set(ids)
+
+
+def find_component(db: Session, patient_id: int, max_nodes: int = PEDIGREE_MAX_NODES, traversal: str = None):
+    traversal = traversal or PEDIGREE_TRAVERSAL
+    if traversal == "family":
+        component = _find_component_family(db, patient_id, max_nodes)
+        if component:
+            # при обрезке по max_nodes пробанд мог не попасть в первые id
+            component.add(patient_id)
+            return component
+        traversal = "cte"
+    if traversal == "cte" and supports_recursive_cte(db.get_bind().dialect):
+        return _find_component_cte(db, patient_id, max_nodes)
+    return _find_component_bfs(db, patient_id, max_nodes)
+
+
+# ---- neighbourhood ----
+class PedigreeView:
+    """Часть семьи для /pedigree: глубина в поколениях, направление, супруги.
+    По умолчанию — вся семья (компонента связности)."""
+
+    DIRECTIONS = ("ancestors", "descendants", "both")
+
+    def __init__(self, depth: int = None, direction: str = "both", include_spouses: bool = True):
+        self.depth = depth
+        self.direction = direction
+        self.include_spouses = include_spouses
+
+    @property
+    def whole_family(self) -> bool:
+        return self.depth is None and self.direction == "both" and self.include_spouses
+
+    def variant(self) -> str:
+        # ключ в кэше генограмм: у разных срезов одной семьи — разные записи
+        if self.whole_family:
+            return ""
+        depth = "all" if self.depth is None else self.depth
+        return f":{self.direction}:{depth}" + ("" if self.include_spouses else ":nospouses")
+
+
+WHOLE_FAMILY = PedigreeView()
+
+
+def _incident(db: Session, frontier, direction: str = None, spouses: bool = False):
+    # соседи frontier одним запросом: (вид, id). Вид: ring — следующее кольцо (родители и/или дети,
+    # для both ещё сибсы по связи sibling), spouse — супруги. direction=None — только супруги
+    r, l = models.Relation, models.PatientLink
+    ids = list(frontier)
+    kind = func.lower(l.link_type)
+    parts = []
+    if direction in ("ancestors", "both"):
+        parts.append(select(literal("ring").label("kind"), r.parent_id.label("id")).where(r.child_id.in_(ids)))
+    if direction in ("descendants", "both"):
+        parts.append(select(literal("ring").label("kind"), r.child_id.label("id")).where(r.parent_id.in_(ids)))
+    linked = []
+    if direction == "both":
+        linked.append(("ring", "sibling"))
+    if spouses:
+        linked.append(("spouse", "spouse"))
+    for label, link_type in linked:
+        parts.append(select(literal(label).label("kind"), l.patient2_id.label("id")).where(kind == link_type, l.patient1_id.in_(ids)))
+        parts.append(select(literal(label).label("kind"), l.patient1_id.label("id")).where(kind == link_type, l.patient2_id.in_(ids)))
+    if not parts:
+        return set(), set()
+    found = {"ring": set(), "spouse": set()}
+    for label, pid in db.execute(union_all(*parts)):
+        if pid is not None:
+            found[label].add(pid)
+    return found["ring"], found["spouse"]
+
+
+def find_neighbourhood(db: Session, patient_id: int, view: PedigreeView, max_nodes: int = PEDIGREE_MAX_NODES):
+    # кольца от пробанда, один запрос на кольцо. Супруги добавляются к своему кольцу,
+    # но сами не раскрываются: их родня загружается через expand
+    found = {patient_id}
+    frontier = {patient_id}
+    ring = 0
+    while frontier and len(found) < max_nodes:
+        last = view.depth is not None and ring >= view.depth
+        if last and not view.include_spouses:
+            break
+        following, spouses = _incident(db, frontier, None if last else view.direction, view.include_spouses)
+        found.update(sorted(spouses - found)[:max_nodes - len(found)])
+        if last:
+            break
+        ring += 1
+        following = sorted(following - found)[:max_nodes - len(found)]
+        found.update(following)
+        frontier = set(following)
+    return found
+
+
+def find_frontier(db: Session, ids):
+    # id из ids, у которых есть связи с людьми вне ids: на клиенте — маркер «раскрыть»
+    if not ids:
+        return set()
+    edges = _component_edges()
+    ids = list(ids)
+    return set(db.execute(select(edges.c.a).where(edges.c.a.in_(ids), edges.c.b.notin_(ids)).distinct()).scalars())
+
+
+def load_component_edges(db: Session, component):
+    if not component:
+        return [], []
+    ids = list(component)
+    relations = (
+        db.query(models.Relation)
+        .filter(models.Relation.parent_id.in_(ids), models.Relation.child_id.in_(ids))
+        .order_by(models.Relation.id)
+        .all()
+    )
+    links = (
+        db.query(models.PatientLink)
+        .filter(models.PatientLink.patient1_id.in_(ids), models.PatientLink.patient2_id.in_(ids))
+        .order_by(models.PatientLink.id)
+        .all()
+    )
+    return relations, links
+
 
 # ---- pedigree builder ----
-def build_pedigree(db: Session, patient_id: int, max_nodes: int = 2000):
-    if not patient_id:
-        return {"nodes": [], "links": []}
-
-    relations = db.query(models.Relation).all()
-    links = db.query(models.PatientLink).all()
-
-    # --- строим общий граф связей ---
-    from collections import defaultdict, deque
-
-    adj = defaultdict(set)
-    for r in relations:
-        adj[r.parent_id].add(r.child_id)
-        adj[r.child_id].add(r.parent_id)
-    for l in links:
-        adj[l.patient1_id].add(l.patient2_id)
-        adj[l.patient2_id].add(l.patient1_id)
-
-    # --- ищем всю компоненту связности ---
-    component = set()
-    q = deque([patient_id])
-    component.add(patient_id)
-    while q and len(component) < max_nodes:
-        cur = q.popleft()
-        for nb in adj[cur]:
-            if nb not in component:
-                component.add(nb)
-                q.append(nb)
-
-    # --- генерируем поколения от пробанда ---
-    generation = {patient_id: 0}
-    q = deque([patient_id])
-    while q:
-        cur = q.popleft()
-        cur_gen = generation[cur]
-        # родители = -1, дети = +1
-        for r in relations:
-            if r.child_id == cur and r.parent_id in component and r.parent_id not in generation:
-                generation[r.parent_id] = cur_gen - 1
-                q.append(r.parent_id)
-            if r.parent_id == cur and r.child_id in component and r.child_id not in generation:
-                generation[r.child_id] = cur_gen + 1
-                q.append(r.child_id)
-        # братья/сёстры/супруги = то же поколение
-        for l in links:
-            if l.patient1_id == cur and l.patient2_id in component and l.patient2_id not in generation:
-                generation[l.patient2_id] = cur_gen
-                q.append(l.patient2_id)
-            if l.patient2_id == cur and l.patient1_id in component and l.patient1_id not in generation:
-                generation[l.patient1_id] = cur_gen
-                q.append(l.patient1_id)
+def load_pedigree(db: Session, patient_id: int, max_nodes: int = PEDIGREE_MAX_NODES, traversal: str = None,
+                  view: PedigreeView = WHOLE_FAMILY):
+    # все обращения к БД для генограммы: компонента (или её срез), связи внутри неё, пациенты, граница
+    # --- ищем компоненту связности пробанда прямо в БД ---
+    if view.whole_family:
+        component = find_component(db, patient_id, max_nodes=max_nodes, traversal=traversal)
+    else:
+        component = find_neighbourhood(db, patient_id, view, max_nodes=max_nodes)
+
+    # --- загружаем только связи внутри компоненты ---
+    relations, links = load_component_edges(db, component)
 
     # --- достаём данные пациентов ---
     patients = db.query(models.Patient).filter(models.Patient.id.in_(component)).all()
+
+    # --- граница: у полной семьи она есть только при обрезке по max_nodes ---
+    truncated = len(component) >= max_nodes
+    frontier = find_frontier(db, component) if truncated or not view.whole_family else set()
+    return component, relations, links, patients, frontier, truncated
+
+
+def _pedigree_graph(patient_id: int, component, relations, links):
+    # --- генерируем поколения от пробанда за O(V+E) ---
+    graph = PedigreeGraph.from_edges(relations, links, nodes=component)
+    generation = graph.assign_generations(patient_id)
+    return graph, generation, graph.generation_conflicts(generation)
+
+
+def assemble_pedigree(patient_id: int, component, relations, links, patients, frontier=(), truncated=False):
+    # чистый CPU, без БД: crud_async выполняет его в threadpool
+    graph, generation, conflicts = _pedigree_graph(patient_id, component, relations, links)
+
     patient_by_id = {p.id: p for p in patients}
 
     nodes = []
@@ -222,37 +816,238 @@ def build_pedigree(db: Session, patient_id: int, max_nodes: int = 2000):
             "generation": generation.get(pid, 0),
             "is_proband": (pid == patient_id),
             "family_hyperchol": p.family_hyperchol, 
+            "has_more": pid in frontier,
         })
 
-    # --- связи ---
-    link_list = []
-    for r in relations:
-        if r.parent_id in component and r.child_id in component:
-            link_list.append({"source": r.parent_id, "target": r.child_id, "type": "vertical"})
-    for l in links:
-        if l.patient1_id in component and l.patient2_id in component:
-            lt = l.link_type.lower()
-            if lt == "sibling":
-                link_type = "horizontal"
-            elif lt == "spouse":
-                link_type = "spouse"
-            else:
-                link_type = lt
-            link_list.append({"source": l.patient1_id, "target": l.patient2_id, "type": link_type})
-
-    # --- убираем дубликаты ---
-    seen, dedup = set(), []
-    for link in link_list:
-        typ = link["type"]
-        a, b = link["source"], link["target"]
-        if typ == "vertical":
-            key = ("v", a, b)
-        else:
-            key = (typ, min(a, b), max(a, b))
-        if key in seen:
-            continue
-        seen.add(key)
-        dedup.append(link)
+    return {"nodes": nodes, "links": graph.links(), "conflicts": conflicts, "truncated": truncated}
 
-    return {"nodes": nodes, "links": dedup}
 
+def build_pedigree(db: Session, patient_id: int, max_nodes: int = PEDIGREE_MAX_NODES, traversal: str = None,
+                   view: PedigreeView = WHOLE_FAMILY):
+    if not patient_id:
+        return {"nodes": [], "links": [], "conflicts": [], "truncated": False}
+    return assemble_pedigree(
+        patient_id, *load_pedigree(db, patient_id, max_nodes=max_nodes, traversal=traversal, view=view)
+    )
+
+
+def get_pedigree_cached(db: Session, patient_id: int, layout: bool = False, view: PedigreeView = WHOLE_FAMILY,
+                        media_type: str = JSON):
+    # возвращает запись кэша {"payload", "body", "etag", ...} или None, если пациента нет
+    if media_type == MSGPACK:
+        return get_columns_cached(db, patient_id, layout, view)
+    if layout:
+        return get_layout_cached(db, patient_id, view)
+    entry = pedigree_cache.get(patient_id, view.variant())
+    if entry is not None:
+        return entry
+    if not get_patient(db, patient_id):
+        return None
+    token = pedigree_cache.begin()
+    payload = build_pedigree(db, patient_id, view=view)
+    return pedigree_cache.put(patient_id, payload, token=token, variant=view.variant())
+
+
+# ---- columnar ----
+# колоночный формат (backend/wire.py) в MessagePack — отдельный вариант в кэше
+COLUMNS_VARIANT = ":columns"
+
+
+def assemble_columns(patient_id: int, component, relations, links, patients, frontier=(), truncated=False):
+    # как assemble_pedigree, но сразу в параллельные массивы, без dict на узел
+    graph, generation, conflicts = _pedigree_graph(patient_id, component, relations, links)
+    return wire.pedigree_columns(patient_id, patients, graph, generation, conflicts, frontier, truncated)
+
+
+def columns_variant(layout: bool, view: PedigreeView) -> str:
+    return view.variant() + (LAYOUT_VARIANT if layout else "") + COLUMNS_VARIANT
+
+
+def get_columns_cached(db: Session, patient_id: int, layout: bool = False, view: PedigreeView = WHOLE_FAMILY):
+    variant = columns_variant(layout, view)
+    entry = pedigree_cache.get(patient_id, variant)
+    if entry is not None:
+        return entry
+    if not get_patient(db, patient_id):
+        return None
+    token = pedigree_cache.begin()
+    columns = assemble_columns(patient_id, *load_pedigree(db, patient_id, view=view))
+    if layout:
+        wire.add_layout(columns, get_layout_cached(db, patient_id, view)["payload"])
+    return pedigree_cache.put(patient_id, columns, token=token, variant=variant, members=columns["ids"],
+                              media_type=MSGPACK)
+
+
+# ---- expand ----
+def load_expansion(db: Session, patient_id: int, node_id: int, view: PedigreeView):
+    # одно кольцо вокруг node_id из семьи пробанда; None — node_id не из этой семьи
+    if families.family_of(db, node_id) != families.family_of(db, patient_id) or not get_patient(db, node_id):
+        return None
+    ring = PedigreeView(depth=1, direction=view.direction, include_spouses=view.include_spouses)
+    return load_pedigree(db, node_id, view=ring)
+
+
+def assemble_expansion(patient_id: int, node_id: int, generation: int, component, relations, links, patients,
+                       frontier=(), truncated=False):
+    # поколения — от node_id со сдвигом на его поколение у клиента, пробанд — исходный
+    payload = assemble_pedigree(node_id, component, relations, links, patients, frontier, truncated)
+    for node in payload["nodes"]:
+        node["generation"] += generation
+        node["is_proband"] = node["id"] == patient_id
+    for conflict in payload["conflicts"]:
+        conflict["source_generation"] += generation
+        conflict["target_generation"] += generation
+    return payload
+
+
+def expand_pedigree(db: Session, patient_id: int, node_id: int, view: PedigreeView = WHOLE_FAMILY,
+                    generation: int = 0):
+    data = load_expansion(db, patient_id, node_id, view)
+    if data is None:
+        return None
+    return assemble_expansion(patient_id, node_id, generation, *data)
+
+
+# ---- layout ----
+# раскладка хранится отдельным вариантом рядом с генограммой и сбрасывается вместе с ней по версии семьи
+LAYOUT_VARIANT = ":layout"
+
+
+def get_layout_cached(db: Session, patient_id: int, view: PedigreeView = WHOLE_FAMILY):
+    variant = view.variant() + LAYOUT_VARIANT
+    entry = pedigree_cache.get(patient_id, variant)
+    if entry is not None:
+        return entry
+    # эпоха до чтения генограммы: инвалидация во время раскладки не даст закэшировать устаревшее
+    token = pedigree_cache.begin()
+    base = get_pedigree_cached(db, patient_id, view=view)
+    if base is None:
+        return None
+    payload = genogram_layout(base["payload"])
+    return pedigree_cache.put(patient_id, payload, token=token, variant=variant)
+
+
+# ---- kinship ----
+def load_kinship(db: Session, patient_id: int):
+    # для родства нужны только id семьи и рёбра: колонки без ORM-объектов и строк пациентов
+    r, l = models.Relation, models.PatientLink
+    component = find_component(db, patient_id, max_nodes=kinship.KINSHIP_MAX_NODES)
+    ids = list(component)
+    relations = db.execute(
+        select(r.parent_id, r.child_id).where(r.parent_id.in_(ids), r.child_id.in_(ids)).order_by(r.id)
+    ).all()
+    links = db.execute(
+        select(l.patient1_id, l.patient2_id, l.link_type)
+        .where(l.patient1_id.in_(ids), l.patient2_id.in_(ids)).order_by(l.id)
+    ).all()
+    return component, relations, links
+
+
+def kinship_variant(matrix: bool) -> str:
+    # ключ в кэше генограмм рядом с самой генограммой того же пробанда
+    return ":kinship:matrix" if matrix else ":kinship"
+
+
+def check_kinship_matrix(component, matrix: bool):
+    if matrix and len(component) > kinship.KINSHIP_MATRIX_MAX_NODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"matrix=true доступен для семей до {kinship.KINSHIP_MATRIX_MAX_NODES} человек",
+        )
+
+
+def get_kinship_cached(db: Session, patient_id: int, matrix: bool = False):
+    # кэшируется рядом с генограммой и сбрасывается вместе с ней по версии семьи
+    entry = pedigree_cache.get(patient_id, kinship_variant(matrix))
+    if entry is not None:
+        return entry
+    if not get_patient(db, patient_id):
+        return None
+    token = pedigree_cache.begin()
+    component, relations, links = load_kinship(db, patient_id)
+    check_kinship_matrix(component, matrix)
+    payload = kinship.family_kinship(patient_id, component, relations, links, matrix=matrix)
+    return pedigree_cache.put(patient_id, payload, token=token, variant=kinship_variant(matrix), members=component)
+
+
+# ---- families ----
+def list_families(db: Session, user, min_size: int = 2, cursor: int = None, limit: int = 100):
+    # агрегат по индексу family_id; для не-админа считаются только его пациенты
+    p = models.Patient
+    size = func.count(p.id)
+    query = visible_patients(
+        db.query(p.family_id, size.label("size"), func.count(p.id).filter(p.family_hyperchol.is_(True)).label("probands")),
+        user,
+    ).filter(p.family_id.isnot(None))
+    if cursor is not None:
+        query = query.filter(p.family_id > cursor)
+    rows = query.group_by(p.family_id).having(size >= min_size).order_by(p.family_id).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].family_id) if len(rows) > limit else None
+    return [{"family_id": r.family_id, "size": r.size, "probands": r.probands} for r in rows[:limit]], next_cursor
+
+
+# ---- duplicates ----
+# возможные дубли пациентов и их слияние (backend/linkage.py)
+def patient_duplicates(db: Session, patient_id: int, user, threshold: float = None):
+    # кандидаты из блока пациента, видимые пользователю, по убыванию оценки
+    patient = db.execute(select(*linkage.COLUMNS).where(models.Patient.id == patient_id)).first()
+    if patient is None:
+        return None
+    found = linkage.candidates(db, patient, threshold)
+    if user.role != "admin" and found:
+        visible = {pid for pid, in visible_patients(db.query(models.Patient.id), user).filter(
+            models.Patient.id.in_([row.id for row, _ in found])
+        )}
+        found = [(row, s) for row, s in found if row.id in visible]
+    return [{**row._asdict(), "score": s} for row, s in found]
+
+
+def pending_match_ids(db: Session, patient_id: int):
+    m = models.PatientMatch
+    rows = db.execute(
+        select(m.patient_id, m.candidate_id)
+        .where(or_(m.patient_id == patient_id, m.candidate_id == patient_id), m.status == "pending")
+    ).all()
+    return sorted(b if a == patient_id else a for a, b in rows)
+
+
+def list_matches(db: Session, user, status: str = "pending", cursor: int = None, limit: int = 100):
+    # keyset по id пары; не-админ видит только пары своих пациентов
+    m = models.PatientMatch
+    query = db.query(m).filter(m.status == status)
+    if user.role != "admin":
+        own = select(models.Patient.id).where(models.Patient.created_by_id == user.id)
+        query = query.filter(m.patient_id.in_(own), m.candidate_id.in_(own))
+    if cursor is not None:
+        query = query.filter(m.id > cursor)
+    rows = query.order_by(m.id).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def dismiss_match(db: Session, match_id: int, user):
+    match = db.get(models.PatientMatch, match_id)
+    if match is None or not all(is_patient_visible(db, pid, user) for pid in (match.patient_id, match.candidate_id)):
+        return None
+    match.status = "dismissed"
+    db.commit()
+    return True
+
+
+def merge_patients(db: Session, keep_id: int, duplicate_id: int):
+    # одна транзакция: связи, признаки и ключи импорта дубля переходят к keep, дубль удаляется
+    if keep_id == duplicate_id:
+        raise HTTPException(status_code=400, detail="Нельзя слить пациента с самим собой")
+    keep, duplicate = db.get(models.Patient, keep_id), db.get(models.Patient, duplicate_id)
+    if keep is None or duplicate is None:
+        return None
+    neighbours = {*_neighbours(db, keep_id), *_neighbours(db, duplicate_id)}
+    try:
+        linkage.merge(db, keep, duplicate)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Слияние нарушает ограничение БД, данные не изменены")
+    db.refresh(keep)
+    invalidate_pedigrees(db, keep_id, duplicate_id, *neighbours)
+    return keep
@@ -0,0 +1,265 @@
+# backend/crud_async.py
+# Асинхронные версии функций crud для AsyncSession.
+# Запросы не дублируются: синхронный код crud выполняется через AsyncSession.run_sync —
+# в нём запросы уходят в asyncpg, и на время ожидания БД цикл событий обслуживает другие запросы.
+# Но сам run_sync идёт в потоке цикла событий, поэтому в нём — только работа с БД.
+# Всё, что занимает CPU или ходит в сеть мимо БД, выносится в threadpool:
+#   - сборка генограммы (граф, поколения, конфликты) — crud.assemble_pedigree;
+#   - матрица родства — kinship.family_kinship;
+#   - раскладка генограммы — layout.genogram_layout, колоночный формат — crud.assemble_columns;
+#   - ранжирование поиска в процессе (без pg_trgm);
+#   - поколения семьи пробанда для когорты — cohort.generations;
+#   - валидация списков в схемы ответа;
+#   - обращения к кэшу генограмм (Redis при PEDIGREE_CACHE_URL).
+# Одиночные объекты со связями приводятся к схемам внутри run_sync: ленивые загрузки
+# вне него недоступны (MissingGreenlet).
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import cohort, crud, jobs, kinship, schemas, wire
+from .cache import pedigree_cache
+from .layout import genogram_layout
+from .responses import JSON, MSGPACK
+from .search import ranks_in_sql
+
+
+def _run(fn, schema=None):
+    def call(session, *args, **kwargs):
+        result = fn(session, *args, **kwargs)
+        if schema is None or result is None:
+            return result
+        return schema.model_validate(result, from_attributes=True)
+
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(call, *args, **kwargs)
+
+    wrapper.__name__ = fn.__name__
+    wrapper.__qualname__ = fn.__qualname__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+def _write(fn, schema=None):
+    # запись: сброс кэша генограмм, который crud делает после commit, выполняется в threadpool
+    def call(session, *args, **kwargs):
+        session.info["deferred_invalidations"] = deferred = []
+        try:
+            result = fn(session, *args, **kwargs)
+            if schema is not None and result is not None:
+                result = schema.model_validate(result, from_attributes=True)
+            return result, deferred
+        finally:
+            session.info.pop("deferred_invalidations", None)
+
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        result, deferred = await db.run_sync(call, *args, **kwargs)
+        if deferred:
+            await run_in_threadpool(pedigree_cache.invalidate, *deferred)
+        return result
+
+    wrapper.__name__ = fn.__name__
+    wrapper.__qualname__ = fn.__qualname__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+def _validate_all(schema, rows):
+    return [schema.model_validate(r, from_attributes=True) for r in rows]
+
+
+async def _validated(rows, columns=None, schema=schemas.PatientOut):
+    # columns задан — облегчённые строки-проекции, их отдаёт patient_rows без схем
+    if columns is not None:
+        return rows
+    return await run_in_threadpool(_validate_all, schema, rows)
+
+
+async def _ranks_in_sql(db: AsyncSession) -> bool:
+    return await db.run_sync(ranks_in_sql)
+
+
+# users
+get_user_by_email = _run(crud.get_user_by_email)
+create_user = _run(crud.create_user, schemas.UserOut)
+update_password_hash = _run(crud.update_password_hash)
+
+# patients
+create_patient = _write(crud.create_patient, schemas.PatientOut)
+get_patient = _run(crud.get_patient, schemas.PatientOut)
+get_patient_row = _run(crud.get_patient_row)
+patient_rows = _run(crud.patient_rows)
+is_patient_visible = _run(crud.is_patient_visible)
+count_patients = _run(crud.count_patients)
+update_patient = _write(crud.update_patient, schemas.PatientOut)
+delete_patient = _write(crud.delete_patient)
+
+
+async def page_patients(db: AsyncSession, user, search: str = None, sort: str = "id", cursor: str = None,
+                        limit: int = 100, columns=None):
+    rows, next_cursor = await db.run_sync(
+        crud.page_patients, user, search=search, sort=sort, cursor=cursor, limit=limit, columns=columns
+    )
+    return await _validated(rows, columns), next_cursor
+
+
+async def search_patients_page(db: AsyncSession, user, search: str, cursor: str = None, limit: int = 100,
+                               columns=None):
+    if await _ranks_in_sql(db):
+        rows, next_cursor = await db.run_sync(
+            crud.search_patients_page, user, search, cursor=cursor, limit=limit, columns=columns
+        )
+    else:
+        after = crud.search_cursor(cursor)
+        matches = await db.run_sync(crud.search_matches, user, search, columns)
+        rows, next_cursor = await run_in_threadpool(crud.rank_search_page, matches, search, after, limit)
+    return await _validated(rows, columns), next_cursor
+
+
+async def list_patients(db: AsyncSession, user, search: str = None, skip: int = 0, limit: int = 100, columns=None):
+    if search and not await _ranks_in_sql(db):
+        matches = await db.run_sync(crud.search_matches, user, search, columns)
+        rows = await run_in_threadpool(crud.rank_search_offset, matches, search, skip, limit)
+    else:
+        rows = await db.run_sync(crud.list_patients, user, search=search, skip=skip, limit=limit, columns=columns)
+    return await _validated(rows, columns)
+
+
+# relations / links
+create_relation = _write(crud.create_relation, schemas.RelationOut)
+create_patient_link = _write(crud.create_patient_link, schemas.PatientLinkOut)
+delete_relation = _write(crud.delete_relation)
+delete_patient_link = _write(crud.delete_patient_link)
+
+# batch
+create_patients_batch = _write(crud.create_patients_batch)
+create_relations_batch = _write(crud.create_relations_batch)
+create_links_batch = _write(crud.create_links_batch)
+submit_family = _write(crud.submit_family)
+
+
+async def list_relations(db: AsyncSession):
+    return await _validated(await db.run_sync(crud.list_relations), schema=schemas.RelationOut)
+
+
+async def list_patient_links(db: AsyncSession):
+    return await _validated(await db.run_sync(crud.list_patient_links), schema=schemas.PatientLinkOut)
+
+
+# duplicates
+patient_duplicates = _run(crud.patient_duplicates)
+pending_match_ids = _run(crud.pending_match_ids)
+dismiss_match = _write(crud.dismiss_match)
+merge_patients = _write(crud.merge_patients, schemas.PatientOut)
+
+
+async def list_matches(db: AsyncSession, user, status: str = "pending", cursor: int = None, limit: int = 100):
+    rows, next_cursor = await db.run_sync(crud.list_matches, user, status=status, cursor=cursor, limit=limit)
+    return await _validated(rows, schema=schemas.PatientMatchOut), next_cursor
+
+
+# jobs
+enqueue_job = _run(jobs.enqueue, schemas.JobOut)
+get_job = _run(jobs.get_job, schemas.JobOut)
+get_job_file = _run(jobs.get_result_file)
+cancel_job = _run(jobs.cancel, schemas.JobOut)
+retry_job = _run(jobs.retry, schemas.JobOut)
+
+
+async def list_jobs(db: AsyncSession, user, status: str = None, limit: int = 50):
+    return await _validated(await db.run_sync(jobs.list_jobs, user, status=status, limit=limit), schema=schemas.JobOut)
+
+
+# cohorts
+async def query_cohort(db: AsyncSession, user, q):
+    if q.proband_id is None:
+        return await db.run_sync(cohort.query, user, q)
+    family_id, relations, links = await db.run_sync(cohort.load_family, q.proband_id)
+    generation = await run_in_threadpool(cohort.generations, q.proband_id, relations, links)
+    return await db.run_sync(cohort.query, user, q, family_id, generation)
+
+
+# families / pedigree
+list_families = _run(crud.list_families)
+find_component = _run(crud.find_component)
+
+
+async def build_pedigree(db: AsyncSession, patient_id: int, max_nodes: int = crud.PEDIGREE_MAX_NODES,
+                         traversal: str = None, view: crud.PedigreeView = crud.WHOLE_FAMILY):
+    if not patient_id:
+        return {"nodes": [], "links": [], "conflicts": [], "truncated": False}
+    data = await db.run_sync(crud.load_pedigree, patient_id, max_nodes=max_nodes, traversal=traversal, view=view)
+    return await run_in_threadpool(crud.assemble_pedigree, patient_id, *data)
+
+
+async def get_pedigree_cached(db: AsyncSession, patient_id: int, layout: bool = False,
+                              view: crud.PedigreeView = crud.WHOLE_FAMILY, media_type: str = JSON):
+    # то же, что crud.get_pedigree_cached: запись кэша {"payload", "body", "etag", ...} или None
+    if media_type == MSGPACK:
+        return await get_columns_cached(db, patient_id, layout, view)
+    if layout:
+        return await get_layout_cached(db, patient_id, view)
+    entry = await run_in_threadpool(pedigree_cache.get, patient_id, view.variant())
+    if entry is not None:
+        return entry
+    if not await db.run_sync(crud.get_patient, patient_id):
+        return None
+    token = await run_in_threadpool(pedigree_cache.begin)
+    payload = await build_pedigree(db, patient_id, view=view)
+    return await run_in_threadpool(pedigree_cache.put, patient_id, payload, token=token, variant=view.variant())
+
+
+async def get_layout_cached(db: AsyncSession, patient_id: int, view: crud.PedigreeView = crud.WHOLE_FAMILY):
+    variant = view.variant() + crud.LAYOUT_VARIANT
+    entry = await run_in_threadpool(pedigree_cache.get, patient_id, variant)
+    if entry is not None:
+        return entry
+    token = await run_in_threadpool(pedigree_cache.begin)
+    base = await get_pedigree_cached(db, patient_id, view=view)
+    if base is None:
+        return None
+    payload = await run_in_threadpool(genogram_layout, base["payload"])
+    return await run_in_threadpool(pedigree_cache.put, patient_id, payload, token=token, variant=variant)
+
+
+async def get_columns_cached(db: AsyncSession, patient_id: int, layout: bool = False,
+                             view: crud.PedigreeView = crud.WHOLE_FAMILY):
+    variant = crud.columns_variant(layout, view)
+    entry = await run_in_threadpool(pedigree_cache.get, patient_id, variant)
+    if entry is not None:
+        return entry
+    if not await db.run_sync(crud.get_patient, patient_id):
+        return None
+    token = await run_in_threadpool(pedigree_cache.begin)
+    data = await db.run_sync(crud.load_pedigree, patient_id, view=view)
+    columns = await run_in_threadpool(crud.assemble_columns, patient_id, *data)
+    if layout:
+        laid = await get_layout_cached(db, patient_id, view)
+        wire.add_layout(columns, laid["payload"])
+    return await run_in_threadpool(
+        pedigree_cache.put, patient_id, columns, token=token, variant=variant, members=columns["ids"],
+        media_type=MSGPACK,
+    )
+
+
+async def expand_pedigree(db: AsyncSession, patient_id: int, node_id: int,
+                          view: crud.PedigreeView = crud.WHOLE_FAMILY, generation: int = 0):
+    data = await db.run_sync(crud.load_expansion, patient_id, node_id, view)
+    if data is None:
+        return None
+    return await run_in_threadpool(crud.assemble_expansion, patient_id, node_id, generation, *data)
+
+
+async def get_kinship_cached(db: AsyncSession, patient_id: int, matrix: bool = False):
+    variant = crud.kinship_variant(matrix)
+    entry = await run_in_threadpool(pedigree_cache.get, patient_id, variant)
+    if entry is not None:
+        return entry
+    if not await db.run_sync(crud.get_patient, patient_id):
+        return None
+    token = await run_in_threadpool(pedigree_cache.begin)
+    component, relations, links = await db.run_sync(crud.load_kinship, patient_id)
+    crud.check_kinship_matrix(component, matrix)
+    payload = await run_in_threadpool(kinship.family_kinship, patient_id, component, relations, links, matrix)
+    return await run_in_threadpool(
+        pedigree_cache.put, patient_id, payload, token=token, variant=variant, members=component
+    )
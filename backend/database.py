@@ -1,13 +1,69 @@
 # backend/database.py
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
 
+from .metrics import TimedQueuePool, TimedAsyncQueuePool
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, future=True)
+
+def pool_options(url, name: str, poolclass):
+    # размер пула — на процесс: суммарно workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) <= max_connections
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        # SQLite (тесты, локальный запуск) — пул по умолчанию: у in-memory одно соединение,
+        # а соединения aiosqlite привязаны к циклу событий и не переживают смену цикла в TestClient
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        # Render закрывает простаивающие соединения; pre-ping и recycle не дают отдать мёртвое
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_logging_name": name,
+    }
+
+
+# синхронный движок — для скриптов (create_test_user.py, импорт/экспорт, миграции)
+engine = create_engine(DATABASE_URL, future=True, **pool_options(DATABASE_URL, "sync", TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# асинхронные драйверы для тех же баз
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: str):
+    # DATABASE_URL -> URL асинхронного драйвера; ASYNC_DATABASE_URL задаёт его явно
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    if url.drivername == "postgresql+asyncpg" and "sslmode" in url.query:
+        # asyncpg не понимает sslmode (его добавляет Render), у него параметр ssl
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+# асинхронный движок — для обработчиков API: ожидание БД не занимает поток
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, "async", TimedAsyncQueuePool)
+)
+# expire_on_commit=False: после commit объекты сериализуются в ответ без повторной загрузки
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
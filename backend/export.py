@@ -0,0 +1,158 @@
+# backend/export.py
+# Потоковая выгрузка пациентов и генограмм: CSV, NDJSON и LINKAGE .ped.
+# Строки читаются серверным курсором (yield_per) и отдаются кусками — память не растёт с размером реестра.
+import csv
+import io
+import json
+import os
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from . import models, schemas
+from .crud import visible_patients
+
+YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "ped": "text/plain",
+}
+
+PATIENT_COLUMNS = ["id", *schemas.PatientBase.model_fields, "created_by_id"]
+PEDIGREE_COLUMNS = ["id", "father", "mother", *(c for c in schemas.PedigreeNode.model_fields if c != "id")]
+
+
+def _value(v):
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+
+def _csv_chunks(header, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(["" if v is None else _value(v) for v in row])
+        if i % YIELD_PER == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _ndjson_chunks(header, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({k: _value(v) for k, v in zip(header, row)}, ensure_ascii=False))
+        if len(lines) >= YIELD_PER:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _ped_line(family, pid, father, mother, sex, affected):
+    sex_code = {"male": 1, "female": 2}.get((sex or "").lower(), 0)
+    phenotype = 2 if affected else 1
+    return f"{family}\t{pid}\t{father or 0}\t{mother or 0}\t{sex_code}\t{phenotype}\n"
+
+
+def _split_parents(parents):
+    # parents: [(parent_id, sex)] -> (отец, мать); пол неизвестен — по порядку
+    father = next((p for p, sex in parents if sex == "male"), None)
+    mother = next((p for p, sex in parents if sex == "female"), None)
+    rest = [p for p in dict.fromkeys(p for p, _ in parents) if p not in (father, mother)]
+    if father is None and rest:
+        father = rest.pop(0)
+    if mother is None and rest:
+        mother = rest.pop(0)
+    return father, mother
+
+
+def _chunked(lines):
+    out = []
+    for line in lines:
+        out.append(line)
+        if len(out) >= YIELD_PER:
+            yield "".join(out)
+            out = []
+    if out:
+        yield "".join(out)
+
+
+# ---- patients ----
+def _patient_rows(db, user):
+    cols = [getattr(models.Patient, c) for c in PATIENT_COLUMNS]
+    stmt = visible_patients(select(*cols), user).order_by(models.Patient.id)
+    return db.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def _parent_rows(db, user):
+    # (child_id, parent_id, пол родителя) по возрастанию child_id; родители тоже с учётом видимости
+    child, parent = aliased(models.Patient), aliased(models.Patient)
+    stmt = (
+        select(models.Relation.child_id, models.Relation.parent_id, parent.sex)
+        .join(child, child.id == models.Relation.child_id)
+        .join(parent, parent.id == models.Relation.parent_id)
+    )
+    stmt = visible_patients(visible_patients(stmt, user, child), user, parent)
+    stmt = stmt.order_by(models.Relation.child_id, models.Relation.id)
+    return db.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def _patients_ped(db, user):
+    # слияние двух упорядоченных потоков (пациенты и их родители) без загрузки в память
+    parents = iter(_parent_rows(db, user))
+    pending = next(parents, None)
+    for p in _patient_rows(db, user):
+        row = dict(zip(PATIENT_COLUMNS, p))
+        own = []
+        while pending is not None and pending[0] <= row["id"]:
+            if pending[0] == row["id"]:
+                own.append((pending[1], pending[2]))
+            pending = next(parents, None)
+        father, mother = _split_parents(own)
+        # в общем реестре семьи не выделены — FID общий, IID уникальны глобально
+        yield _ped_line("registry", row["id"], father, mother, row["sex"], row["family_hyperchol"])
+
+
+def export_patients(session_factory, user, fmt: str):
+    # генератор открывает свою сессию: ответ стримится уже после выхода из обработчика
+    db = session_factory()
+    try:
+        if fmt == "ped":
+            yield from _chunked(_patients_ped(db, user))
+        elif fmt == "ndjson":
+            yield from _ndjson_chunks(PATIENT_COLUMNS, _patient_rows(db, user))
+        else:
+            yield from _csv_chunks(PATIENT_COLUMNS, _patient_rows(db, user))
+    finally:
+        db.close()
+
+
+# ---- pedigree ----
+def _pedigree_rows(payload):
+    parents = {}
+    sex = {n["id"]: n.get("sex") for n in payload["nodes"]}
+    for l in payload["links"]:
+        if l["type"] == "vertical":
+            parents.setdefault(l["target"], []).append((l["source"], sex.get(l["source"])))
+    for n in payload["nodes"]:
+        father, mother = _split_parents(parents.get(n["id"], []))
+        yield [n["id"], father, mother, *(n.get(c) for c in PEDIGREE_COLUMNS[3:])]
+
+
+def export_pedigree(payload, proband_id: int, fmt: str):
+    if fmt == "ped":
+        rows = _pedigree_rows(payload)
+        idx = {c: i for i, c in enumerate(PEDIGREE_COLUMNS)}
+        yield from _chunked(
+            _ped_line(proband_id, r[0], r[1], r[2], r[idx["sex"]], r[idx["family_hyperchol"]]) for r in rows
+        )
+    elif fmt == "ndjson":
+        yield from _ndjson_chunks(PEDIGREE_COLUMNS, _pedigree_rows(payload))
+    else:
+        yield from _csv_chunks(PEDIGREE_COLUMNS, _pedigree_rows(payload))
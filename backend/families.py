@@ -0,0 +1,184 @@
+# backend/families.py
+# Семья — компонента связности по relations и patient_links — хранится в patients.family_id
+# (индекс), поэтому «загрузить семью» — один запрос по индексу, без обхода графа.
+# Идентификатор семьи — наименьший id её члена: он однозначно пересчитывается после разделения
+# и совпадает с ключом семьи в кэше генограмм (cache.PedigreeCache, family = min(members)).
+#   новый пациент             — assign_new: family_id = id;
+#   новое ребро a—b           — union: семья с большим id переписывается на меньший (UPDATE по индексу);
+#   удалено ребро или пациент — split: компоненты пересчитываются только внутри затронутой семьи.
+# Все функции работают в транзакции вызывающего кода и не делают commit.
+# На PostgreSQL затронутые семьи блокируются pg_advisory_xact_lock до конца транзакции:
+# параллельные union / split одной семьи выполняются по очереди.
+#
+#   python -m backend.families backfill   — заполнить family_id для существующих данных
+import argparse
+import sys
+
+from sqlalchemy import and_, bindparam, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+# первый ключ pg_advisory_xact_lock(int, int): пространство блокировок семей
+LOCK_NAMESPACE = 7341
+
+P = models.Patient
+
+
+def _lock(db: Session, families) -> bool:
+    # False — СУБД без advisory-блокировок (SQLite сериализует запись сама)
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    for family in sorted(families):
+        db.execute(select(func.pg_advisory_xact_lock(LOCK_NAMESPACE, family)))
+    return True
+
+
+def _families_of(db: Session, patient_ids):
+    # пациент без family_id (до backfill) считается отдельной семьёй
+    rows = db.execute(select(P.id, P.family_id).where(P.id.in_(list(patient_ids)))).all()
+    return {pid: family if family is not None else pid for pid, family in rows}
+
+
+def _move(db: Session, old_families, new_family: int):
+    old = list(old_families)
+    db.execute(
+        update(P)
+        .where(or_(P.family_id.in_(old), and_(P.family_id.is_(None), P.id.in_([*old, new_family]))))
+        .values(family_id=new_family)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def assign_new(db: Session, patient_ids):
+    # только что вставленные пациенты: каждый — отдельная семья
+    if patient_ids:
+        db.execute(
+            update(P).where(P.id.in_(list(patient_ids))).values(family_id=P.id)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def assign(db: Session, changes):
+    # changes: [{"pid": id пациента, "fid": id семьи}] — executemany по первичному ключу
+    if changes:
+        table = P.__table__
+        statement = table.update().where(table.c.id == bindparam("pid")).values(family_id=bindparam("fid"))
+        db.connection().execute(statement, changes)
+
+
+def _components(members, edges):
+    parent = {m: m for m in members}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in edges:
+        if a in parent and b in parent:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+    components = {}
+    for m in members:
+        components.setdefault(find(m), []).append(m)
+    return components
+
+
+def union(db: Session, pairs):
+    # pairs — пары id пациентов, между которыми появились рёбра.
+    # Возвращает {поглощённая семья: итоговая семья}
+    ids = {x for pair in pairs for x in pair if x is not None}
+    if not ids:
+        return {}
+    locked = set()
+    while True:
+        family = _families_of(db, ids)
+        needed = set(family.values()) - locked
+        # после ожидания блокировки семья могла уже слиться с другой — перечитываем
+        if not needed or not _lock(db, needed):
+            break
+        locked |= needed
+
+    # union-find по id семей: каждая компонента сливается в семью с наименьшим id
+    edges = [(family[a], family[b]) for a, b in pairs if a in family and b in family]
+    merged = {}
+    for root, group in _components(set(family.values()), edges).items():
+        old = [f for f in group if f != root]
+        if old:
+            _move(db, old, root)
+            merged.update((f, root) for f in old)
+    return merged
+
+
+def family_edges(db: Session, family_id: int):
+    # рёбра семьи: концы ребра всегда в одной семье, поэтому достаточно условия на один конец
+    r, l = models.Relation, models.PatientLink
+    relations = db.execute(
+        select(r.parent_id, r.child_id).join(P, P.id == r.parent_id).where(P.family_id == family_id)
+    ).all()
+    links = db.execute(
+        select(l.patient1_id, l.patient2_id).join(P, P.id == l.patient1_id).where(P.family_id == family_id)
+    ).all()
+    return relations + links
+
+
+def split(db: Session, family_ids):
+    # после удаления ребра или пациента; возвращает id семей, получившихся из затронутых
+    result = set()
+    for family_id in {f for f in family_ids if f is not None}:
+        _lock(db, [family_id])
+        members = db.execute(select(P.id).where(P.family_id == family_id)).scalars().all()
+        if not members:
+            continue
+        for root, component in _components(members, family_edges(db, family_id)).items():
+            result.add(root)
+            if root != family_id:
+                db.execute(
+                    update(P).where(P.id.in_(component)).values(family_id=root)
+                    .execution_options(synchronize_session=False)
+                )
+    return result
+
+
+def family_of(db: Session, patient_id: int):
+    return db.execute(select(P.family_id).where(P.id == patient_id)).scalar()
+
+
+# ---- backfill ----
+def backfill(db: Session, batch_size: int = 5000, progress=None) -> int:
+    # разовый полный пересчёт: union-find по всем рёбрам в памяти (id и рёбра — несколько десятков МБ
+    # на миллион пациентов), затем запись только изменившихся family_id пачками
+    r, l = models.Relation, models.PatientLink
+    current = dict(db.execute(select(P.id, P.family_id)).all())
+    edges = db.execute(select(r.parent_id, r.child_id)).all() + db.execute(select(l.patient1_id, l.patient2_id)).all()
+    changes = []
+    for root, component in _components(current, edges).items():
+        changes += [{"pid": pid, "fid": root} for pid in component if current[pid] != root]
+    for start in range(0, len(changes), batch_size):
+        assign(db, changes[start:start + batch_size])
+        db.commit()
+        if progress:
+            progress(start + batch_size, len(changes))
+    return len(changes)
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Семьи пациентов (patients.family_id)")
+    parser.add_argument("command", choices=("backfill",))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        print(f"updated {backfill(db, args.batch_size)} patients")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
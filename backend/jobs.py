@@ -0,0 +1,389 @@
+# backend/jobs.py
+# Фоновые задачи для тяжёлых операций (массовый импорт, выгрузка реестра, пересчёты по всему реестру),
+# которые не укладываются в таймаут запроса. Без внешнего брокера: очередь — таблица jobs в той же БД.
+#   enqueue   — запись задачи (queued), params и result — JSON;
+#   claim     — воркер забирает следующую задачу: SELECT ... FOR UPDATE SKIP LOCKED на PostgreSQL
+#               и условный UPDATE status: два воркера не получат одну задачу и на SQLite;
+#   run_job   — выполнение обработчика из HANDLERS в отдельной сессии. Прогресс и heartbeat пишутся
+#               короткими транзакциями не чаще JOBS_PROGRESS_INTERVAL; там же проверяется отмена;
+#   повтор    — упавшая задача возвращается в очередь с задержкой JOBS_RETRY_DELAY * 2^(попытка-1),
+#               пока не исчерпаны max_attempts; задача воркера, переставшего обновлять heartbeat
+#               дольше JOBS_STALE_SECONDS, забирается заново.
+# Воркеры — отдельные процессы (spawn), каждый со своим пулом соединений:
+#
+#   python -m backend.jobs worker --processes 4
+#
+# либо JOBS_WORKERS=N — столько же процессов запускает само приложение (backend/main.py).
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import auth, bulk_import, crud, export, families, linkage, models
+from . import search as search_index
+from .database import SessionLocal
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.getcwd(), "job-files"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "0"))
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+JOBS_PROGRESS_INTERVAL = float(os.getenv("JOBS_PROGRESS_INTERVAL", "1"))
+JOBS_STALE_SECONDS = int(os.getenv("JOBS_STALE_SECONDS", "300"))
+JOBS_RETRY_DELAY = float(os.getenv("JOBS_RETRY_DELAY", "30"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+J = models.Job
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---- handlers ----
+class Handler:
+    def __init__(self, fn, admin: bool, max_attempts: int):
+        self.fn = fn
+        self.admin = admin  # только для администратора (пересчёты по всему реестру)
+        self.max_attempts = max_attempts
+
+
+HANDLERS = {}
+
+
+def handler(kind: str, admin: bool = False, max_attempts: int = None):
+    # обработчик fn(db, ctx, **params) -> dict результата (JSON)
+    def register(fn):
+        HANDLERS[kind] = Handler(fn, admin, max_attempts or JOBS_MAX_ATTEMPTS)
+        return fn
+    return register
+
+
+class JobContext:
+    """Прогресс, heartbeat и отмена из обработчика; пишет в jobs отдельными короткими транзакциями."""
+
+    def __init__(self, job_id: int, created_by_id: int = None, session_factory=SessionLocal):
+        self.job_id = job_id
+        self.created_by_id = created_by_id
+        self.session_factory = session_factory
+        self._last = time.monotonic()
+
+    def principal(self, db: Session):
+        user = db.get(models.User, self.created_by_id)
+        if user is None:
+            raise RuntimeError("автор задачи удалён")
+        return auth.Principal.from_user(user)
+
+    def progress(self, done, total=None, message: str = None, force: bool = False):
+        # done/total -> доля; чаще JOBS_PROGRESS_INTERVAL не пишется. Отмена — JobCancelled
+        now = time.monotonic()
+        if not force and now - self._last < JOBS_PROGRESS_INTERVAL:
+            return
+        self._last = now
+        values = {"heartbeat_at": datetime.utcnow()}
+        if total:
+            values["progress"] = round(min(done / total, 1.0), 4)
+        if message is not None:
+            values["message"] = message
+        try:
+            with self.session_factory() as db:
+                db.execute(update(J).where(J.id == self.job_id).values(values))
+                cancel = db.execute(select(J.cancel_requested).where(J.id == self.job_id)).scalar()
+                db.commit()
+        except OperationalError:
+            # SQLite: запись заблокирована открытой транзакцией самого обработчика — отчёт пропускается
+            return
+        if cancel:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        self.progress(0, force=True)
+
+
+def job_file(job_id: int, ext: str) -> str:
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.join(JOBS_DIR, f"job-{job_id}.{ext}")
+
+
+def save_upload(stream, ext: str) -> str:
+    # загруженный файл импорта -> JOBS_DIR; путь уходит в params задачи
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = os.path.join(JOBS_DIR, f"upload-{uuid.uuid4().hex}.{ext}")
+    with open(path, "wb") as f:
+        shutil.copyfileobj(stream, f, 1 << 20)
+    return path
+
+
+class _TrackedFile(io.FileIO):
+    # позиция чтения загруженного файла -> прогресс импорта
+    def __init__(self, path: str, ctx: JobContext):
+        super().__init__(path, "rb")
+        self.ctx = ctx
+        self.size = os.path.getsize(path) or 1
+
+    def readinto(self, b):
+        n = super().readinto(b)
+        self.ctx.progress(self.tell(), self.size)
+        return n
+
+
+@handler("import", max_attempts=1)
+def _import(db: Session, ctx: JobContext, kind: str, path: str, fmt: str, source: str = "default"):
+    # не повторяется автоматически: уже зафиксированные пачки при повторе дали бы ошибки СНИЛС / external_id.
+    # Файл удаляется после успеха; после ошибки или отмены остаётся для POST /jobs/{id}/retry
+    with io.BufferedReader(_TrackedFile(path, ctx)) as f:
+        report = bulk_import.run_import(db, kind, bulk_import.open_text(f), fmt, source, ctx.created_by_id)
+    os.remove(path)
+    return report
+
+
+@handler("export.patients")
+def _export_patients(db: Session, ctx: JobContext, format: str = "csv"):
+    user = ctx.principal(db)
+    rows, _ = crud.count_patients(db, user)
+    total = rows + (format == "csv")  # строка заголовка CSV
+    path = job_file(ctx.job_id, format)
+    lines = 0
+    # во временный файл: по result_url никогда не отдаётся недописанная выгрузка
+    with open(path + ".part", "w", encoding="utf-8", newline="") as f:
+        for chunk in export.export_patients(lambda: db, user, format):
+            f.write(chunk)
+            lines += chunk.count("\n")
+            ctx.progress(lines, total)
+    os.replace(path + ".part", path)
+    # file — имя в JOBS_DIR, скачивается через GET /jobs/{id}/result
+    return {"file": os.path.basename(path), "format": format, "rows": rows, "bytes": os.path.getsize(path)}
+
+
+@handler("search.reindex", admin=True)
+def _reindex(db: Session, ctx: JobContext):
+    return {"patients": search_index.reindex(db, progress=ctx.progress)}
+
+
+@handler("families.backfill", admin=True)
+def _backfill(db: Session, ctx: JobContext):
+    return {"updated": families.backfill(db, progress=ctx.progress)}
+
+
+@handler("linkage.scan", admin=True)
+def _linkage_scan(db: Session, ctx: JobContext):
+    return linkage.scan(db, progress=ctx.progress)
+
+
+# ---- queue ----
+def enqueue(db: Session, kind: str, params: dict = None, creator_id: int = None, max_attempts: int = None):
+    if kind not in HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный тип задачи: {kind}")
+    job = models.Job(
+        kind=kind, params=params or {}, status=QUEUED, created_by_id=creator_id,
+        max_attempts=max_attempts or HANDLERS[kind].max_attempts, run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=JOBS_STALE_SECONDS)
+    return or_(
+        and_(J.status == QUEUED, J.run_after <= now),
+        # воркер умер посреди задачи
+        and_(J.status == RUNNING, J.heartbeat_at < stale),
+    )
+
+
+def claim(db: Session, worker: str):
+    # -> id задачи, переведённой в running этим воркером, или None
+    while True:
+        now = datetime.utcnow()
+        job_id = db.execute(
+            select(J.id).where(_claimable(now)).order_by(J.id).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            db.rollback()
+            return None
+        claimed = db.execute(
+            update(J).where(J.id == job_id, _claimable(now))
+            .values(status=RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=J.attempts + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return job_id
+
+
+def _finish(job_id: int, **values):
+    with SessionLocal() as db:
+        db.execute(update(J).where(J.id == job_id).values(finished_at=datetime.utcnow(), **values))
+        db.commit()
+
+
+def run_job(job_id: int):
+    with SessionLocal() as db:
+        job = db.get(J, job_id)
+        kind, params, attempts, max_attempts = job.kind, dict(job.params or {}), job.attempts, job.max_attempts
+        ctx = JobContext(job_id, job.created_by_id)
+        cancel = job.cancel_requested
+    if cancel:
+        return _finish(job_id, status=CANCELLED)
+    if attempts > max_attempts:
+        # повторный захват после смерти воркера сверх лимита попыток
+        return _finish(job_id, status=FAILED, error="воркер остановился во время выполнения")
+    try:
+        with SessionLocal() as db:
+            result = HANDLERS[kind].fn(db, ctx, **params)
+    except JobCancelled:
+        return _finish(job_id, status=CANCELLED)
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        if attempts < max_attempts:
+            delay = JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+            with SessionLocal() as db:
+                db.execute(update(J).where(J.id == job_id).values(
+                    status=QUEUED, error=error, run_after=datetime.utcnow() + timedelta(seconds=delay),
+                ))
+                db.commit()
+            return None
+        return _finish(job_id, status=FAILED, error=error)
+    _finish(job_id, status=SUCCEEDED, progress=1.0, result=result, error=None)
+
+
+def run_next(worker: str = None) -> bool:
+    # одна задача из очереди в текущем процессе; False — очередь пуста
+    with SessionLocal() as db:
+        job_id = claim(db, worker or _worker_name())
+    if job_id is None:
+        return False
+    run_job(job_id)
+    return True
+
+
+# ---- API ----
+def get_job(db: Session, job_id: int, user):
+    job = db.get(J, job_id)
+    if job is None or (user.role != "admin" and job.created_by_id != user.id):
+        return None
+    return job
+
+
+def list_jobs(db: Session, user, status: str = None, limit: int = 50):
+    query = db.query(J)
+    if user.role != "admin":
+        query = query.filter(J.created_by_id == user.id)
+    if status:
+        query = query.filter(J.status == status)
+    return query.order_by(J.id.desc()).limit(limit).all()
+
+
+def cancel(db: Session, job_id: int, user):
+    # queued — отменяется сразу, running — по флагу при следующем отчёте о прогрессе
+    job = get_job(db, job_id, user)
+    if job is None:
+        return None
+    if job.status in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Задача уже завершена: {job.status}")
+    job.cancel_requested = True
+    if job.status == QUEUED:
+        job.status = CANCELLED
+        job.finished_at = datetime.utcnow()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def retry(db: Session, job_id: int, user):
+    job = get_job(db, job_id, user)
+    if job is None:
+        return None
+    if job.status not in (FAILED, CANCELLED):
+        raise HTTPException(status_code=409, detail="Повторить можно только упавшую или отменённую задачу")
+    if job.kind == "import" and not os.path.exists(job.params.get("path", "")):
+        raise HTTPException(status_code=409, detail="Файл импорта уже удалён — загрузите его заново")
+    job.status, job.attempts, job.cancel_requested = QUEUED, 0, False
+    job.run_after, job.started_at, job.finished_at, job.error = datetime.utcnow(), None, None, None
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def result_file(job) -> str:
+    # путь к файлу результата (выгрузка) или None
+    name = (job.result or {}).get("file")
+    if job.status != SUCCEEDED or not name:
+        return None
+    path = os.path.join(JOBS_DIR, os.path.basename(name))
+    return path if os.path.exists(path) else None
+
+
+def get_result_file(db: Session, job_id: int, user):
+    job = get_job(db, job_id, user)
+    return result_file(job) if job is not None else None
+
+
+# ---- workers ----
+def _worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(max_jobs: int = None, poll: float = None):
+    # цикл воркера: SIGTERM / SIGINT — остановка после текущей задачи
+    poll = JOBS_POLL_SECONDS if poll is None else poll
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.append(True))
+    name, done = _worker_name(), 0
+    while not stopping and (max_jobs is None or done < max_jobs):
+        if run_next(name):
+            done += 1
+        else:
+            time.sleep(poll)
+    return done
+
+
+def start_pool(processes: int):
+    # отдельные процессы (spawn: свой интерпретатор и свои соединения) — задачи занимают все ядра
+    context = multiprocessing.get_context("spawn")
+    pool = [context.Process(target=work, name=f"jobs-worker-{i}", daemon=True) for i in range(processes)]
+    for p in pool:
+        p.start()
+    return pool
+
+
+def stop_pool(pool, timeout: float = 10):
+    for p in pool:
+        p.terminate()  # SIGTERM: текущая задача дописывается
+    for p in pool:
+        p.join(timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воркеры фоновых задач")
+    parser.add_argument("command", choices=("worker",))
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    pool = start_pool(args.processes)
+    # SIGTERM / SIGINT родителю — остановить воркеры (каждый дописывает текущую задачу) и выйти
+    signal.signal(signal.SIGTERM, lambda *_: stop_pool(pool))
+    signal.signal(signal.SIGINT, lambda *_: stop_pool(pool))
+    for p in pool:
+        p.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# backend/kinship.py
+# Коэффициенты родства (kinship) и инбридинга для каскадного скрининга СГХС.
+# Табличный метод: φ(i, j) — вероятность, что случайные аллели i и j идентичны по происхождению.
+#   основатель:                 φ(i, i) = 1/2, с другими основателями φ = 0;
+#   ребёнок c с родителями p, q: φ(c, j) = (φ(p, j) + φ(q, j)) / 2 для всех j старше c,
+#                                φ(c, c) = (1 + φ(p, q)) / 2, инбридинг F(c) = φ(p, q).
+# Неизвестный родитель — фиктивный основатель: последняя, нулевая строка матрицы.
+# Люди раскладываются по слоям (слой = 1 + слой старшего из родителей), и весь слой считается
+# несколькими векторными операциями NumPy — число шагов равно числу поколений, а не людей.
+# Матрица float32: на 5000 человек около 100 МБ, отсюда предел KINSHIP_MAX_NODES.
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from .pedigree import HORIZONTAL, link_kind
+
+KINSHIP_MAX_NODES = int(os.getenv("KINSHIP_MAX_NODES", "5000"))
+# полная матрица в ответе (matrix=true) — только для небольших семей
+KINSHIP_MATRIX_MAX_NODES = int(os.getenv("KINSHIP_MATRIX_MAX_NODES", "500"))
+
+
+def parent_map(relations, links, nodes):
+    # родители каждого человека (не больше двух). Сибсы, связанные только ссылкой sibling,
+    # получают общих родителей: известных, если они записаны у кого-то из сибсов,
+    # иначе пару фиктивных основателей (отрицательные id, в ответ не попадают)
+    parents = defaultdict(list)
+    for r in relations:
+        if r.parent_id != r.child_id and r.parent_id not in parents[r.child_id] and len(parents[r.child_id]) < 2:
+            parents[r.child_id].append(r.parent_id)
+
+    group = {n: n for n in nodes}
+
+    def find(x):
+        while group[x] != x:
+            group[x] = group[group[x]]
+            x = group[x]
+        return x
+
+    for l in links:
+        if link_kind(l.link_type) == HORIZONTAL and l.patient1_id in group and l.patient2_id in group:
+            group[find(l.patient1_id)] = find(l.patient2_id)
+    sibships = defaultdict(list)
+    for n in nodes:
+        sibships[find(n)].append(n)
+    virtual = 0
+    for members in sibships.values():
+        if len(members) < 2:
+            continue
+        known = next((parents[m] for m in sorted(members) if parents.get(m)), None)
+        if known is None:
+            virtual -= 2
+            known = [virtual, virtual + 1]
+        for m in members:
+            if not parents.get(m):
+                parents[m] = list(known)
+    return parents
+
+
+def pedigree_layers(nodes, parents):
+    # слои сверху вниз: родители всегда в более ранних слоях.
+    # Связь, замыкающая цикл («пациент — свой предок»), отбрасывается и возвращается в broken
+    children = defaultdict(list)
+    pending = {}
+    for n in nodes:
+        pending[n] = len(parents.get(n, ()))
+        for p in parents.get(n, ()):
+            children[p].append(n)
+    remaining = set(nodes)
+    placed = set()
+    layers, broken = [], []
+    layer = sorted(n for n in nodes if pending[n] == 0)
+    while remaining:
+        if not layer:
+            node = min(remaining)
+            broken += [(p, node) for p in parents[node] if p not in placed]
+            parents[node] = [p for p in parents[node] if p in placed]
+            layer = [node]
+        layers.append(layer)
+        placed.update(layer)
+        remaining.difference_update(layer)
+        following = []
+        for n in layer:
+            for c in children.get(n, ()):
+                if c in remaining:
+                    pending[c] -= 1
+                    if pending[c] == 0:
+                        following.append(c)
+        layer = sorted(following)
+    return layers, broken
+
+
+def kinship_matrix(nodes, parents):
+    # -> (порядок id, матрица φ в этом порядке, отброшенные связи)
+    layers, broken = pedigree_layers(nodes, parents)
+    order = [n for layer in layers for n in layer]
+    index = {n: k for k, n in enumerate(order)}
+    n = len(order)
+    unknown = n
+    phi = np.zeros((n + 1, n + 1), dtype=np.float32)
+    start = 0
+    for layer in layers:
+        end = start + len(layer)
+        pairs = [parents.get(c, ()) for c in layer]
+        p = np.array([index[ps[0]] if len(ps) > 0 else unknown for ps in pairs])
+        q = np.array([index[ps[1]] if len(ps) > 1 else unknown for ps in pairs])
+        if start:
+            # с предыдущими слоями
+            block = 0.5 * (phi[p, :start] + phi[q, :start])
+            phi[start:end, :start] = block
+            phi[:start, start:end] = block.T
+        # внутри слоя: φ(i, j) = (φ(j, p_i) + φ(j, q_i)) / 2, а φ(j, p_i) уже посчитан шагом выше
+        rows = phi[start:end]
+        phi[start:end, start:end] = 0.5 * (rows[:, p] + rows[:, q]).T
+        phi[np.arange(start, end), np.arange(start, end)] = 0.5 * (1 + phi[p, q])
+        start = end
+    return order, phi[:n, :n], broken
+
+
+def degrees(coefficients):
+    # степень родства по φ: 1/4 — первая (родители, дети, сибсы), 1/8 — вторая, 1/16 — третья.
+    # При инбридинге φ не равен точной степени двойки — берётся ближайшая степень
+    result = np.full(coefficients.shape, -1, dtype=np.int64)
+    related = coefficients > 0
+    result[related] = np.maximum(1, np.rint(-np.log2(coefficients[related]) - 1))
+    return result
+
+
+def family_kinship(patient_id: int, component, relations, links, matrix: bool = False):
+    # чистый CPU, без БД: как crud.assemble_pedigree, выполняется в threadpool
+    nodes = set(component) | {patient_id}
+    parents = parent_map(relations, links, nodes)
+    nodes |= {p for ps in parents.values() for p in ps}
+    order, phi, broken = kinship_matrix(nodes, parents)
+    # фиктивные основатели (отрицательные id) из ответа исключаются; подматрицу не копируем
+    real = np.array([k for k, n in enumerate(order) if n > 0])
+    ids = [order[k] for k in real]
+    proband = order.index(patient_id)
+    row = phi[proband, real]
+    inbreeding = 2 * phi.diagonal()[real] - 1
+    degree = degrees(row)
+
+    relatives = []
+    for k in np.lexsort((np.array(ids), -row)):
+        pid = ids[k]
+        if pid == patient_id:
+            continue
+        relatives.append({
+            "id": pid,
+            "kinship": round(float(row[k]), 6),
+            "relatedness": round(float(2 * row[k]), 6),
+            "degree": int(degree[k]) if degree[k] > 0 else None,
+            "inbreeding": round(float(inbreeding[k]), 6),
+        })
+    result = {
+        "proband": patient_id,
+        "inbreeding": round(float(2 * phi[proband, proband] - 1), 6),
+        "relatives": relatives,
+        "ignored": [{"source": a, "target": b, "type": "vertical"} for a, b in broken],
+        # семья обрезана по KINSHIP_MAX_NODES: дальние родственники могли не попасть в расчёт
+        "truncated": len(component) >= KINSHIP_MAX_NODES,
+    }
+    if matrix:
+        values = phi[np.ix_(real, real)].astype(np.float64)
+        result["matrix"] = {"ids": ids, "values": np.round(values, 6).tolist()}
+    return result
+
@@ -0,0 +1,289 @@
+# backend/layout.py
+# Раскладка генограммы на сервере: готовые x / y, клиенту не нужна физическая симуляция.
+#   строки  — поколения (поле generation из crud.assemble_pedigree), y = ROW_HEIGHT * номер строки;
+#   блоки   — супруги одного поколения стоят рядом (цепочка браков — один блок);
+#   сибсы   — дети одних родителей идут подряд, по дате рождения;
+#   порядок — барицентрический метод: проходы вниз и вверх по строкам, пока уменьшается число
+#             пересечений вертикальных связей между соседними строками;
+#   x       — строки упаковываются слева направо, дети по возможности под родителями, родители над детьми.
+# Раскладка детерминирована: одна и та же семья — одни и те же координаты (и тот же ETag).
+import os
+from collections import defaultdict
+
+from .pedigree import HORIZONTAL, SPOUSE, VERTICAL
+
+NODE_SPACING = 80.0   # между центрами соседних людей
+GROUP_GAP = 40.0      # дополнительный зазор между разными сибствами
+ROW_HEIGHT = 150.0
+LAYOUT_SWEEPS = int(os.getenv("LAYOUT_SWEEPS", "8"))
+
+
+class _UnionFind:
+    def __init__(self, items):
+        self.parent = {x: x for x in items}
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _birth_key(node):
+    # старшие слева; без даты рождения — в конце, затем по id
+    return (node.get("dob") is None, str(node.get("dob") or ""), node["id"])
+
+
+def _spouse_units(row, spouses):
+    # блоки строки: компоненты супружеских связей внутри поколения.
+    # Порядок внутри блока — обход от крайнего (степень <= 1) члена с наименьшим id:
+    # у человека с двумя браками он оказывается между супругами
+    members = set(row)
+    uf = _UnionFind(row)
+    for a in row:
+        for b in spouses.get(a, ()):
+            if b in members:
+                uf.union(a, b)
+    groups = defaultdict(list)
+    for n in row:
+        groups[uf.find(n)].append(n)
+    units = []
+    for group in groups.values():
+        inside = {n: sorted(b for b in spouses.get(n, ()) if b in members and b != n) for n in group}
+        ends = [n for n in group if len(set(inside[n])) <= 1]
+        start = min(ends or group)
+        order, seen, stack = [], {start}, [start]
+        while stack:
+            n = stack.pop()
+            order.append(n)
+            for b in reversed(inside[n]):
+                if b not in seen:
+                    seen.add(b)
+                    stack.append(b)
+        units.append(tuple(order))
+    return units
+
+
+def _crossings(edges, size):
+    # пересечения между соседними строками: пары рёбер (a1 < a2, b1 > b2), дерево Фенвика
+    tree = [0] * (size + 1)
+    total = inserted = 0
+    edges = sorted(edges)
+    k = 0
+    while k < len(edges):
+        a = edges[k][0]
+        end = k
+        while end < len(edges) and edges[end][0] == a:
+            end += 1
+        for _, b in edges[k:end]:
+            i, below = b + 1, 0
+            while i > 0:
+                below += tree[i]
+                i -= i & -i
+            total += inserted - below
+        for _, b in edges[k:end]:
+            i = b + 1
+            while i <= size:
+                tree[i] += 1
+                i += i & -i
+            inserted += 1
+        k = end
+    return total
+
+
+class _Layout:
+    def __init__(self, nodes, links):
+        self.node = {n["id"]: n for n in nodes}
+        generation = {n["id"]: n.get("generation", 0) for n in nodes}
+        gens = sorted(set(generation.values()))
+        self.row_of_gen = {g: k for k, g in enumerate(gens)}
+
+        parents, spouses = defaultdict(list), defaultdict(list)
+        siblings = []
+        for l in links:
+            a, b, kind = l["source"], l["target"], l["type"]
+            if a not in self.node or b not in self.node or a == b:
+                continue
+            if kind == VERTICAL and generation[b] == generation[a] + 1:
+                parents[b].append(a)
+            elif kind == SPOUSE and generation[a] == generation[b]:
+                spouses[a].append(b)
+                spouses[b].append(a)
+            elif kind == HORIZONTAL and generation[a] == generation[b]:
+                siblings.append((a, b))
+
+        # сибство: общие родители или явная связь sibling
+        sibship = _UnionFind(self.node)
+        first_by_parents = {}
+        for child, ps in parents.items():
+            key = tuple(sorted(set(ps)))
+            sibship.union(child, first_by_parents.setdefault(key, child))
+        for a, b in siblings:
+            sibship.union(a, b)
+        has_family = set(parents) | {x for pair in siblings for x in pair}
+
+        rows = defaultdict(list)
+        for pid in sorted(self.node):
+            rows[self.row_of_gen[generation[pid]]].append(pid)
+        self.rows = []       # строка -> список блоков (текущий порядок)
+        self.unit_of = {}
+        self.sibship = {}    # блок -> ключ сибства
+        self.birth = {}
+        for r in range(len(gens)):
+            units = _spouse_units(rows[r], spouses)
+            for unit in units:
+                for pid in unit:
+                    self.unit_of[pid] = unit
+                blood = next((pid for pid in unit if pid in has_family), None)
+                self.sibship[unit] = sibship.find(blood) if blood is not None else unit[0]
+                self.birth[unit] = _birth_key(self.node[blood if blood is not None else unit[0]])
+            self.rows.append(sorted(units, key=lambda u: (self.sibship[u], self.birth[u])))
+
+        # связи между блоками соседних строк (без повторов: двое родителей одного блока — одно ребро)
+        self.up = defaultdict(set)
+        self.down = defaultdict(set)
+        for child, ps in parents.items():
+            for p in ps:
+                self.up[self.unit_of[child]].add(self.unit_of[p])
+                self.down[self.unit_of[p]].add(self.unit_of[child])
+        self.parents = parents
+        self.flipped = set()  # блоки супругов, развёрнутые справа налево
+
+    # ---- порядок ----
+    def _positions(self, row):
+        return {u: k for k, u in enumerate(row)}
+
+    def _reorder(self, r, neighbours, reference):
+        row = self.rows[r]
+        pos = self._positions(row)
+        ref = self._positions(reference)
+        bary = {}
+        for u in row:
+            linked = [ref[v] for v in neighbours.get(u, ()) if v in ref]
+            bary[u] = sum(linked) / len(linked) if linked else float(pos[u])
+        # сибство двигается целиком: ключ — среднее барицентров его блоков
+        groups = defaultdict(list)
+        for u in row:
+            groups[self.sibship[u]].append(bary[u])
+        group_bary = {key: sum(v) / len(v) for key, v in groups.items()}
+        self.rows[r] = sorted(row, key=lambda u: (group_bary[self.sibship[u]], self.sibship[u], self.birth[u]))
+
+    def crossings(self):
+        total = 0
+        for r in range(len(self.rows) - 1):
+            upper, lower = self._positions(self.rows[r]), self._positions(self.rows[r + 1])
+            edges = [(upper[u], lower[c]) for u in self.rows[r] for c in self.down.get(u, ())]
+            total += _crossings(edges, len(lower))
+        return total
+
+    def order(self, sweeps: int):
+        best = [list(row) for row in self.rows]
+        best_crossings = self.crossings()
+        for _ in range(sweeps):
+            for r in range(1, len(self.rows)):
+                self._reorder(r, self.up, self.rows[r - 1])
+            for r in range(len(self.rows) - 2, -1, -1):
+                self._reorder(r, self.down, self.rows[r + 1])
+            current = self.crossings()
+            if current >= best_crossings:
+                break
+            best, best_crossings = [list(row) for row in self.rows], current
+        self.rows = best
+        return best_crossings
+
+    # ---- координаты ----
+    def _gap(self, left, right):
+        return NODE_SPACING + (GROUP_GAP if self.sibship[left] != self.sibship[right] else 0.0)
+
+    def members(self, unit):
+        return unit[::-1] if unit in self.flipped else unit
+
+    def _x(self, left, pid):
+        unit = self.unit_of[pid]
+        return left[unit] + self.members(unit).index(pid) * NODE_SPACING
+
+    def _orient(self, unit, left):
+        # супруг, чьи родители левее, ставится левее: разворот блока, если так меньше перекрещенных пар
+        above = []
+        for pid in unit:
+            xs = [self._x(left, p) for p in self.parents.get(pid, ())]
+            above.append(sum(xs) / len(xs) if xs else None)
+        known = [x for x in above if x is not None]
+        inversions = sum(1 for i, a in enumerate(known) for b in known[i + 1:] if a > b)
+        ordered = sum(1 for i, a in enumerate(known) for b in known[i + 1:] if a < b)
+        if inversions > ordered:
+            self.flipped.add(unit)
+
+    def coordinates(self):
+        left = {}
+        # сверху вниз: сибство по центру под родителями, без наложений слева направо
+        for r, row in enumerate(self.rows):
+            if r:
+                for unit in row:
+                    if len(unit) > 1:
+                        self._orient(unit, left)
+            prev = None
+            k = 0
+            while k < len(row):
+                end = k
+                while end < len(row) and self.sibship[row[end]] == self.sibship[row[k]]:
+                    end += 1
+                group = row[k:end]
+                width = sum((len(u) - 1) * NODE_SPACING for u in group) + NODE_SPACING * (len(group) - 1)
+                start = left[prev] + (len(prev) - 1) * NODE_SPACING + self._gap(prev, group[0]) if prev else 0.0
+                parent_x = [self._x(left, p) for u in group for pid in u for p in self.parents.get(pid, ())]
+                if r and parent_x:
+                    start = max(start, sum(parent_x) / len(parent_x) - width / 2)
+                for u in group:
+                    left[u] = start
+                    start += len(u) * NODE_SPACING
+                prev = group[-1]
+                k = end
+        # снизу вверх: блок с детьми сдвигается вправо к их центру, если справа есть место
+        for r in range(len(self.rows) - 2, -1, -1):
+            row = self.rows[r]
+            for k in range(len(row) - 1, -1, -1):
+                u = row[k]
+                kids = [left[c] + (len(c) - 1) * NODE_SPACING / 2 for c in self.down.get(u, ())]
+                if not kids:
+                    continue
+                desired = sum(kids) / len(kids) - (len(u) - 1) * NODE_SPACING / 2
+                if k + 1 < len(row):
+                    following = row[k + 1]
+                    desired = min(desired, left[following] - self._gap(u, following) - (len(u) - 1) * NODE_SPACING)
+                left[u] = max(left[u], desired)
+        return left
+
+
+def genogram_layout(payload, sweeps: int = None):
+    # payload генограммы -> новый payload с x / y у узлов и сводкой layout; исходный не меняется
+    # (он может лежать в кэше)
+    nodes, links = payload.get("nodes", []), payload.get("links", [])
+    if not nodes:
+        return {**payload, "layout": {"width": 0.0, "height": 0.0, "crossings": 0}}
+    layout = _Layout(nodes, links)
+    crossings = layout.order(LAYOUT_SWEEPS if sweeps is None else sweeps)
+    left = layout.coordinates()
+    shift = min(left.values())
+    position = {}
+    for r, row in enumerate(layout.rows):
+        for unit in row:
+            # целые координаты: округление монотонно, зазоры между людьми не меньше NODE_SPACING
+            x = float(round(left[unit] - shift))
+            for k, pid in enumerate(layout.members(unit)):
+                position[pid] = (x + k * NODE_SPACING, r * ROW_HEIGHT)
+    placed = [{**n, "x": position[n["id"]][0], "y": position[n["id"]][1]} for n in nodes]
+    return {
+        **payload,
+        "nodes": placed,
+        "layout": {
+            "width": max(x for x, _ in position.values()),
+            "height": (len(layout.rows) - 1) * ROW_HEIGHT,
+            "crossings": crossings,
+        },
+    }
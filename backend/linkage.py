@@ -0,0 +1,283 @@
+# backend/linkage.py
+# Поиск и слияние дублей пациентов (данные приходят с нескольких центров, СНИЛС есть не у всех).
+# Блокировка: сравниваются только пациенты с одинаковым patients.link_key — фонетическая фамилия
+# и год рождения (search.link_key, колонка с индексом). Внутри блока пара оценивается score()
+# по фамилии, имени, отчеству, дате рождения и полу; пары не ниже LINKAGE_THRESHOLD
+# записываются в patient_matches (pending) и ждут решения: слить (merge) или отклонить (dismissed).
+#   check_new — при вставке: один запрос по индексу link_key на пачку новых пациентов;
+#   scan      — весь регистр: проход по link_key в порядке индекса, блок за блоком.
+#               Сравнений — сумма квадратов размеров блоков, а не n²; блок больше LINKAGE_MAX_BLOCK
+#               сравнивается окном LINKAGE_WINDOW по отсортированным имени и дате (sorted neighbourhood);
+#   merge     — перенос relations, patient_links, traits и import_keys дубля на оставляемого пациента
+#               в транзакции вызывающего кода (commit — в crud.merge_patients).
+#
+#   python -m backend.linkage scan   — пакетный поиск дублей по всему регистру
+import argparse
+import difflib
+import os
+import sys
+from datetime import date
+from itertools import groupby
+
+from sqlalchemy import Boolean, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import families, models
+from .search import normalize_text
+
+LINKAGE_THRESHOLD = float(os.getenv("LINKAGE_THRESHOLD", "0.85"))
+LINKAGE_MAX_BLOCK = int(os.getenv("LINKAGE_MAX_BLOCK", "500"))
+LINKAGE_WINDOW = int(os.getenv("LINKAGE_WINDOW", "50"))
+
+P = models.Patient
+M = models.PatientMatch
+
+COLUMNS = (P.id, P.family_name, P.given_name, P.middle_name, P.dob, P.sex, P.snils, P.link_key)
+
+# вес поля в оценке; поле, пустое хотя бы у одного из пары, в оценке не участвует
+WEIGHTS = {"family_name": 0.3, "given_name": 0.25, "middle_name": 0.15, "dob": 0.3}
+
+# ---- scoring ----
+def _name_similarity(a: str, b: str) -> float:
+    a, b = normalize_text(a).rstrip("."), normalize_text(b).rstrip(".")
+    if a == b:
+        return 1.0
+    # инициал против полного имени: «И.» и «Иван»
+    if (len(a) == 1 and b.startswith(a)) or (len(b) == 1 and a.startswith(b)):
+        return 0.8
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _dob_similarity(a, b) -> float:
+    if a == b:
+        return 1.0
+    if a.year != b.year:
+        return 0.0
+    # перепутаны день и месяц — частая ошибка ввода
+    if (a.day, a.month) == (b.month, b.day):
+        return 0.8
+    if a.month == b.month or a.day == b.day:
+        return 0.5
+    return 0.0
+
+
+def score(a, b) -> float:
+    # a, b — строки с полями COLUMNS (или ORM-объекты / схемы); 0 — точно разные люди
+    if a.sex and b.sex and a.sex != b.sex:
+        return 0.0
+    if a.snils and b.snils and a.snils != b.snils:
+        return 0.0
+    total = weight = 0.0
+    for field, w in WEIGHTS.items():
+        x, y = getattr(a, field), getattr(b, field)
+        if not x or not y:
+            continue
+        total += w * (_dob_similarity(x, y) if field == "dob" else _name_similarity(x, y))
+        weight += w
+    # одно совпавшее поле — ещё не дубль: нужна хотя бы половина веса
+    if weight < 0.5:
+        return 0.0
+    return round(total / weight, 3)
+
+
+def _pairs(block):
+    # пары внутри блока: все со всеми или окном по (имя, отчество, дата) для больших блоков
+    if len(block) <= LINKAGE_MAX_BLOCK:
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                yield a, b
+        return
+    ordered = sorted(block, key=lambda r: (normalize_text(r.given_name), normalize_text(r.middle_name), r.dob or date.min))
+    for i, a in enumerate(ordered):
+        for b in ordered[i + 1:i + 1 + LINKAGE_WINDOW]:
+            yield a, b
+
+
+def _ordered(a: int, b: int):
+    return (a, b) if a < b else (b, a)
+
+
+def record(db: Session, matches) -> int:
+    # matches: [(id, id, score)]; пары, уже записанные (в т.ч. отклонённые), не повторяются
+    found = {}
+    for a, b, s in matches:
+        found[_ordered(a, b)] = s
+    if not found:
+        return 0
+    ids = {a for a, _ in found}
+    existing = set(db.execute(select(M.patient_id, M.candidate_id).where(M.patient_id.in_(ids))).all())
+    rows = [{"patient_id": a, "candidate_id": b, "score": s, "status": "pending"}
+            for (a, b), s in found.items() if (a, b) not in existing]
+    if rows:
+        db.execute(models.PatientMatch.__table__.insert(), rows)
+    return len(rows)
+
+
+# ---- incremental ----
+def candidates(db: Session, patient, threshold: float = None, exclude=()):
+    # [(строка, оценка)] по убыванию оценки: пациенты из того же блока, похожие на patient
+    threshold = LINKAGE_THRESHOLD if threshold is None else threshold
+    key = patient.link_key
+    if key is None:
+        return []
+    rows = db.execute(select(*COLUMNS).where(P.link_key == key, P.id.notin_([patient.id, *exclude]))).all()
+    scored = [(row, score(patient, row)) for row in rows]
+    return sorted([(row, s) for row, s in scored if s >= threshold], key=lambda x: (-x[1], x[0].id))
+
+
+def check_new(db: Session, patient_ids) -> int:
+    # после вставки: новые пациенты сравниваются со всеми в своих блоках одним запросом
+    if not patient_ids:
+        return 0
+    new = db.execute(select(*COLUMNS).where(P.id.in_(list(patient_ids)), P.link_key.isnot(None))).all()
+    keys = {r.link_key for r in new}
+    if not keys:
+        return 0
+    blocks = {}
+    for row in db.execute(select(*COLUMNS).where(P.link_key.in_(keys))).all():
+        blocks.setdefault(row.link_key, []).append(row)
+    new_ids = {r.id for r in new}
+    matches = []
+    for r in new:
+        for other in blocks[r.link_key]:
+            # пара из двух новых — один раз
+            if other.id == r.id or (other.id in new_ids and other.id < r.id):
+                continue
+            s = score(r, other)
+            if s >= LINKAGE_THRESHOLD:
+                matches.append((r.id, other.id, s))
+    return record(db, matches)
+
+
+# ---- batch ----
+def scan(db: Session, batch_size: int = 5000, threshold: float = None, progress=None) -> dict:
+    # весь регистр по порядку link_key (индекс): держится в памяти только текущая пачка блоков.
+    # progress(сделано, всего) — по мере записи найденных пар (фоновая задача, backend/jobs.py)
+    threshold = LINKAGE_THRESHOLD if threshold is None else threshold
+    stats = {"patients": 0, "blocks": 0, "compared": 0, "matches": 0}
+    total = db.execute(select(func.count(P.id)).where(P.link_key.isnot(None))).scalar() if progress else 0
+    rows = db.execute(
+        select(*COLUMNS).where(P.link_key.isnot(None)).order_by(P.link_key, P.id).execution_options(yield_per=batch_size)
+    )
+    matches = []
+    for _, group in groupby(rows, key=lambda r: r.link_key):
+        block = list(group)
+        stats["patients"] += len(block)
+        stats["blocks"] += 1
+        for a, b in _pairs(block):
+            stats["compared"] += 1
+            s = score(a, b)
+            if s >= threshold:
+                matches.append((a.id, b.id, s))
+        if len(matches) >= batch_size:
+            stats["matches"] += record(db, matches)
+            matches = []
+        if progress:
+            progress(stats["patients"], total)
+    stats["matches"] += record(db, matches)
+    db.commit()
+    return stats
+
+
+# ---- merge ----
+def _repoint(db: Session, model, ends, keep_id: int, duplicate_id: int, symmetric: bool, kind=None):
+    # рёбра дубля переписываются на keep; петли и повторы существующих рёбер удаляются
+    a, b = (getattr(model, e) for e in ends)
+    columns = [model.id, a, b] + ([getattr(model, kind)] if kind else [])
+    rows = db.execute(
+        select(*columns).where(or_(a.in_([keep_id, duplicate_id]), b.in_([keep_id, duplicate_id]))).order_by(model.id)
+    ).all()
+    seen, drop, moved = set(), [], []
+
+    def mapped(x):
+        return keep_id if x == duplicate_id else x
+
+    for row in rows:
+        x, y = mapped(row[1]), mapped(row[2])
+        key = (frozenset((x, y)) if symmetric else (x, y), row[3] if kind else None)
+        if x == y or key in seen:
+            drop.append(row.id)
+            continue
+        seen.add(key)
+        if (x, y) != (row[1], row[2]):
+            moved.append((row.id, x, y))
+    if drop:
+        db.execute(delete(model).where(model.id.in_(drop)).execution_options(synchronize_session=False))
+    for edge_id, x, y in moved:
+        db.execute(
+            update(model).where(model.id == edge_id).values({ends[0]: x, ends[1]: y})
+            .execution_options(synchronize_session=False)
+        )
+
+
+def merge(db: Session, keep, duplicate):
+    # keep, duplicate — ORM-объекты Patient; duplicate удаляется. Без commit
+    keep_id, duplicate_id = keep.id, duplicate.id
+    # семьи сливаются заранее: рёбра дубля после переноса связывают их через keep
+    families.union(db, [(keep_id, duplicate_id)])
+
+    # пустые поля keep дополняются из дубля, факторы риска — «или»
+    snils = duplicate.snils
+    for column in P.__table__.columns:
+        field = column.key
+        if field in ("id", "created_by_id", "family_id", "search_name", "snils_digits", "link_key"):
+            continue
+        value = getattr(duplicate, field)
+        if isinstance(column.type, Boolean):
+            setattr(keep, field, bool(getattr(keep, field)) or bool(value))
+        elif getattr(keep, field) is None and value is not None and field != "snils":
+            setattr(keep, field, value)
+    if keep.snils is None and snils:
+        # СНИЛС уникален: сначала освобождается у дубля
+        duplicate.snils = None
+        db.flush()
+        keep.snils = snils
+    db.flush()
+
+    _repoint(db, models.Relation, ("parent_id", "child_id"), keep_id, duplicate_id, symmetric=False)
+    _repoint(db, models.PatientLink, ("patient1_id", "patient2_id"), keep_id, duplicate_id, symmetric=True,
+             kind="link_type")
+    t = models.Trait
+    have = set(db.execute(select(t.name, t.onset_age).where(t.patient_id == keep_id)).all())
+    repeated = [row.id for row in db.execute(select(t.id, t.name, t.onset_age).where(t.patient_id == duplicate_id))
+                if (row.name, row.onset_age) in have]
+    if repeated:
+        db.execute(delete(t).where(t.id.in_(repeated)).execution_options(synchronize_session=False))
+    for model in (models.Trait, models.ImportKey):
+        db.execute(
+            update(model).where(model.patient_id == duplicate_id).values(patient_id=keep_id)
+            .execution_options(synchronize_session=False)
+        )
+    db.execute(
+        delete(M).where(or_(M.patient_id == duplicate_id, M.candidate_id == duplicate_id))
+        .execution_options(synchronize_session=False)
+    )
+    family_id = families.family_of(db, keep_id)
+    # дубль уже без связей: удаляется мимо ORM-каскадов по перенесённым строкам
+    db.expunge(duplicate)
+    db.execute(delete(P).where(P.id == duplicate_id).execution_options(synchronize_session=False))
+    # id семьи — наименьший id члена; если им был дубль, семья получает новый id
+    families.split(db, [family_id])
+    db.expire(keep)
+    return keep
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Поиск дублей пациентов")
+    parser.add_argument("command", choices=("scan",))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        stats = scan(db, args.batch_size, args.threshold)
+        print(" ".join(f"{k}={v}" for k, v in stats.items()))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
 # backend/main.py
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from . import models, schemas, crud, auth
-from .database import SessionLocal, engine, Base
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas, crud, crud_async, auth, bulk_import, export, jobs, metrics, profiling
+from .database import SessionLocal, AsyncSessionLocal, engine, async_engine, Base
+from .cache import pedigree_cache, etag_matches
+from .responses import JSON, MSGPACK, FastJSONResponse, RawJSONResponse, dump_models, negotiate
 from datetime import datetime, timedelta
 from typing import List
 from fastapi.middleware.cors import CORSMiddleware  # ОДИН импорт
@@ -11,13 +15,28 @@ import os
 from fastapi import Path
 from typing import Optional
 from fastapi import Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import uvicorn
 
 # create tables if not exist
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Pedigree MVP API")
+# orjson для всех ответов; горячие эндпоинты ещё и минуют повторную валидацию (backend/responses.py)
+app = FastAPI(title="Pedigree MVP API", default_response_class=FastJSONResponse)
+
+# метрики: задержка по маршрутам, SQL-запросы на запрос, пул соединений, кэши
+metrics.instrument_engine(engine, "sync")
+metrics.instrument_engine(async_engine.sync_engine, "async")
+metrics.state.add("pedigree", pedigree_cache.stats)
+metrics.state.add("principal", auth.principal_cache.stats)
+metrics.state.add("password_hasher", auth.password_hasher.stats)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# профилирование запросов — только по PROFILE_REQUESTS: события движка на каждое SQL-выражение
+if profiling.PROFILE_REQUESTS:
+    profiling.instrument_engine(engine)
+    profiling.instrument_engine(async_engine.sync_engine)
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 origins = [
     "http://localhost:3000",                   # Для локальной разработки
@@ -34,13 +53,22 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
+    # синхронная сессия — для обработчиков, которые сами работают в threadpool (массовый импорт)
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
+
 # Корневой эндпоинт
 @app.get("/")
 def read_root():
@@ -62,23 +90,25 @@ def read_root():
             },
             "patients": {
                 "list": "GET /patients",
+                "export": "GET /patients/export?format=csv|ndjson|ped",
                 "create": "POST /patients",
                 "get": "GET /patients/{id}",
                 "update": "PUT /patients/{id}",
                 "delete": "DELETE /patients/{id}"
             },
-            "pedigree": "GET /pedigree/{patient_id}"
+            "pedigree": "GET /pedigree/{patient_id}",
+            "cohort": "POST /cohort",
+            "import": "POST /import/{patients|traits|relations|links|ped}"
         }
     }
 
 # Health check для Render
 @app.get("/health")
-def health_check():
+async def health_check():
     try:
         # Проверяем подключение к базе данных
-        db = SessionLocal()
-        db.execute("SELECT 1")
-        db.close()
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
@@ -87,38 +117,100 @@ def health_check():
         "status": "healthy",
         "service": "pedigree-backend",
         "database": db_status,
+        "pedigree_cache": pedigree_cache.stats(),
+        "password_hasher": auth.password_hasher.stats(),
         "timestamp": datetime.utcnow().isoformat(),
         "environment": os.getenv("ENVIRONMENT", "production")
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    data, content_type = metrics.render()
+    return Response(content=data, media_type=content_type)
+
 @app.post("/register", response_model=schemas.UserOut)
-def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = crud.get_user_by_email(db, user_in.email)
+async def register(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    # bcrypt считается в пуле процессов, запросы к БД — через асинхронный драйвер
+    existing = await crud_async.get_user_by_email(db, user_in.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    user = crud.create_user(db, user_in)
+    hashed = await hash_password(user_in.password)
+    user = await crud_async.create_user(db, user_in, hashed)
     return user
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await crud_async.get_user_by_email(db, form_data.username)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect credentials")
+    ok, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Incorrect credentials")
+    if new_hash:
+        await crud_async.update_password_hash(db, user, new_hash)
     access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60")))
-    token = auth.create_access_token(data={"sub": user.email, "role": user.role}, expires_delta=access_token_expires)
+    token = auth.create_access_token(data={"sub": user.email, "role": user.role, "uid": user.id}, expires_delta=access_token_expires)
     return {"access_token": token, "token_type": "bearer"}
 
+async def hash_password(password: str):
+    try:
+        return await auth.password_hasher.hash(password)
+    except auth.PasswordQueueFull:
+        raise HTTPException(status_code=503, detail="Too many concurrent logins", headers={"Retry-After": "1"})
+
+async def verify_password(password: str, hashed_password: str):
+    try:
+        return await auth.password_hasher.verify_and_update(password, hashed_password)
+    except auth.PasswordQueueFull:
+        raise HTTPException(status_code=503, detail="Too many concurrent logins", headers={"Retry-After": "1"})
+
+@app.on_event("startup")
+def start_password_hasher():
+    auth.password_hasher.start()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    auth.password_hasher.shutdown()
+
+# воркеры фоновых задач в процессах рядом с API (JOBS_WORKERS); иначе — python -m backend.jobs worker
+@app.on_event("startup")
+def start_job_workers():
+    app.state.job_workers = jobs.start_pool(jobs.JOBS_WORKERS) if jobs.JOBS_WORKERS else []
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    jobs.stop_pool(getattr(app.state, "job_workers", []))
+
 from fastapi.security import OAuth2PasswordBearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     token_data = auth.decode_token(token)
     if not token_data:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
-    user = crud.get_user_by_email(db, token_data.email)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
+    principal = auth.principal_cache.get(token_data.email)
+    if principal is None:
+        user = await crud_async.get_user_by_email(db, token_data.email)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal = auth.principal_cache.put(auth.Principal.from_user(user))
+    if not principal.is_active:
+        raise HTTPException(status_code=401, detail="User is inactive")
+    return principal
+
+async def get_reader(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    # read-only маршруты: при TRUST_ROLE_CLAIMS роль и id берутся из подписанного токена без запроса в БД
+    if auth.TRUST_ROLE_CLAIMS:
+        token_data = auth.decode_token(token)
+        if token_data and token_data.user_id is not None and token_data.role:
+            # снимок из кэша свежее токена: блокировка и смена роли видны, как только он появился
+            cached = auth.principal_cache.get(token_data.email)
+            if cached is not None:
+                if not cached.is_active:
+                    raise HTTPException(status_code=401, detail="User is inactive")
+                return cached
+            return auth.Principal(token_data.user_id, token_data.email, role=token_data.role)
+    return await get_current_user(token, db)
 
 def require_role(role: str):
     def dep(user = Depends(get_current_user)):
@@ -129,68 +221,387 @@ def require_role(role: str):
 
 # User endpoints
 @app.get("/users/me", response_model=schemas.UserOut)
-def read_users_me(current_user = Depends(get_current_user)):
+async def read_users_me(current_user = Depends(get_current_user)):
     return current_user
 
 # Patients
 @app.post("/patients", response_model=schemas.PatientOut)
-def create_patient(patient_in: schemas.PatientCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return crud.create_patient(db, patient_in, current_user.id)
+async def create_patient(patient_in: schemas.PatientCreate, response: Response, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    patient = await crud_async.create_patient(db, patient_in, current_user.id)
+    # возможные дубли, найденные при вставке (backend/linkage.py)
+    duplicates = await crud_async.pending_match_ids(db, patient.id)
+    if duplicates:
+        response.headers["X-Possible-Duplicates"] = ",".join(map(str, duplicates))
+    return patient
+
+@app.post("/patients/batch", response_model=schemas.BatchIds)
+async def create_patients_batch(patients_in: List[schemas.PatientCreate], db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    # одна транзакция: при любой ошибке не создаётся ни один пациент
+    return {"ids": await crud_async.create_patients_batch(db, patients_in, current_user.id)}
 
 @app.get("/patients", response_model=List[schemas.PatientOut])
-def get_patients(
+async def get_patients(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = Query(None, description="Поиск по ФИО или СНИЛС"),
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    sort: str = Query("id", description="id | family_name | dob, '-' в начале — по убыванию; с search не задаётся (порядок по релевантности)"),
+    count: Optional[str] = Query(None, pattern="^(exact|estimate)$", description="Вернуть общее число в X-Total-Count"),
+    fields: Optional[str] = Query(None, description="Только перечисленные поля, например id,family_name,given_name,dob"),
+    include: Optional[str] = Query(None, description="Связи в облегчённом ответе: traits, relations"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
 ):
-    return crud.list_patients(db, current_user, search=search, skip=skip, limit=limit)
+    headers = {}
+    if count:
+        total, estimated = await crud_async.count_patients(db, current_user, search=search, estimate=(count == "estimate"))
+        headers["X-Total-Count"] = str(total)
+        headers["X-Total-Count-Type"] = "estimate" if estimated else "exact"
+    # fields/include — облегчённая проекция прямо из колонок, без ORM-объектов и без повторной валидации
+    lean = bool(fields or include)
+    columns = crud.parse_fields(fields) if lean else None
+    relations = crud.parse_include(include)
+    if search and sort != "id":
+        # у поиска свой порядок — по релевантности; молча игнорировать sort нельзя
+        raise HTTPException(status_code=400, detail="sort is not supported with search: results are ordered by relevance")
+    if skip:
+        # старый режим offset — для совместимости
+        patients = await crud_async.list_patients(db, current_user, search=search, skip=skip, limit=limit, columns=columns)
+    else:
+        if search:
+            # поиск ранжируется по релевантности и листается курсором по (релевантность, id)
+            patients, next_cursor = await crud_async.search_patients_page(
+                db, current_user, search, cursor=cursor, limit=limit, columns=columns
+            )
+        else:
+            patients, next_cursor = await crud_async.page_patients(
+                db, current_user, search=search, sort=sort, cursor=cursor, limit=limit, columns=columns
+            )
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+    if lean:
+        rows = await crud_async.patient_rows(db, patients, columns, relations)
+        return FastJSONResponse(rows, headers=headers)
+    # модели уже проверены в crud_async: сразу в байты, без второго прохода по response_model
+    return RawJSONResponse(dump_models(schemas.PatientOut, patients), headers=headers)
+
+@app.get("/patients/export")
+def export_patients(
+    format: str = Query("csv", description="csv | ndjson | ped"),
+    current_user=Depends(get_reader),
+):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    return StreamingResponse(
+        export.export_patients(SessionLocal, current_user, format),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="patients.{format}"'},
+    )
 
 @app.get("/patients/{patient_id}", response_model=schemas.PatientOut)
-def get_patient(patient_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    p = crud.get_patient(db, patient_id)
+async def get_patient(
+    patient_id: int,
+    fields: Optional[str] = Query(None, description="Только перечисленные поля"),
+    include: Optional[str] = Query(None, description="Связи в облегчённом ответе: traits, relations"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    if fields or include:
+        row = await crud_async.get_patient_row(db, patient_id, crud.parse_fields(fields), crud.parse_include(include))
+        if not row:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        return FastJSONResponse(row)
+    p = await crud_async.get_patient(db, patient_id, load_relations=True)
     if not p:
         raise HTTPException(status_code=404, detail="Patient not found")
     return p
 
 @app.put("/patients/{patient_id}", response_model=schemas.PatientOut)
-def update_patient(patient_id: int, patient_in: schemas.PatientUpdate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    db_patient = crud.update_patient(db, patient_id, patient_in)
+async def update_patient(patient_id: int, patient_in: schemas.PatientUpdate, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    db_patient = await crud_async.update_patient(db, patient_id, patient_in)
     if not db_patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     return db_patient
 
 @app.delete("/patients/{patient_id}", status_code=204)
-def delete_patient(patient_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    deleted = crud.delete_patient(db, patient_id)
+async def delete_patient(patient_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    deleted = await crud_async.delete_patient(db, patient_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Patient not found")
     return None
 
 
+# Duplicates
+@app.get("/patients/{patient_id}/duplicates", response_model=List[schemas.DuplicateCandidate])
+async def get_patient_duplicates(
+    patient_id: int,
+    threshold: Optional[float] = Query(None, ge=0, le=1, description="Порог оценки (по умолчанию LINKAGE_THRESHOLD)"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    if not await crud_async.is_patient_visible(db, patient_id, current_user):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return await crud_async.patient_duplicates(db, patient_id, current_user, threshold)
+
+@app.post("/patients/{patient_id}/merge", response_model=schemas.PatientOut)
+async def merge_patients(patient_id: int, merge_in: schemas.MergeRequest, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    for pid in (patient_id, merge_in.duplicate_id):
+        if not await crud_async.is_patient_visible(db, pid, current_user):
+            raise HTTPException(status_code=404, detail="Patient not found")
+    merged = await crud_async.merge_patients(db, patient_id, merge_in.duplicate_id)
+    if merged is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return merged
+
+@app.get("/duplicates", response_model=List[schemas.PatientMatchOut])
+async def get_duplicates(
+    response: Response,
+    status: str = Query("pending", pattern="^(pending|dismissed)$"),
+    cursor: Optional[int] = Query(None, description="id пары из заголовка X-Next-Cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    rows, next_cursor = await crud_async.list_matches(db, current_user, status=status, cursor=cursor, limit=limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+@app.post("/duplicates/{match_id}/dismiss", status_code=204)
+async def dismiss_duplicate(match_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    if not await crud_async.dismiss_match(db, match_id, current_user):
+        raise HTTPException(status_code=404, detail="Match not found")
+    return None
+
+
 # Relations
 @app.post("/relations", response_model=schemas.RelationOut)
-def create_relation(rel_in: schemas.RelationCreate, db: Session = Depends(get_db), current_user=Depends(require_role("researcher"))):
+async def create_relation(rel_in: schemas.RelationCreate, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
     # simple validation to avoid cycles etc is omitted in MVP
-    return crud.create_relation(db, rel_in)
+    return await crud_async.create_relation(db, rel_in)
+
+@app.post("/relations/batch", response_model=schemas.BatchIds)
+async def create_relations_batch(rels_in: List[schemas.RelationCreate], db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    return {"ids": await crud_async.create_relations_batch(db, rels_in)}
+
+@app.delete("/relations/{relation_id}", status_code=204)
+async def delete_relation(relation_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    if not await crud_async.delete_relation(db, relation_id):
+        raise HTTPException(status_code=404, detail="Relation not found")
+    return None
 
 @app.get("/relations", response_model=List[schemas.RelationOut])
-def get_relations(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return crud.list_relations(db)
+async def get_relations(db: AsyncSession = Depends(get_db), current_user=Depends(get_reader)):
+    return await crud_async.list_relations(db)
 
 @app.post("/links", response_model=schemas.PatientLinkOut)
-def create_link(link_in: schemas.PatientLinkCreate, db: Session = Depends(get_db), current_user=Depends(require_role("researcher"))):
-    return crud.create_patient_link(db, link_in)
+async def create_link(link_in: schemas.PatientLinkCreate, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    return await crud_async.create_patient_link(db, link_in)
+
+@app.post("/links/batch", response_model=schemas.BatchIds)
+async def create_links_batch(links_in: List[schemas.PatientLinkCreate], db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    return {"ids": await crud_async.create_links_batch(db, links_in)}
+
+@app.delete("/links/{link_id}", status_code=204)
+async def delete_link(link_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    if not await crud_async.delete_patient_link(db, link_id):
+        raise HTTPException(status_code=404, detail="Link not found")
+    return None
 
 @app.get("/links", response_model=List[schemas.PatientLinkOut])
-def get_links(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return crud.list_patient_links(db)
+async def get_links(db: AsyncSession = Depends(get_db), current_user=Depends(get_reader)):
+    return await crud_async.list_patient_links(db)
 
-@app.get("/pedigree/{patient_id}", response_model=schemas.PedigreeOut)
-def get_pedigree(patient_id: int = Path(..., description="ID proband"), db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    p = crud.get_patient(db, patient_id)
-    if not p:
+# Cohorts
+@app.post("/cohort", response_model=schemas.CohortOut)
+async def query_cohort(q: schemas.CohortQuery, db: AsyncSession = Depends(get_db), current_user=Depends(get_reader)):
+    # страница, общее число и фасеты одним запросом; следующая страница — тот же запрос с cursor=next_cursor
+    if q.generations is not None and q.proband_id is None:
+        raise HTTPException(status_code=400, detail="generations задаются вместе с proband_id")
+    if q.proband_id is not None and not await crud_async.is_patient_visible(db, q.proband_id, current_user):
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return await crud_async.query_cohort(db, current_user, q)
+
+# Families
+@app.get("/families", response_model=List[schemas.FamilyOut])
+async def get_families(
+    response: Response,
+    min_size: int = Query(2, ge=1, description="Не меньше стольких членов (1 — вместе с одиночками)"),
+    cursor: Optional[int] = Query(None, description="family_id из заголовка X-Next-Cursor"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    rows, next_cursor = await crud_async.list_families(db, current_user, min_size=min_size, cursor=cursor, limit=limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+# Семья целиком: пациенты с temp_id и связи между ними одной транзакцией
+@app.post("/families", response_model=schemas.FamilySubmitResult)
+async def submit_family(family_in: schemas.FamilySubmit, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    return await crud_async.submit_family(db, family_in, current_user.id)
+
+def pedigree_view(
+    depth: Optional[int] = Query(None, ge=0, le=100, description="Сколько колец родства от пробанда (по умолчанию — вся семья)"),
+    direction: str = Query("both", pattern="^(ancestors|descendants|both)$", description="ancestors | descendants | both"),
+    include_spouses: bool = Query(True, description="Добавлять супругов загруженных людей"),
+):
+    return crud.PedigreeView(depth=depth, direction=direction, include_spouses=include_spouses)
+
+
+# Accept: application/x-msgpack — колоночный формат (backend/wire.py) в MessagePack
+@app.get(
+    "/pedigree/{patient_id}",
+    response_model=schemas.PedigreeOut,
+    responses={200: {"content": {MSGPACK: {}}, "description": "JSON или колоночный MessagePack по Accept"}},
+)
+async def get_pedigree(
+    request: Request,
+    patient_id: int = Path(..., description="ID proband"),
+    layout: bool = Query(False, description="Добавить координаты x / y готовой раскладки"),
+    view: crud.PedigreeView = Depends(pedigree_view),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Supported: {JSON}, {MSGPACK}")
+    entry = await crud_async.get_pedigree_cached(db, patient_id, layout=layout, view=view, media_type=media_type)
+    if not entry:
         raise HTTPException(status_code=404, detail="Patient not found")
-    pedigree = crud.build_pedigree(db, patient_id)
-    return pedigree
+    # у каждого формата свой ETag; промежуточные кэши различают ответы по Accept
+    headers = {"ETag": entry["etag"], "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    # тело сериализовано при записи в кэш; payload собран в crud и повторно не проверяется
+    return Response(entry["body"], media_type=entry["media_type"], headers=headers)
+
+
+# Следующее кольцо вокруг узла с has_more: родители / дети / сибсы и супруги node_id
+@app.get("/pedigree/{patient_id}/expand/{node_id}", response_model=schemas.PedigreeOut)
+async def expand_pedigree(
+    patient_id: int = Path(..., description="ID proband"),
+    node_id: int = Path(..., description="Узел, который раскрывается"),
+    generation: int = Query(0, description="Поколение node_id в уже загруженной генограмме"),
+    view: crud.PedigreeView = Depends(pedigree_view),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    payload = await crud_async.expand_pedigree(db, patient_id, node_id, view=view, generation=generation)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Patient not found in this family")
+    return FastJSONResponse(payload)
+
+
+@app.get("/pedigree/{patient_id}/kinship", response_model=schemas.KinshipOut)
+async def get_kinship(
+    request: Request,
+    patient_id: int = Path(..., description="ID proband"),
+    matrix: bool = Query(False, description="Добавить полную матрицу φ (для небольших семей)"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    entry = await crud_async.get_kinship_cached(db, patient_id, matrix=matrix)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers={"ETag": entry["etag"]})
+    # тело сериализовано при записи в кэш; payload собран в crud и повторно не проверяется
+    return RawJSONResponse(entry["body"], headers={"ETag": entry["etag"]})
+
+
+@app.get("/pedigree/{patient_id}/export")
+async def export_pedigree(
+    patient_id: int = Path(..., description="ID proband"),
+    format: str = Query("csv", description="csv | ndjson | ped"),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    # пробанд должен быть виден пользователю по тем же правилам, что и в /patients
+    visible = await crud_async.is_patient_visible(db, patient_id, current_user)
+    entry = await crud_async.get_pedigree_cached(db, patient_id) if visible else None
+    if not entry:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return StreamingResponse(
+        export.export_pedigree(entry["payload"], patient_id, format),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="pedigree_{patient_id}.{format}"'},
+    )
+
+# Bulk import
+@app.post("/import/{kind}", response_model=schemas.ImportReport)
+def import_file(
+    kind: str = Path(..., description="patients | traits | relations | links | ped"),
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="csv | ndjson (по умолчанию — по расширению файла)"),
+    source: str = Query("default", description="Пространство external_id: сайт или когорта"),
+    background: bool = Query(False, description="Фоновой задачей: ответ 202 с задачей, отчёт — в GET /jobs/{id}"),
+    db: Session = Depends(get_sync_db),
+    current_user=Depends(require_role("researcher")),
+):
+    # синхронный обработчик: разбор файла и COPY идут в threadpool на синхронном движке
+    if kind not in bulk_import.KINDS:
+        raise HTTPException(status_code=404, detail="Unknown import kind")
+    fmt = "ped" if kind == "ped" else bulk_import.detect_format(file.filename, format)
+    if fmt not in ("csv", "ndjson", "ped"):
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    if background:
+        path = jobs.save_upload(file.file, fmt)
+        job = jobs.enqueue(db, "import", {"kind": kind, "path": path, "fmt": fmt, "source": source}, current_user.id)
+        return FastJSONResponse(schemas.JobOut.model_validate(job, from_attributes=True).model_dump(mode="json"), status_code=202)
+    return bulk_import.run_import(db, kind, bulk_import.open_text(file.file), fmt, source, current_user.id)
+
+
+# Background jobs
+@app.post("/jobs", response_model=schemas.JobOut, status_code=202)
+async def create_job(job_in: schemas.JobCreate, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    # импорт ставится в очередь через POST /import/{kind}?background=true (с файлом)
+    handler = jobs.HANDLERS.get(job_in.kind)
+    if handler is None or job_in.kind == "import":
+        raise HTTPException(status_code=400, detail="Unknown job kind")
+    if handler.admin and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Insufficient privileges")
+    if job_in.kind == "export.patients" and job_in.params.get("format", "csv") not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    return await crud_async.enqueue_job(db, job_in.kind, job_in.params, current_user.id)
+
+@app.get("/jobs", response_model=List[schemas.JobOut])
+async def get_jobs(
+    status: Optional[str] = Query(None, pattern="^(queued|running|succeeded|failed|cancelled)$"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_reader),
+):
+    return await crud_async.list_jobs(db, current_user, status=status, limit=limit)
+
+@app.get("/jobs/{job_id}", response_model=schemas.JobOut)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(get_reader)):
+    job = await crud_async.get_job(db, job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(get_reader)):
+    path = await crud_async.get_job_file(db, job_id, current_user)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Result not available")
+    ext = path.rsplit(".", 1)[-1]
+    return FileResponse(path, media_type=export.FORMATS.get(ext, "application/octet-stream"), filename=f"job-{job_id}.{ext}")
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.JobOut)
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    job = await crud_async.cancel_job(db, job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/retry", response_model=schemas.JobOut)
+async def retry_job(job_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(require_role("researcher"))):
+    job = await crud_async.retry_job(db, job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
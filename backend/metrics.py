@@ -0,0 +1,176 @@
+# backend/metrics.py
+# Метрики Prometheus: задержка запросов по маршрутам, число SQL-запросов на запрос,
+# ожидание и занятость пула соединений, статистика кэшей. Отдаются на GET /metrics.
+import contextvars
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+REQUEST_LATENCY = Histogram(
+    "pedigree_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_QUERIES = Histogram(
+    "pedigree_db_queries_per_request",
+    "Число SQL-запросов за один HTTP-запрос",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+DB_QUERIES = Counter("pedigree_db_queries_total", "Выполненные SQL-запросы", ["engine"])
+POOL_WAIT = Histogram(
+    "pedigree_db_pool_wait_seconds",
+    "Ожидание соединения из пула",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 30),
+)
+POOL_CHECKOUTS = Counter("pedigree_db_pool_checkouts_total", "Выдачи соединений из пула", ["engine"])
+POOL_TIMEOUTS = Counter("pedigree_db_pool_timeouts_total", "Отказы пула по pool_timeout", ["engine"])
+
+
+# ---- pool ----
+def _timed_get(pool, get):
+    engine = pool.logging_name or "default"
+    start = time.perf_counter()
+    try:
+        return get()
+    except exc.TimeoutError:
+        POOL_TIMEOUTS.labels(engine).inc()
+        raise
+    finally:
+        POOL_WAIT.labels(engine).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, который замеряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        return _timed_get(self, super()._do_get)
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        return _timed_get(self, super()._do_get)
+
+
+# ---- per-request stats ----
+class RequestStats:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = 0
+
+
+# объект ставится middleware до вызова приложения; threadpool и run_sync видят тот же объект
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+_pools = {}
+
+
+def instrument_engine(engine, name: str):
+    # engine — синхронный Engine; для AsyncEngine передаётся async_engine.sync_engine
+    _pools[name] = engine.pool
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.labels(name).inc()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+
+    @event.listens_for(engine.pool, "checkout")
+    def _count_checkout(dbapi_conn, record, proxy):
+        POOL_CHECKOUTS.labels(name).inc()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: длительность запроса по шаблону маршрута и число SQL-запросов."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # шаблон маршрута (/pedigree/{patient_id}), а не путь — иначе метки растут без предела
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
+            REQUEST_QUERIES.labels(path).observe(stats.queries)
+            _current.reset(token)
+
+
+# ---- collectors ----
+class StateCollector(Collector):
+    """Текущее состояние пулов и кэшей; снимается при каждом чтении /metrics."""
+
+    def __init__(self):
+        self.sources = {}
+
+    def add(self, name: str, stats):
+        self.sources[name] = stats
+
+    def collect(self):
+        size = GaugeMetricFamily("pedigree_db_pool_size", "Постоянный размер пула", labels=["engine"])
+        checked_out = GaugeMetricFamily("pedigree_db_pool_checked_out", "Соединения в работе", labels=["engine"])
+        overflow = GaugeMetricFamily("pedigree_db_pool_overflow", "Соединения сверх pool_size", labels=["engine"])
+        for name, pool in _pools.items():
+            if not isinstance(pool, QueuePool):
+                continue
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+        yield size
+        yield checked_out
+        yield overflow
+
+        cache = GaugeMetricFamily("pedigree_cache_stat", "Счётчики кэшей и пула паролей", labels=["cache", "stat"])
+        for name, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    cache.add_metric([name, key], value)
+        yield cache
+
+
+state = StateCollector()
+REGISTRY.register(state)
+
+
+def render():
+    # несколько воркеров uvicorn: PROMETHEUS_MULTIPROC_DIR, счётчики и гистограммы суммируются по процессам
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(state)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
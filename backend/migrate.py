@@ -0,0 +1,161 @@
+# backend/migrate.py
+# Версионированные миграции схемы PostgreSQL: backend/migrations/NNNN_имя.sql, по порядку номеров.
+# Применённые версии записываются в schema_migrations; повторный запуск применяет только новые.
+# Файл выполняется в одной транзакции вместе с записью версии. Файл с первой строкой
+# «-- migrate: no-transaction» выполняется по выражению в autocommit — для CREATE INDEX CONCURRENTLY,
+# который не блокирует запись, но не работает в транзакции; такие выражения пишутся идемпотентными
+# (IF NOT EXISTS), а индекс, оставшийся INVALID после сбоя, перед повтором удаляется.
+# Выражения разделяются «;» — без «;» внутри строк и тел функций.
+# Параллельный запуск (два деплоя) ждёт pg_advisory_lock.
+# SQLite (тесты, локальный запуск) схему получает из models (create_all при старте) и миграций не требует.
+#
+#   python -m backend.migrate status    — версии и что применено
+#   python -m backend.migrate upgrade   — применить новые (--to N — до версии N включительно)
+import argparse
+import os
+import re
+import sys
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+# ключ pg_advisory_lock: один раннер на базу
+LOCK_KEY = 7342
+
+_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+_CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.I)
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION)
+
+
+def discover(directory: str = MIGRATIONS_DIR):
+    found = []
+    for filename in sorted(os.listdir(directory)):
+        match = _FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            found.append(Migration(int(match.group(1)), match.group(2), f.read()))
+    versions = [m.version for m in found]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"повторяющиеся номера миграций в {directory}")
+    return found
+
+
+def statements(sql: str):
+    # выражения файла без строк-комментариев
+    body = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--"))
+    return [s.strip() for s in body.split(";") if s.strip()]
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+    ))
+
+
+def applied(conn) -> dict:
+    return dict(conn.execute(text("SELECT version, name FROM schema_migrations")).all())
+
+
+def _record(conn, migration: Migration):
+    conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                 {"v": migration.version, "n": migration.name})
+
+
+def _drop_invalid_index(conn, statement: str):
+    # прерванный CREATE INDEX CONCURRENTLY оставляет INVALID индекс, и IF NOT EXISTS его бы пропустил
+    match = _CONCURRENT_INDEX.search(statement)
+    if not match:
+        return
+    name = match.group(1)
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def apply(engine, migration: Migration):
+    if migration.transactional:
+        with engine.begin() as conn:
+            for statement in statements(migration.sql):
+                conn.exec_driver_sql(statement)
+            _record(conn, migration)
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in statements(migration.sql):
+            _drop_invalid_index(conn, statement)
+            conn.exec_driver_sql(statement)
+        _record(conn, migration)
+
+
+def _require_postgresql(engine):
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError(f"миграции — только для PostgreSQL, а не {engine.dialect.name}: "
+                           "схема SQLite создаётся из models при старте приложения")
+
+
+def upgrade(engine, target: int = None, log=print):
+    # -> версии, применённые этим запуском
+    _require_postgresql(engine)
+    done = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_KEY})
+        try:
+            _ensure_table(lock)
+            have = applied(lock)
+            for migration in discover():
+                if migration.version in have or (target is not None and migration.version > target):
+                    continue
+                log(f"applying {migration.version:04d}_{migration.name}")
+                apply(engine, migration)
+                done.append(migration.version)
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+    return done
+
+
+def status(engine):
+    # [(версия, имя, применена)]
+    _require_postgresql(engine)
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        have = applied(conn)
+    return [(m.version, m.name, m.version in have) for m in discover()]
+
+
+def main(argv=None):
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Миграции схемы PostgreSQL (backend/migrations)")
+    parser.add_argument("command", choices=("status", "upgrade"))
+    parser.add_argument("--to", type=int, default=None, help="последняя применяемая версия")
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "status":
+            for version, name, done in status(engine):
+                print(f"{version:04d}_{name}  {'applied' if done else 'pending'}")
+        else:
+            done = upgrade(engine, args.to)
+            print(f"applied {len(done)} migrations")
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
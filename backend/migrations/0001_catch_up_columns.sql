@@ -0,0 +1,38 @@
+-- Колонки и таблицы, появившиеся после первой версии create_tables.sql.
+-- Приложение при старте создаёт только недостающие таблицы (create_all), но не колонки.
+-- После применения заполните значения: python -m backend.families backfill; python -m backend.search reindex
+
+-- семья пациента (backend/families.py)
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS family_id INTEGER;
+-- блок поиска дублей (backend/linkage.py)
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS link_key VARCHAR(255);
+
+CREATE TABLE IF NOT EXISTS patient_matches (
+    id SERIAL PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    candidate_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    score DOUBLE PRECISION NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    UNIQUE(patient_id, candidate_id)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    params JSON,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    message TEXT,
+    result JSON,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    worker VARCHAR(255),
+    created_by_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    run_after TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
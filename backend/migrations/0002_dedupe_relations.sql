@@ -0,0 +1,7 @@
+-- Повторы (parent_id, child_id) не дают построить уникальный индекс в 0003:
+-- из одинаковых связей остаётся связь с наименьшим id
+DELETE FROM relations r
+USING relations d
+WHERE r.parent_id = d.parent_id
+  AND r.child_id = d.child_id
+  AND r.id > d.id;
@@ -0,0 +1,19 @@
+-- migrate: no-transaction
+-- Индексы по внешним ключам, на которых стоят обход генограммы, каскадное удаление пациента и
+-- выборки по семье. CONCURRENTLY — без блокировки записи на время построения, поэтому вне транзакции;
+-- недостроенный (INVALID) индекс после сбоя раннер удаляет и строит заново.
+
+-- связь родитель — ребёнок одна; индекс по (parent_id, child_id) заодно обслуживает поиск детей
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_relations_parent_child ON relations (parent_id, child_id);
+-- родители ребёнка
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_relations_child_parent ON relations (child_id, parent_id);
+-- patient1_id покрыт уникальным (patient1_id, patient2_id, link_type); здесь — обратное направление
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_links_patient2 ON patient_links (patient2_id, patient1_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_traits_patient_id ON traits (patient_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_family_id ON patients (family_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_link_key ON patients (link_key);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_matches_candidate_id ON patient_matches (candidate_id);
+-- очередь пар на проверку (GET /duplicates): только pending, keyset по id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patient_matches_pending ON patient_matches (id) WHERE status = 'pending';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_jobs_status_run_after ON jobs (status, run_after);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_jobs_created_by_id ON jobs (created_by_id);
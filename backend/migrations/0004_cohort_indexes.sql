@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Когорты (POST /cohort, backend/cohort.py).
+
+-- отбор по признаку и возрасту начала: index-only scan, таблица traits не читается
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_traits_name_onset_age_patient_id ON traits (name, onset_age, patient_id);
+-- факторы риска: маленькие частичные индексы, строки по порядку id для keyset-страниц
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_family_hyperchol ON patients (id) WHERE family_hyperchol;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_smoking ON patients (id) WHERE smoking;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_hypertension ON patients (id) WHERE hypertension;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_patients_diabetes ON patients (id) WHERE diabetes;
@@ -1,7 +1,9 @@
 # backend/models.py
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, Table, Text
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, JSON, Table, Text, UniqueConstraint, Index
+from sqlalchemy import event, text, DDL
 from sqlalchemy.orm import relationship
 from .database import Base
+from datetime import datetime
 
 # association table for parent-child relationships
 class User(Base):
@@ -17,6 +19,23 @@ class User(Base):
 
 class Patient(Base):
     __tablename__ = "patients"
+    __table_args__ = (
+        # keyset-пагинация /patients: (ключ сортировки, id), в т.ч. с фильтром по автору
+        Index("ix_patients_family_name_id", "family_name", "id"),
+        Index("ix_patients_dob_id", "dob", "id"),
+        Index("ix_patients_created_by_id_id", "created_by_id", "id"),
+        Index("ix_patients_created_by_id_family_name_id", "created_by_id", "family_name", "id"),
+        Index("ix_patients_created_by_id_dob_id", "created_by_id", "dob", "id"),
+        # поиск: триграммы по нормализованному ФИО и префикс СНИЛС (только PostgreSQL-варианты индексов)
+        Index(
+            "ix_patients_search_name_trgm", "search_name",
+            postgresql_using="gin", postgresql_ops={"search_name": "gin_trgm_ops"},
+        ),
+        Index("ix_patients_snils_digits", "snils_digits", postgresql_ops={"snils_digits": "text_pattern_ops"}),
+        # когорты (backend/cohort.py): частичные индексы по факторам риска, строки по порядку id
+        *(Index(f"ix_patients_{flag}", "id", postgresql_where=text(flag), sqlite_where=text(flag))
+          for flag in ("family_hyperchol", "smoking", "hypertension", "diabetes")),
+    )
     id = Column(Integer, primary_key=True, index=True)
     given_name = Column(String, nullable=False)
     family_name = Column(String, nullable=True)
@@ -36,6 +55,13 @@ class Patient(Base):
     notes = Column(Text, nullable=True)
     created_by_id = Column(Integer, ForeignKey("users.id"))
 
+    # нормализованные копии для поиска, заполняются в backend/search.py
+    search_name = Column(Text, nullable=True)  # "фамилия имя отчество" в нижнем регистре, ё -> е
+    snils_digits = Column(String, nullable=True)  # СНИЛС без разделителей
+    link_key = Column(String, nullable=True, index=True)  # блок поиска дублей: фонетическая фамилия + год рождения
+    # семья (компонента связности) — наименьший id её члена, поддерживается в backend/families.py
+    family_id = Column(Integer, nullable=True, index=True)
+
     created_by = relationship("User", back_populates="patients")
     traits = relationship("Trait", back_populates="patient", cascade="all, delete-orphan")
     relations_as_parent = relationship("Relation", back_populates="parent", foreign_keys="Relation.parent_id", cascade="all, delete-orphan")
@@ -44,6 +70,11 @@ class Patient(Base):
 
 class Relation(Base):
     __tablename__ = "relations"
+    # связь родитель — ребёнок одна; (parent_id, child_id) — дети, (child_id, parent_id) — родители
+    __table_args__ = (
+        Index("uq_relations_parent_child", "parent_id", "child_id", unique=True),
+        Index("ix_relations_child_parent", "child_id", "parent_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     parent_id = Column(Integer, ForeignKey("patients.id"))
     child_id = Column(Integer, ForeignKey("patients.id"))
@@ -54,8 +85,10 @@ class Relation(Base):
 
 class Trait(Base):
     __tablename__ = "traits"
+    # когорты: отбор по имени и возрасту начала без чтения таблицы (покрывающий индекс)
+    __table_args__ = (Index("ix_traits_name_onset_age_patient_id", "name", "onset_age", "patient_id"),)
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
     name = Column(String, nullable=False)  # e.g., disease name, mutation
     onset_age = Column(Integer, nullable=True)
     details = Column(Text, nullable=True)
@@ -69,6 +102,68 @@ class PatientLink(Base):
     patient2_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     link_type = Column(String, nullable=False)  # sibling / spouse
 
+    # patient1_id покрыт уникальным ключом; обратное направление — отдельным индексом
+    __table_args__ = (
+        UniqueConstraint("patient1_id", "patient2_id", "link_type"),
+        Index("ix_patient_links_patient2", "patient2_id", "patient1_id"),
+    )
+
     patient1 = relationship("Patient", foreign_keys=[patient1_id])
     patient2 = relationship("Patient", foreign_keys=[patient2_id])
 
+class ImportKey(Base):
+    # external_id из файлов импорта (в пределах источника — сайта / когорты) -> пациент
+    __tablename__ = "import_keys"
+    __table_args__ = (UniqueConstraint("source", "external_id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)
+    external_id = Column(String, nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+
+
+class PatientMatch(Base):
+    # возможный дубль (backend/linkage.py): пара patient_id < candidate_id и оценка сходства
+    __tablename__ = "patient_matches"
+    __table_args__ = (
+        UniqueConstraint("patient_id", "candidate_id"),
+        # очередь на проверку (GET /duplicates): только pending, keyset по id
+        Index("ix_patient_matches_pending", "id",
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+    candidate_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending / dismissed
+
+
+class Job(Base):
+    # фоновая задача (backend/jobs.py); очередь — status + run_after, воркеры забирают с SKIP LOCKED
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # import / export.patients / search.reindex / ...
+    params = Column(JSON, nullable=True)
+    status = Column(String, nullable=False, default="queued")  # queued / running / succeeded / failed / cancelled
+    progress = Column(Float, nullable=False, default=0.0)  # 0..1
+    message = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)  # отчёт обработчика; path — файл результата
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker = Column(String, nullable=True)
+    created_by_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    run_after = Column(DateTime, nullable=True)  # не раньше: задержка перед повтором
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# триграммный индекс поиска требует расширения pg_trgm
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
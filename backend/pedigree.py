@@ -0,0 +1,109 @@
+# backend/pedigree.py
+from collections import defaultdict, deque
+
+# типы связей в ответе /pedigree
+VERTICAL = "vertical"
+HORIZONTAL = "horizontal"
+SPOUSE = "spouse"
+
+
+def link_kind(link_type: str) -> str:
+    # sibling -> horizontal, spouse -> spouse, остальное как есть
+    lt = (link_type or "").lower()
+    if lt == "sibling":
+        return HORIZONTAL
+    if lt == "spouse":
+        return SPOUSE
+    return lt
+
+
+class PedigreeGraph:
+    """Граф семьи с типизированной смежностью: родители, дети, сибсы, супруги, прочие связи."""
+
+    def __init__(self):
+        self.nodes = set()
+        self.parents = defaultdict(list)
+        self.children = defaultdict(list)
+        self.siblings = defaultdict(list)
+        self.spouses = defaultdict(list)
+        self.others = defaultdict(list)
+        # рёбра в порядке добавления: (source, target, type)
+        self.edges = []
+
+    @classmethod
+    def from_edges(cls, relations, links, nodes=()):
+        g = cls()
+        g.nodes.update(nodes)
+        for r in relations:
+            g.add_relation(r.parent_id, r.child_id)
+        for l in links:
+            g.add_link(l.patient1_id, l.patient2_id, l.link_type)
+        return g
+
+    def add_relation(self, parent_id: int, child_id: int):
+        self.nodes.update((parent_id, child_id))
+        self.children[parent_id].append(child_id)
+        self.parents[child_id].append(parent_id)
+        self.edges.append((parent_id, child_id, VERTICAL))
+
+    def add_link(self, a: int, b: int, link_type: str):
+        kind = link_kind(link_type)
+        adj = {HORIZONTAL: self.siblings, SPOUSE: self.spouses}.get(kind, self.others)
+        self.nodes.update((a, b))
+        adj[a].append(b)
+        adj[b].append(a)
+        self.edges.append((a, b, kind))
+
+    def neighbors(self, node: int):
+        # (сосед, сдвиг поколения): родители -1, дети +1, горизонтальные связи 0
+        for p in self.parents.get(node, ()):
+            yield p, -1
+        for c in self.children.get(node, ()):
+            yield c, 1
+        for adj in (self.siblings, self.spouses, self.others):
+            for nb in adj.get(node, ()):
+                yield nb, 0
+
+    def assign_generations(self, root: int):
+        # BFS за O(V+E): каждое ребро просматривается с двух концов ровно по разу
+        generation = {root: 0}
+        q = deque([root])
+        while q:
+            cur = q.popleft()
+            cur_gen = generation[cur]
+            for nb, delta in self.neighbors(cur):
+                if nb not in generation:
+                    generation[nb] = cur_gen + delta
+                    q.append(nb)
+        return generation
+
+    def generation_conflicts(self, generation):
+        # рёбра, которые противоречат назначенным поколениям
+        # (например, супруги в разных поколениях или «родитель» младше ребёнка)
+        conflicts = []
+        for a, b, kind in self.unique_edges():
+            if a not in generation or b not in generation:
+                continue
+            expected = generation[a] + 1 if kind == VERTICAL else generation[a]
+            if generation[b] != expected:
+                conflicts.append({
+                    "source": a,
+                    "target": b,
+                    "type": kind,
+                    "source_generation": generation[a],
+                    "target_generation": generation[b],
+                })
+        return conflicts
+
+    def unique_edges(self):
+        # рёбра без дубликатов; вертикальные направлены, остальные — нет
+        seen = set()
+        for a, b, kind in self.edges:
+            key = ("v", a, b) if kind == VERTICAL else (kind, min(a, b), max(a, b))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield a, b, kind
+
+    def links(self):
+        return [{"source": a, "target": b, "type": kind} for a, b, kind in self.unique_edges()]
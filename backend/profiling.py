@@ -0,0 +1,230 @@
+# backend/profiling.py
+# Профилирование запросов (включается PROFILE_REQUESTS=true):
+#   - учёт SQL на запрос через события движка: число выражений, время в БД, самые медленные,
+#     самое частое повторение одного выражения (признак N+1 при ленивой загрузке);
+#   - журнал медленных запросов (дольше SLOW_REQUEST_MS) вместе с их SQL;
+#   - заголовок Server-Timing (SERVER_TIMING=true): db / app / total;
+#   - разовый профиль одного запроса по заголовку X-Profile: cprofile | pyinstrument
+#     (только для токена с ролью admin); результат — файл в PROFILE_DIR, имя в X-Profile-File.
+import contextvars
+import cProfile
+import heapq
+import io
+import logging
+import os
+import pstats
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+from sqlalchemy import event
+
+from . import auth
+
+try:
+    import pyinstrument
+except ImportError:  # нужен только для X-Profile: pyinstrument
+    pyinstrument = None
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_QUERY_TOP = int(os.getenv("SLOW_QUERY_TOP", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "pedigree-profiles")
+PROFILE_HEADER = "x-profile"
+PROFILERS = ("cprofile", "pyinstrument")
+
+logger = logging.getLogger("pedigree.slow")
+
+
+class RequestProfile:
+    """SQL одного HTTP-запроса: счётчики и топ самых медленных выражений."""
+
+    def __init__(self, top: int = SLOW_QUERY_TOP):
+        self.top = top
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest = []  # куча (секунды, n, statement, parameters)
+        self.repeats = Counter()
+
+    def record(self, statement, parameters, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.repeats[statement] += 1
+        item = (seconds, self.queries, statement, parameters)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heappushpop(self.slowest, item)
+
+    def slowest_statements(self):
+        return [(s, stmt, params) for s, _, stmt, params in sorted(self.slowest, reverse=True)]
+
+    def max_repeat(self):
+        if not self.repeats:
+            return 0, None
+        statement, count = self.repeats.most_common(1)[0]
+        return count, statement
+
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+def instrument_engine(engine):
+    # engine — синхронный Engine; для AsyncEngine передаётся async_engine.sync_engine
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        starts = conn.info.get("profile_start")
+        if profile is None or not starts:
+            return
+        profile.record(statement, parameters, time.perf_counter() - starts.pop())
+
+
+def _header(scope, name: str):
+    for key, value in scope.get("headers", ()):
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def requested_profiler(scope):
+    # X-Profile учитывается только для администратора: профиль раскрывает код и SQL
+    kind = (_header(scope, PROFILE_HEADER) or "").strip().lower()
+    if kind not in PROFILERS:
+        return None
+    authorization = _header(scope, "authorization") or ""
+    if not authorization.lower().startswith("bearer "):
+        return None
+    token_data = auth.decode_token(authorization[7:].strip())
+    if token_data is None or token_data.role != "admin":
+        return None
+    cached = auth.principal_cache.get(token_data.email)
+    if cached is not None and (not cached.is_active or cached.role != "admin"):
+        return None
+    if kind == "pyinstrument" and pyinstrument is None:
+        logger.warning("X-Profile: pyinstrument не установлен, используется cProfile")
+        return "cprofile"
+    return kind
+
+
+class _Capture:
+    # cProfile видит только поток цикла событий: threadpool и параллельные запросы в профиль не попадут
+    def __init__(self, kind: str):
+        self.kind = kind
+        if kind == "pyinstrument":
+            self.profiler = pyinstrument.Profiler(async_mode="enabled")
+        else:
+            self.profiler = cProfile.Profile()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        if self.kind == "pyinstrument":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def save(self, method: str, path: str) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stem = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        if self.kind == "pyinstrument":
+            name = stem + ".html"
+            with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+        else:
+            # .prof открывается snakeviz / pstats; краткая сводка — в журнал
+            name = stem + ".prof"
+            self.profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(20)
+            logger.info("profile %s %s -> %s\n%s", method, path, name, out.getvalue())
+        return name
+
+
+def server_timing(profile: RequestProfile, total: float) -> str:
+    db_ms = profile.db_seconds * 1000
+    total_ms = total * 1000
+    return (
+        f'db;dur={db_ms:.1f};desc="{profile.queries} queries", '
+        f"app;dur={max(total_ms - db_ms, 0):.1f}, total;dur={total_ms:.1f}"
+    )
+
+
+def _short(value, limit: int = 300):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def log_slow(method: str, path: str, status: int, total: float, profile: RequestProfile):
+    repeat, repeated = profile.max_repeat()
+    lines = [
+        f"slow request {method} {path} -> {status}: {total * 1000:.0f} ms, "
+        f"{profile.queries} queries, db {profile.db_seconds * 1000:.0f} ms, max repeat {repeat}"
+    ]
+    for seconds, statement, params in profile.slowest_statements():
+        lines.append(f"  {seconds * 1000:.1f} ms  {_short(statement)}  params={_short(params, 120)}")
+    if repeat > 1:
+        lines.append(f"  repeated x{repeat}: {_short(repeated)}")
+    logger.warning("\n".join(lines))
+
+
+class ProfilingMiddleware:
+    """ASGI-middleware: SQL-учёт, журнал медленных запросов, Server-Timing и X-Profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _current.set(profile)
+        kind = requested_profiler(scope)
+        capture = _Capture(kind) if kind else None
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", ()))
+                if SERVER_TIMING:
+                    value = server_timing(profile, time.perf_counter() - start)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                if capture is not None:
+                    # профиль заканчивается на заголовках ответа — тело стрима в него не входит
+                    capture.stop()
+                    headers.append((b"x-profile-file", capture.save(scope["method"], scope["path"]).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        if capture is not None:
+            capture.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if capture is not None:
+                capture.stop()
+            total = time.perf_counter() - start
+            if total * 1000 >= SLOW_REQUEST_MS:
+                route = scope.get("route")
+                log_slow(scope["method"], getattr(route, "path", scope["path"]), status, total, profile)
+            _current.reset(token)
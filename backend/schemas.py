@@ -1,7 +1,7 @@
 # backend/schemas.py
-from pydantic import BaseModel, EmailStr, constr
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, EmailStr, Field, computed_field, constr
+from typing import Optional, List, Dict, Union
+from datetime import date, datetime
 from typing import Any
 
 class Token(BaseModel):
@@ -11,6 +11,7 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
     role: Optional[str] = None
+    user_id: Optional[int] = None
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -87,6 +88,7 @@ class RelationAsChildOut(BaseModel):
 class PatientOut(PatientBase):
     id: int
     created_by_id: Optional[int]
+    family_id: Optional[int] = None
     traits: List[TraitOut] = []
     relations_as_parent: List[RelationAsParentOut] = []
     relations_as_child: List[RelationAsChildOut] = []
@@ -117,6 +119,36 @@ class PatientLinkOut(PatientLinkCreate):
 
 
 
+# Пакетная запись: всё или ничего, одной транзакцией
+class BatchIds(BaseModel):
+    ids: List[int]
+
+# Семья целиком: пациенты с временными id клиента и связи между ними.
+# В связях строка — temp_id из этого же запроса, число — id уже существующего пациента.
+class FamilyPatient(PatientCreate):
+    temp_id: str
+
+class FamilyRelation(BaseModel):
+    parent_id: Union[int, str]
+    child_id: Union[int, str]
+    relationship_type: Optional[str] = "parent"
+
+class FamilyLink(BaseModel):
+    patient1_id: Union[int, str]
+    patient2_id: Union[int, str]
+    link_type: str
+
+class FamilySubmit(BaseModel):
+    patients: List[FamilyPatient] = []
+    relations: List[FamilyRelation] = []
+    links: List[FamilyLink] = []
+
+class FamilySubmitResult(BaseModel):
+    patients: Dict[str, int]  # temp_id -> id
+    relations: List[int]
+    links: List[int]
+
+
 class PedigreeNode(BaseModel):
     id: int
     given_name: Optional[str] = None
@@ -128,6 +160,10 @@ class PedigreeNode(BaseModel):
     generation: int
     is_proband: bool = False
     family_hyperchol: Optional[bool] = False
+    has_more: bool = False  # есть родственники вне ответа: узел можно раскрыть (/expand)
+    # координаты раскладки (layout=true); y — строка поколения
+    x: Optional[float] = None
+    y: Optional[float] = None
 
     class Config:
         orm_mode = True
@@ -137,6 +173,169 @@ class PedigreeLink(BaseModel):
     target: int
     type: str  # vertical / horizontal / spouse / other
 
+class PedigreeConflict(BaseModel):
+    # связь, противоречащая назначенным поколениям (например, супруги из разных поколений)
+    source: int
+    target: int
+    type: str
+    source_generation: int
+    target_generation: int
+
+class PedigreeLayout(BaseModel):
+    width: float
+    height: float
+    crossings: int  # пересечения связей родитель — ребёнок между блоками супругов после упорядочивания
+
 class PedigreeOut(BaseModel):
     nodes: List[PedigreeNode]
-    links: List[PedigreeLink]
\ No newline at end of file
+    links: List[PedigreeLink]
+    conflicts: List[PedigreeConflict] = []
+    truncated: bool = False  # семья обрезана по PEDIGREE_MAX_NODES
+    layout: Optional[PedigreeLayout] = None
+
+class KinshipRelative(BaseModel):
+    id: int
+    kinship: float                # φ: вероятность идентичности по происхождению
+    relatedness: float            # 2φ: доля общих генов, 0.5 для родственников первой степени
+    degree: Optional[int] = None  # степень родства; None — не кровный родственник (например, супруг)
+    inbreeding: float
+
+class KinshipMatrix(BaseModel):
+    ids: List[int]
+    values: List[List[float]]
+
+class KinshipOut(BaseModel):
+    proband: int
+    inbreeding: float
+    relatives: List[KinshipRelative]
+    ignored: List[PedigreeLink] = []  # связи, замыкавшие цикл предков, в расчёт не вошли
+    truncated: bool = False
+    matrix: Optional[KinshipMatrix] = None
+
+class FamilyOut(BaseModel):
+    family_id: int
+    size: int
+    probands: int  # члены семьи с СГХС (family_hyperchol) — индексные пациенты для каскадного скрининга
+
+# Дубли пациентов (backend/linkage.py)
+class DuplicateCandidate(BaseModel):
+    id: int
+    family_name: Optional[str] = None
+    given_name: Optional[str] = None
+    middle_name: Optional[str] = None
+    dob: Optional[date] = None
+    sex: Optional[str] = None
+    snils: Optional[str] = None
+    score: float  # 0..1, сходство ФИО, даты рождения и пола
+
+class PatientMatchOut(BaseModel):
+    id: int
+    patient_id: int
+    candidate_id: int
+    score: float
+    status: str  # pending / dismissed
+
+    class Config:
+        orm_mode = True
+
+class MergeRequest(BaseModel):
+    duplicate_id: int  # удаляется; его связи, признаки и ключи импорта переходят к пациенту из пути
+
+# Когорты (backend/cohort.py)
+class CohortTrait(BaseModel):
+    name: str  # точное имя признака, например LDLR
+    min_onset_age: Optional[int] = None  # возраст начала, границы включительно
+    max_onset_age: Optional[int] = None
+
+class CohortQuery(BaseModel):
+    # None — фактор не фильтруется; все условия объединяются через «и»
+    family_hyperchol: Optional[bool] = None
+    smoking: Optional[bool] = None
+    hypertension: Optional[bool] = None
+    diabetes: Optional[bool] = None
+    sex: Optional[str] = None
+    min_weight: Optional[float] = None
+    max_weight: Optional[float] = None
+    min_height: Optional[float] = None
+    max_height: Optional[float] = None
+    traits: List[CohortTrait] = []
+    # только семья пробанда; поколение считается от пробанда (0), родители -1, дети +1
+    proband_id: Optional[int] = None
+    generations: Optional[List[int]] = None
+    cursor: Optional[int] = None  # id последнего пациента предыдущей страницы
+    limit: int = Field(100, ge=1, le=1000)
+
+class CohortPatient(BaseModel):
+    id: int
+    family_name: Optional[str] = None
+    given_name: Optional[str] = None
+    middle_name: Optional[str] = None
+    dob: Optional[date] = None
+    sex: Optional[str] = None
+    family_id: Optional[int] = None
+    family_hyperchol: Optional[bool] = None
+    smoking: Optional[bool] = None
+    hypertension: Optional[bool] = None
+    diabetes: Optional[bool] = None
+    weight: Optional[float] = None
+    height: Optional[float] = None
+    generation: Optional[int] = None
+
+class CohortFacets(BaseModel):
+    # по всей когорте, а не по странице
+    family_hyperchol: int = 0
+    smoking: int = 0
+    hypertension: int = 0
+    diabetes: int = 0
+    sex: Dict[str, int] = {}
+    traits: Dict[str, int] = {}  # пациентов с признаком, самые частые
+    generation: Dict[int, int] = {}  # только с proband_id
+
+class CohortOut(BaseModel):
+    total: int
+    items: List[CohortPatient]
+    next_cursor: Optional[str] = None
+    facets: CohortFacets
+
+# Фоновые задачи (backend/jobs.py)
+class JobCreate(BaseModel):
+    kind: str  # export.patients | search.reindex | families.backfill | linkage.scan
+    params: Dict[str, Any] = {}
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str  # queued / running / succeeded / failed / cancelled
+    progress: float
+    message: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def result_url(self) -> Optional[str]:
+        # файл результата (выгрузка)
+        if self.status == "succeeded" and (self.result or {}).get("file"):
+            return f"/jobs/{self.id}/result"
+        return None
+
+    class Config:
+        orm_mode = True
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportReport(BaseModel):
+    kind: str
+    processed: int
+    inserted: int
+    error_count: int
+    errors: List[ImportRowError] = []
@@ -0,0 +1,211 @@
+# backend/search.py
+# Поиск пациентов по ФИО и СНИЛС.
+# В patients хранятся нормализованные колонки search_name (ФИО в нижнем регистре, ё -> е)
+# и snils_digits (только цифры). На PostgreSQL их обслуживают GIN-индекс pg_trgm и
+# btree text_pattern_ops, ранжирование — word_similarity; на остальных БД (SQLite в тестах)
+# фильтр тот же, а ранжирование выполняется в процессе.
+# Здесь же ключ блокировки link_key для поиска дублей (backend/linkage.py): фонетическая фамилия + год рождения.
+import argparse
+import difflib
+import re
+
+from sqlalchemy import event, func, or_, and_, case, literal, update, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+_SPACES = re.compile(r"\s+")
+_NON_DIGITS = re.compile(r"\D")
+_NON_LETTERS = re.compile(r"[^a-zа-я]")
+# со скольких цифр запрос считается префиксом СНИЛС
+SNILS_MIN_DIGITS = 3
+
+
+def normalize_text(value: str) -> str:
+    if not value:
+        return ""
+    value = value.lower().replace("ё", "е")
+    return _SPACES.sub(" ", value).strip()
+
+
+def normalize_name(family_name, given_name, middle_name) -> str:
+    return normalize_text(" ".join(p for p in (family_name, given_name, middle_name) if p))
+
+
+def normalize_snils(snils) -> str:
+    return _NON_DIGITS.sub("", snils or "") or None
+
+
+# упрощённая фонетика фамилии: гласные сводятся к трём классам, звонкие согласные оглушаются,
+# ь/ъ выпадают, повторы схлопываются (Иваннов, Ивонов -> ифанаф)
+_PHONETIC = str.maketrans({
+    "о": "а", "ы": "и", "е": "и", "э": "и", "я": "и", "й": "и", "ю": "у",
+    "б": "п", "в": "ф", "г": "к", "д": "т", "ж": "ш", "з": "с", "ь": None, "ъ": None,
+})
+
+
+def phonetic_key(value: str) -> str:
+    key = _NON_LETTERS.sub("", normalize_text(value)).translate(_PHONETIC)
+    return "".join(c for i, c in enumerate(key) if i == 0 or c != key[i - 1])
+
+
+def link_key(family_name, dob):
+    # блок кандидатов в дубли; без фамилии или даты рождения пациент в блоки не попадает
+    key = phonetic_key(family_name)
+    if not key or dob is None:
+        return None
+    return f"{key}:{dob.year}"
+
+
+def search_columns(values: dict) -> dict:
+    # значения search_name / snils_digits / link_key для вставки мимо ORM (массовый импорт)
+    return {
+        "search_name": normalize_name(values.get("family_name"), values.get("given_name"), values.get("middle_name")),
+        "snils_digits": normalize_snils(values.get("snils")),
+        "link_key": link_key(values.get("family_name"), values.get("dob")),
+    }
+
+
+@event.listens_for(models.Patient, "before_insert")
+@event.listens_for(models.Patient, "before_update")
+def _fill_search_columns(mapper, connection, target):
+    target.search_name = normalize_name(target.family_name, target.given_name, target.middle_name)
+    target.snils_digits = normalize_snils(target.snils)
+    target.link_key = link_key(target.family_name, target.dob)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _terms(term: str):
+    text = normalize_text(term)
+    digits = _NON_DIGITS.sub("", term or "")
+    return text, text.split(" ") if text else [], digits if len(digits) >= SNILS_MIN_DIGITS else None
+
+
+def match_filter(query, term: str, dialect: str):
+    # каждое слово запроса должно встречаться в ФИО; либо префикс СНИЛС; на PG — ещё и нечётко
+    text, tokens, digits = _terms(term)
+    p = models.Patient
+    conditions = []
+    if tokens:
+        conditions.append(and_(*[p.search_name.like(f"%{_escape_like(t)}%", escape="\\") for t in tokens]))
+        if dialect == "postgresql":
+            # text <% search_name: word_similarity выше pg_trgm.word_similarity_threshold, идёт по GIN-индексу
+            conditions.append(p.search_name.op("%>")(text))
+    if digits:
+        conditions.append(p.snils_digits.like(f"{digits}%"))
+    if not conditions:
+        return query
+    return query.filter(or_(*conditions))
+
+
+def _rank_expr(text: str, digits):
+    p = models.Patient
+    rank = func.word_similarity(text, p.search_name) if text else literal(0.0)
+    if digits:
+        rank = func.greatest(rank, case((p.snils_digits.like(f"{digits}%"), 1.0), else_=0.0))
+    return rank
+
+
+def _rank_in_process(patient, text: str, digits) -> float:
+    # грубое подобие word_similarity: слово целиком > начало слова > подстрока > похожая строка
+    if digits and (patient.snils_digits or "").startswith(digits):
+        return 1.0
+    name = patient.search_name or ""
+    if not text:
+        return 0.0
+    words = name.split(" ")
+    scores = []
+    for token in text.split(" "):
+        if token in words:
+            scores.append(1.0)
+        elif any(w.startswith(token) for w in words):
+            scores.append(0.8)
+        elif token in name:
+            scores.append(0.6)
+        else:
+            scores.append(difflib.SequenceMatcher(None, token, name).ratio() * 0.5)
+    return sum(scores) / len(scores)
+
+
+def ranks_in_sql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def rank_rows(rows, term: str, after=None):
+    # [(строка, rank)] по убыванию rank, затем по id; after = (rank, last_id) — только строки после него
+    text, _, digits = _terms(term)
+    scored = sorted(((r, _rank_in_process(r, text, digits)) for r in rows), key=lambda x: (-x[1], x[0].id))
+    if after is not None:
+        scored = [(r, rank) for r, rank in scored if rank < after[0] or (rank == after[0] and r.id > after[1])]
+    return scored
+
+
+def ranked(db: Session, query, term: str, skip: int = 0, limit: int = 100):
+    # query уже отфильтрован по видимости и match_filter
+    if ranks_in_sql(db):
+        text, _, digits = _terms(term)
+        rank = _rank_expr(text, digits)
+        return query.order_by(rank.desc(), models.Patient.id).offset(skip).limit(limit).all()
+    return [row for row, _ in rank_rows(query.all(), term)[skip:skip + limit]]
+
+
+def ranked_page(db: Session, query, term: str, after=None, limit: int = 100):
+    # keyset по (релевантность по убыванию, id по возрастанию); after = (rank, last_id) из курсора.
+    # Возвращает [(строка, rank)] длиной до limit + 1 — лишняя строка означает, что есть следующая страница
+    if not ranks_in_sql(db):
+        # без pg_trgm ранжирование в процессе: совпадения уже сужены match_filter
+        return rank_rows(query.all(), term, after)[:limit + 1]
+    text, _, digits = _terms(term)
+    p = models.Patient
+    entity = len(query.column_descriptions) == 1 and query.column_descriptions[0]["expr"] is p
+    rank = _rank_expr(text, digits)
+    page = query.add_columns(rank.label("search_rank"))
+    if after is not None:
+        page = page.filter(or_(rank < after[0], and_(rank == after[0], p.id > after[1])))
+    rows = page.order_by(rank.desc(), p.id).limit(limit + 1).all()
+    return [(row[0] if entity else row, row.search_rank) for row in rows]
+
+
+# ---- reindex ----
+# python -m backend.search reindex — заполнить search_name / snils_digits / link_key для существующих строк
+def reindex(db: Session, batch_size: int = 5000, progress=None) -> int:
+    # progress(сделано, всего) — после каждой пачки (фоновая задача, backend/jobs.py)
+    p = models.Patient
+    last_id, total = 0, 0
+    count = db.execute(select(func.count(p.id))).scalar() if progress else 0
+    while True:
+        rows = db.execute(
+            select(p.id, p.family_name, p.given_name, p.middle_name, p.snils, p.dob)
+            .where(p.id > last_id).order_by(p.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return total
+        db.execute(
+            update(p),
+            [{"id": r.id, **search_columns(r._asdict())} for r in rows],
+        )
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+        if progress:
+            progress(total, count)
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Поисковый индекс пациентов")
+    parser.add_argument("command", choices=("reindex",))
+    parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        print(f"reindexed {reindex(db)} patients")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
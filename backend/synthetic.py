@@ -0,0 +1,287 @@
+# backend/synthetic.py
+# Генератор синтетических родословных для нагрузочных тестов и бенчмарков.
+# Семья строится от пары основателей вниз по поколениям: дети пары (Пуассон со средним sibship),
+# браки с людьми извне (marry_in) и внутри семьи между двоюродными (consanguinity, даёт петли).
+# СГХС наследуется доминантно: ребёнок носителя болеет с вероятностью 1/2.
+# Загрузка — пачками, как в bulk_import (insert ... returning, COPY на PostgreSQL).
+#
+#   python -m backend.synthetic --patients 1000000 --creator bench@example.com --manifest families.json
+import argparse
+import json
+import math
+import random
+import sys
+from datetime import date
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .bulk_import import copy_rows
+from .families import assign as assign_families
+from .search import search_columns
+
+MALE_NAMES = {
+    "Александр": "Александров", "Алексей": "Алексеев", "Андрей": "Андреев", "Владимир": "Владимиров",
+    "Дмитрий": "Дмитриев", "Иван": "Иванов", "Михаил": "Михайлов", "Николай": "Николаев",
+    "Павел": "Павлов", "Сергей": "Сергеев", "Пётр": "Петров", "Фёдор": "Фёдоров",
+}
+FEMALE_NAMES = ["Анна", "Елена", "Мария", "Наталья", "Ольга", "Светлана", "Татьяна", "Ирина", "Юлия", "Ксения"]
+SURNAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков", "Фёдоров",
+    "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов",
+    "Никитин", "Орлов", "Андреев", "Макаров", "Захаров", "Зайцев", "Соловьёв", "Борисов", "Яковлев",
+]
+LDLR_ONSET = (18, 60)
+# частота гетерозиготной СГХС в популяции — у людей, пришедших в семью извне
+POPULATION_FH = 1 / 250
+
+
+class FamilySpec:
+    def __init__(self, depth: int = 4, sibship: float = 2.5, marry_in: float = 0.8,
+                 consanguinity: float = 0.02, founder_fh: float = 0.3, max_size: int = None):
+        self.depth = depth
+        self.sibship = sibship
+        self.marry_in = marry_in
+        self.consanguinity = consanguinity
+        self.founder_fh = founder_fh
+        self.max_size = max_size
+
+
+class Family:
+    """Семья в локальных индексах: people[i] — поля Patient, edges — пары индексов."""
+
+    def __init__(self):
+        self.people = []
+        self.parents = []   # (родитель, ребёнок)
+        self.spouses = []   # (муж, жена)
+        self.traits = []    # (индекс, name, onset_age)
+        self.generations = 0
+
+    def __len__(self):
+        return len(self.people)
+
+
+def snils(number: int) -> str:
+    # 9 цифр номера + контрольное число по правилам ПФР
+    digits = f"{number:09d}"
+    total = sum(int(d) * (9 - i) for i, d in enumerate(digits))
+    check = total % 101
+    if check == 100:
+        check = 0
+    return f"{digits[:3]}-{digits[3:6]}-{digits[6:]} {check:02d}"
+
+
+def _female_surname(surname: str) -> str:
+    if surname.endswith(("ов", "ев", "ёв", "ин")):
+        return surname + "а"
+    return surname
+
+
+def _patronymic(father_name: str, sex: str) -> str:
+    base = MALE_NAMES.get(father_name, "Иванов")
+    stem = base[:-2] if base.endswith(("ов", "ев")) else base
+    if base.endswith("ев"):
+        return stem + ("евич" if sex == "male" else "евна")
+    return stem + ("ович" if sex == "male" else "овна")
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # алгоритм Кнута: средние размеры сибства малы
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+class _Builder:
+    def __init__(self, rng: random.Random, spec: FamilySpec, snils_counter):
+        self.rng = rng
+        self.spec = spec
+        self.snils = snils_counter
+        self.family = Family()
+        self.info = []  # (sex, given_name, family_name(муж. форма), fh, birth_year)
+
+    def person(self, sex, surname, birth_year, fh, father_name=None):
+        rng = self.rng
+        given = rng.choice(list(MALE_NAMES)) if sex == "male" else rng.choice(FEMALE_NAMES)
+        dob = date(birth_year, rng.randint(1, 12), rng.randint(1, 28))
+        self.family.people.append({
+            "given_name": given,
+            "family_name": surname if sex == "male" else _female_surname(surname),
+            "middle_name": _patronymic(father_name or rng.choice(list(MALE_NAMES)), sex),
+            "sex": sex,
+            "dob": dob,
+            "snils": snils(next(self.snils)),
+            "family_hyperchol": fh,
+            "smoking": rng.random() < 0.2,
+            "hypertension": rng.random() < (0.45 if birth_year < 1970 else 0.15),
+            "diabetes": rng.random() < 0.08,
+            "weight": rng.randint(50, 110),
+            "height": rng.randint(150, 195),
+        })
+        self.info.append((sex, given, surname, fh, birth_year))
+        index = len(self.family.people) - 1
+        if fh:
+            self.family.traits.append((index, "LDLR", rng.randint(*LDLR_ONSET)))
+        return index
+
+    def outsider(self, sex, birth_year):
+        return self.person(sex, self.rng.choice(SURNAMES), birth_year, self.rng.random() < POPULATION_FH)
+
+    def full(self):
+        return self.spec.max_size is not None and len(self.family) >= self.spec.max_size
+
+    def build(self, start_year: int):
+        rng, spec, fam = self.rng, self.spec, self.family
+        husband = self.person("male", rng.choice(SURNAMES), start_year, rng.random() < spec.founder_fh)
+        wife = self.outsider("female", start_year + rng.randint(-3, 3))
+        fam.spouses.append((husband, wife))
+        couples = [(husband, wife)]
+        fam.generations = 1
+        for _ in range(1, spec.depth):
+            generation = []
+            for father, mother in couples:
+                f_sex, f_given, f_surname, f_fh, f_year = self.info[father]
+                m_fh, m_year = self.info[mother][3], self.info[mother][4]
+                for _ in range(_poisson(rng, spec.sibship)):
+                    if self.full():
+                        break
+                    sex = "male" if rng.random() < 0.5 else "female"
+                    fh = (f_fh and rng.random() < 0.5) or (m_fh and rng.random() < 0.5)
+                    child = self.person(sex, f_surname, max(m_year, f_year) + rng.randint(20, 35), fh, f_given)
+                    fam.parents.append((father, child))
+                    fam.parents.append((mother, child))
+                    generation.append((child, (father, mother)))
+            if not generation:
+                break
+            fam.generations += 1
+            couples = self._marry(generation)
+            if not couples or self.full():
+                break
+        return fam
+
+    def _marry(self, generation):
+        rng, spec = self.rng, self.spec
+        rng.shuffle(generation)
+        married, couples = set(), []
+        for child, parents in generation:
+            if child in married:
+                continue
+            sex, year = self.info[child][0], self.info[child][4]
+            spouse = None
+            if rng.random() < spec.consanguinity:
+                # двоюродные: тот же ряд поколения, другие родители
+                for other, other_parents in generation:
+                    if other not in married and other != child and other_parents != parents \
+                            and self.info[other][0] != sex:
+                        spouse = other
+                        break
+            if spouse is None and rng.random() < spec.marry_in and not self.full():
+                spouse = self.outsider("female" if sex == "male" else "male", year + rng.randint(-4, 4))
+            if spouse is None:
+                continue
+            married.update((child, spouse))
+            pair = (child, spouse) if sex == "male" else (spouse, child)
+            self.family.spouses.append(pair)
+            couples.append(pair)
+        return couples
+
+
+def generate(total: int, spec: FamilySpec = None, seed: int = 0, first_snils: int = None):
+    # семьи до набора total пациентов; размер последней семьи подрезается.
+    # СНИЛС уникален в БД: разные seed берут непересекающиеся диапазоны номеров
+    spec = spec or FamilySpec()
+    if first_snils is None:
+        first_snils = 100_000_000 + seed * 2_000_000
+    rng = random.Random(seed)
+    counter = iter(range(first_snils, 10 ** 9))
+    produced = 0
+    while produced < total:
+        family_spec = FamilySpec(spec.depth, spec.sibship, spec.marry_in, spec.consanguinity, spec.founder_fh,
+                                 min(spec.max_size or total, total - produced))
+        family = _Builder(rng, family_spec, counter).build(rng.randint(1920, 1950))
+        produced += len(family)
+        yield family
+
+
+# ---- loading ----
+def _flush(db: Session, families, creator_id: int, manifest):
+    values = []
+    for family in families:
+        for person in family.people:
+            values.append({**person, **search_columns(person), "created_by_id": creator_id})
+    ids = db.execute(
+        insert(models.Patient).returning(models.Patient.id, sort_by_parameter_order=True), values
+    ).scalars().all()
+    relations, links, traits, members = [], [], [], []
+    offset = 0
+    for family in families:
+        local = ids[offset:offset + len(family)]
+        offset += len(family)
+        # семья известна заранее — family_id пишется сразу, без union по рёбрам
+        members += [{"pid": pid, "fid": min(local)} for pid in local]
+        relations += [{"parent_id": local[p], "child_id": local[c], "relationship_type": "biological"}
+                      for p, c in family.parents]
+        links += [{"patient1_id": local[h], "patient2_id": local[w], "link_type": "spouse"} for h, w in family.spouses]
+        traits += [{"patient_id": local[i], "name": name, "onset_age": onset} for i, name, onset in family.traits]
+        manifest.append({"proband": local[0], "size": len(family), "generations": family.generations})
+    copy_rows(db, models.Relation, relations)
+    copy_rows(db, models.PatientLink, links)
+    copy_rows(db, models.Trait, traits)
+    assign_families(db, members)
+    db.commit()
+
+
+def load(db: Session, families, creator_id: int, batch_size: int = 5000):
+    # возвращает манифест: первый пациент (основатель) каждой семьи, её размер и число поколений
+    manifest, batch, pending = [], [], 0
+    for family in families:
+        batch.append(family)
+        pending += len(family)
+        if pending >= batch_size:
+            _flush(db, batch, creator_id, manifest)
+            batch, pending = [], 0
+    if batch:
+        _flush(db, batch, creator_id, manifest)
+    return manifest
+
+
+def main(argv=None):
+    from .database import SessionLocal
+    from .crud import get_user_by_email
+
+    parser = argparse.ArgumentParser(description="Синтетические родословные для нагрузочных тестов")
+    parser.add_argument("--patients", type=int, default=10000, help="сколько пациентов создать (до 1M)")
+    parser.add_argument("--depth", type=int, default=4, help="число поколений")
+    parser.add_argument("--sibship", type=float, default=2.5, help="среднее число детей пары")
+    parser.add_argument("--marry-in", type=float, default=0.8, help="доля браков с людьми извне семьи")
+    parser.add_argument("--consanguinity", type=float, default=0.02, help="доля браков двоюродных")
+    parser.add_argument("--max-family", type=int, default=None, help="предел размера одной семьи")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--creator", required=True, help="email пользователя-владельца записей")
+    parser.add_argument("--manifest", help="куда записать JSON-манифест семей (для бенчмарков)")
+    args = parser.parse_args(argv)
+
+    spec = FamilySpec(args.depth, args.sibship, args.marry_in, args.consanguinity, max_size=args.max_family)
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, args.creator)
+        if not user:
+            parser.error(f"пользователь {args.creator} не найден")
+        manifest = load(db, generate(args.patients, spec, seed=args.seed), user.id, args.batch_size)
+    finally:
+        db.close()
+    if args.manifest:
+        with open(args.manifest, "w", encoding="utf-8") as f:
+            json.dump({"seed": args.seed, "patients": args.patients, "families": manifest}, f)
+    sizes = sorted(f["size"] for f in manifest)
+    print(f"families: {len(manifest)}, patients: {sum(sizes)}, largest: {sizes[-1] if sizes else 0}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+# backend/tests/test_database.py
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import asyncpg, psycopg2
+
+from ..database import async_url
+from .. import crud, models
+
+
+def test_async_url_maps_drivers():
+    assert async_url("postgresql://u:p@h:5432/db").drivername == "postgresql+asyncpg"
+    assert async_url("postgresql+psycopg2://u:p@h/db").drivername == "postgresql+asyncpg"
+    assert async_url("sqlite:////tmp/x.db").drivername == "sqlite+aiosqlite"
+
+
+def test_async_url_rewrites_sslmode():
+    url = async_url("postgresql://u:p@h/db?sslmode=require")
+    assert url.query == {"ssl": "require"}
+
+
+def test_estimate_params_follow_driver_paramstyle():
+    # count=estimate выполняет EXPLAIN через exec_driver_sql: под asyncpg параметры позиционные
+    stmt = select(models.Patient.id).where(models.Patient.created_by_id == 7, models.Patient.family_name == "x")
+    positional = crud.driver_params(stmt.compile(dialect=asyncpg.dialect()))
+    assert positional == (7, "x")
+    named = crud.driver_params(stmt.compile(dialect=psycopg2.dialect()))
+    assert sorted(named.values(), key=str) == [7, "x"]
@@ -0,0 +1,74 @@
+# backend/tests/test_families.py
+import random
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from .. import crud, families, models, schemas
+from ..database import Base
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = models.User(email="families@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        yield db, user.id
+    engine.dispose()
+
+
+def _expected(db):
+    # полный пересчёт с нуля — эталон для инкрементального union / split
+    members = db.execute(select(models.Patient.id)).scalars().all()
+    edges = db.execute(select(models.Relation.parent_id, models.Relation.child_id)).all()
+    edges += db.execute(select(models.PatientLink.patient1_id, models.PatientLink.patient2_id)).all()
+    return {pid: root for root, component in families._components(members, edges).items() for pid in component}
+
+
+def _stored(db):
+    return dict(db.execute(select(models.Patient.id, models.Patient.family_id)).all())
+
+
+def test_incremental_family_ids_match_full_recompute(session):
+    db, uid = session
+    rng = random.Random(7)
+    ids = [crud.create_patient(db, schemas.PatientCreate(given_name=f"P{i}"), uid).id for i in range(40)]
+    relations, links = [], []
+    for step in range(120):
+        a, b = rng.sample(ids, 2)
+        action = rng.random()
+        if action < 0.45:
+            relations.append(crud.create_relation(db, schemas.RelationCreate(parent_id=a, child_id=b)).id)
+        elif action < 0.7:
+            links.append(crud.create_patient_link(db, schemas.PatientLinkCreate(
+                patient1_id=a, patient2_id=b, link_type=f"sibling-{step}")).id)
+        elif action < 0.85 and relations:
+            crud.delete_relation(db, relations.pop(rng.randrange(len(relations))))
+        elif links:
+            crud.delete_patient_link(db, links.pop(rng.randrange(len(links))))
+        if step % 30 == 29:
+            victim = ids.pop(rng.randrange(len(ids)))
+            crud.delete_patient(db, victim)
+            relations = [r for r in relations if db.get(models.Relation, r) is not None]
+            links = [l for l in links if db.get(models.PatientLink, l) is not None]
+        assert _stored(db) == _expected(db)
+
+
+def test_backfill_and_family_lookup(session):
+    db, uid = session
+    ids = [crud.create_patient(db, schemas.PatientCreate(given_name=n), uid).id for n in "abcd"]
+    db.add_all([models.Relation(parent_id=ids[0], child_id=ids[1]), models.PatientLink(
+        patient1_id=ids[2], patient2_id=ids[1], link_type="sibling")])
+    db.query(models.Patient).update({models.Patient.family_id: None})
+    db.commit()
+    # до backfill поиск семьи идёт обходом графа
+    assert crud.find_component(db, ids[2]) == set(ids[:3])
+    assert families.backfill(db) == 4
+    assert _stored(db) == _expected(db)
+    assert crud.find_component(db, ids[2], traversal="family") == set(ids[:3])
+    rows, _ = crud.list_families(db, models.User(id=uid, role="admin"))
+    assert rows == [{"family_id": ids[0], "size": 3, "probands": 0}]
@@ -0,0 +1,123 @@
+# backend/tests/test_jobs.py
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from .. import jobs, models
+from ..database import Base, SessionLocal, engine
+from ..main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def job_env(tmp_path, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(jobs, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOBS_RETRY_DELAY", 0)
+    _drain()
+    yield
+
+
+def _drain():
+    while jobs.run_next("test"):
+        pass
+
+
+def _user(role="researcher"):
+    email = f"jobs-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"email": email, "password": "testpass123", "role": role})
+    token = client.post("/token", data={"username": email, "password": "testpass123"}).json()["access_token"]
+    with SessionLocal() as db:
+        uid = db.query(models.User.id).filter(models.User.email == email).scalar()
+    return uid, {"Authorization": f"Bearer {token}"}
+
+
+def test_export_and_import_run_as_background_jobs():
+    uid, headers = _user()
+    upload = "given_name,family_name,dob\nAnna,Jobova,1970-01-01\nBoris,Jobov,1972-02-02\n"
+    r = client.post("/import/patients", params={"background": "true"}, headers=headers,
+                    files={"file": ("cohort.csv", upload.encode(), "text/csv")})
+    assert r.status_code == 202 and r.json()["status"] == "queued"
+    imported = r.json()["id"]
+
+    r = client.post("/jobs", json={"kind": "export.patients", "params": {"format": "csv"}}, headers=headers)
+    assert r.status_code == 202
+    exported = r.json()["id"]
+    _drain()
+
+    job = client.get(f"/jobs/{imported}", headers=headers).json()
+    assert job["status"] == "succeeded" and job["result"]["inserted"] == 2 and job["result_url"] is None
+    assert not [f for f in os.listdir(jobs.JOBS_DIR) if f.startswith("upload-")]
+    job = client.get(f"/jobs/{exported}", headers=headers).json()
+    assert job["status"] == "succeeded" and job["progress"] == 1.0 and job["result"]["rows"] == 2
+    body = client.get(job["result_url"], headers=headers)
+    assert body.status_code == 200 and body.text.count("\n") == 3 and "Jobova" in body.text
+
+    # чужие задачи не видны; пересчёт реестра — только администратору
+    _, other = _user()
+    assert client.get(f"/jobs/{exported}", headers=other).status_code == 404
+    assert client.get(f"/jobs/{exported}/result", headers=other).status_code == 404
+    assert client.post("/jobs", json={"kind": "linkage.scan"}, headers=headers).status_code == 403
+    assert client.post("/jobs", json={"kind": "import"}, headers=headers).status_code == 400
+
+
+def test_failed_job_is_retried_with_backoff(monkeypatch):
+    calls = []
+
+    def flaky(db, ctx, fail_times):
+        calls.append(ctx.job_id)
+        if len(calls) <= fail_times:
+            raise RuntimeError("temporary")
+        return {"ok": True}
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.flaky", jobs.Handler(flaky, admin=False, max_attempts=2))
+    uid, headers = _user()
+    with SessionLocal() as db:
+        retried = jobs.enqueue(db, "test.flaky", {"fail_times": 1}, uid).id
+        failed = jobs.enqueue(db, "test.flaky", {"fail_times": 10}, uid).id
+
+    assert jobs.run_next("test")
+    job = client.get(f"/jobs/{retried}", headers=headers).json()
+    assert job["status"] == "queued" and job["attempts"] == 1 and "temporary" in job["error"]
+    _drain()
+    job = client.get(f"/jobs/{retried}", headers=headers).json()
+    assert job["status"] == "succeeded" and job["attempts"] == 2 and job["result"] == {"ok": True}
+    job = client.get(f"/jobs/{failed}", headers=headers).json()
+    assert job["status"] == "failed" and job["attempts"] == 2
+
+    # ручной повтор начинает попытки заново
+    r = client.post(f"/jobs/{failed}/retry", headers=headers)
+    assert r.status_code == 200 and r.json()["status"] == "queued" and r.json()["attempts"] == 0
+    assert client.post(f"/jobs/{retried}/retry", headers=headers).status_code == 409
+
+
+def test_cancel_queued_running_and_stale_jobs(monkeypatch):
+    def long_running(db, ctx):
+        # отмена приходит из API, пока задача выполняется
+        with SessionLocal() as other:
+            jobs.cancel(other, ctx.job_id, models.User(id=ctx.created_by_id, role="researcher"))
+        ctx.check_cancelled()
+        return {"finished": True}
+
+    monkeypatch.setitem(jobs.HANDLERS, "test.long", jobs.Handler(long_running, admin=False, max_attempts=3))
+    uid, headers = _user()
+    with SessionLocal() as db:
+        queued = jobs.enqueue(db, "test.long", {}, uid).id
+        running = jobs.enqueue(db, "test.long", {}, uid).id
+        stale = jobs.enqueue(db, "test.long", {}, uid).id
+        # воркер забрал задачу и пропал: heartbeat давно не обновлялся
+        db.query(models.Job).filter(models.Job.id == stale).update({
+            "status": jobs.RUNNING, "attempts": 3, "heartbeat_at": datetime.utcnow() - timedelta(hours=1),
+        })
+        db.commit()
+
+    r = client.post(f"/jobs/{queued}/cancel", headers=headers)
+    assert r.status_code == 200 and r.json()["status"] == "cancelled"
+    _drain()
+    statuses = {j["id"]: j["status"] for j in client.get("/jobs", headers=headers).json()}
+    assert statuses == {queued: "cancelled", running: "cancelled", stale: "failed"}
+    assert client.post(f"/jobs/{queued}/cancel", headers=headers).status_code == 409
@@ -0,0 +1,67 @@
+# backend/tests/test_kinship.py
+from types import SimpleNamespace
+
+from .. import kinship, synthetic
+
+
+def rel(parent_id, child_id):
+    return SimpleNamespace(parent_id=parent_id, child_id=child_id)
+
+
+def link(a, b, link_type):
+    return SimpleNamespace(patient1_id=a, patient2_id=b, link_type=link_type)
+
+
+def test_first_cousin_marriage():
+    # 1 + 2 -> 3, 4; 3 + 5 -> 6; 4 + 7 -> 8; 6 + 8 (двоюродные) -> 9
+    relations = [rel(1, 3), rel(2, 3), rel(1, 4), rel(2, 4), rel(3, 6), rel(5, 6), rel(4, 8), rel(7, 8),
+                 rel(6, 9), rel(8, 9)]
+    result = kinship.family_kinship(9, range(1, 10), relations, [link(3, 5, "spouse")])
+    assert result["inbreeding"] == 1 / 16
+    by_id = {r["id"]: r for r in result["relatives"]}
+    assert by_id[6]["kinship"] == 1 / 4 + 1 / 32 and by_id[6]["degree"] == 1
+    assert by_id[1]["kinship"] == 1 / 8 and by_id[1]["degree"] == 2
+    assert by_id[5]["relatedness"] == 1 / 4
+
+
+def test_siblings_by_link_share_parents_and_spouse_is_unrelated():
+    result = kinship.family_kinship(1, [1, 2, 3], [], [link(1, 2, "sibling"), link(1, 3, "spouse")], matrix=True)
+    by_id = {r["id"]: r for r in result["relatives"]}
+    assert by_id[2]["kinship"] == 1 / 4
+    assert by_id[3]["kinship"] == 0 and by_id[3]["degree"] is None
+    # фиктивные родители сибсов в ответ не попадают
+    assert sorted(result["matrix"]["ids"]) == [1, 2, 3]
+
+
+def test_ancestor_cycle_is_reported_not_fatal():
+    result = kinship.family_kinship(1, [1, 2], [rel(1, 2), rel(2, 1)], [])
+    assert len(result["ignored"]) == 1
+    assert result["relatives"][0]["kinship"] == 1 / 4
+
+
+def test_matrix_matches_pairwise_recursion():
+    # векторный расчёт по слоям против прямой рекурсии по определению
+    family = next(synthetic.generate(200, synthetic.FamilySpec(depth=5, consanguinity=0.5, max_size=200), seed=4))
+    parents = {}
+    for p, c in family.parents:
+        parents.setdefault(c, []).append(p)
+    memo = {}
+
+    def phi(a, b):
+        if a is None or b is None:
+            return 0.0
+        if a == b:
+            ps = parents.get(a, [None, None])
+            return 0.5 * (1 + phi(ps[0], ps[1]))
+        if a < b:  # индексы генератора растут по поколениям: потомок всегда с большим индексом
+            a, b = b, a
+        key = (a, b)
+        if key not in memo:
+            ps = parents.get(a, [None, None])
+            memo[key] = 0.5 * (phi(ps[0], b) + phi(ps[1], b))
+        return memo[key]
+
+    order, matrix, _ = kinship.kinship_matrix(set(range(len(family))), parents)
+    for i, a in enumerate(order[:40]):
+        for j, b in enumerate(order):
+            assert abs(matrix[i, j] - phi(a, b)) < 1e-6
@@ -0,0 +1,58 @@
+# backend/tests/test_layout.py
+from .. import synthetic
+from ..layout import NODE_SPACING, genogram_layout
+from ..pedigree import PedigreeGraph
+
+
+def pedigree(parents, spouses=(), root=None, dob=None):
+    g = PedigreeGraph.from_edges([], [])
+    for p, c in parents:
+        g.add_relation(p, c)
+    for a, b in spouses:
+        g.add_link(a, b, "spouse")
+    generation = g.assign_generations(root if root is not None else min(g.nodes))
+    nodes = [{"id": n, "generation": generation[n], "dob": (dob or {}).get(n)} for n in sorted(g.nodes)]
+    return {"nodes": nodes, "links": g.links(), "conflicts": []}
+
+
+def positions(result):
+    return {n["id"]: (n["x"], n["y"]) for n in result["nodes"]}
+
+
+def test_spouses_adjacent_and_sibship_in_birth_order():
+    # 1 + 2 -> 3, 4, 5 (рождены 5, 3, 4); 4 + 6
+    payload = pedigree([(p, c) for p in (1, 2) for c in (3, 4, 5)] + [(4, 7), (6, 7)], [(1, 2), (4, 6)],
+                       dob={3: "1960-01-01", 4: "1962-01-01", 5: "1955-01-01"})
+    pos = positions(genogram_layout(payload))
+    assert abs(pos[1][0] - pos[2][0]) == NODE_SPACING
+    assert abs(pos[4][0] - pos[6][0]) == NODE_SPACING
+    assert pos[5][0] < pos[3][0] < pos[4][0]
+    assert pos[1][1] < pos[3][1] == pos[6][1] < pos[7][1]
+    # ребёнок между родителями
+    assert min(pos[4][0], pos[6][0]) <= pos[7][0] <= max(pos[4][0], pos[6][0])
+
+
+def test_barycenter_ordering_removes_crossings():
+    # по id дети стоят в обратном порядке к своим родителям: 1 + 2 -> 6, 3 + 4 -> 5
+    payload = pedigree([(1, 6), (2, 6), (3, 5), (4, 5)], [(1, 2), (3, 4), (5, 6)])
+    result = genogram_layout(payload)
+    assert result["layout"]["crossings"] == 0
+    pos = positions(result)
+    assert (pos[1][0] < pos[3][0]) == (pos[6][0] < pos[5][0])
+    # исходный payload (он лежит в кэше) не меняется
+    assert "x" not in payload["nodes"][0]
+
+
+def test_synthetic_families_are_deterministic_without_overlaps():
+    for family in synthetic.generate(600, synthetic.FamilySpec(depth=5, consanguinity=0.3), seed=4):
+        if not family.parents:
+            continue
+        payload = pedigree(family.parents, family.spouses)
+        result = genogram_layout(payload)
+        assert result == genogram_layout(payload)
+        rows = {}
+        for x, y in positions(result).values():
+            rows.setdefault(y, []).append(x)
+        for xs in rows.values():
+            xs.sort()
+            assert all(b - a >= NODE_SPACING for a, b in zip(xs, xs[1:]))
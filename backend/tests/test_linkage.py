@@ -0,0 +1,104 @@
+# backend/tests/test_linkage.py
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from .. import crud, families, linkage, models, schemas
+from ..database import Base
+from ..search import link_key, phonetic_key
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = models.User(email="linkage@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        yield db, user.id
+    engine.dispose()
+
+
+def _patient(db, uid, family_name, given_name, middle_name=None, dob=None, sex="M", **extra):
+    data = schemas.PatientCreate(given_name=given_name, family_name=family_name, middle_name=middle_name,
+                                 dob=dob, sex=sex, **extra)
+    return crud.create_patient(db, data, uid)
+
+
+def test_blocking_key_and_score():
+    assert phonetic_key("Иваннов") == phonetic_key("ИВОНОВ") == phonetic_key("Иванов ") == "ифанаф"
+    assert link_key("Семёнова", date(1961, 2, 3)) == link_key("семенова", date(1961, 12, 30))
+    assert link_key("Петров", None) is None
+
+    a = schemas.PatientCreate(given_name="Иван", family_name="Иванов", middle_name="Петрович", dob=date(1960, 3, 5), sex="M")
+    swapped = a.model_copy(update={"family_name": "Иваннов", "dob": date(1960, 5, 3)})
+    initial = a.model_copy(update={"given_name": "И.", "middle_name": None})
+    brother = a.model_copy(update={"given_name": "Пётр", "middle_name": "Петрович", "dob": date(1960, 8, 20)})
+    assert linkage.score(a, swapped) >= linkage.LINKAGE_THRESHOLD
+    assert linkage.score(a, initial) >= linkage.LINKAGE_THRESHOLD
+    assert linkage.score(a, brother) < linkage.LINKAGE_THRESHOLD
+    assert linkage.score(a, swapped.model_copy(update={"sex": "F"})) == 0
+    assert linkage.score(a.model_copy(update={"snils": "1"}), swapped.model_copy(update={"snils": "2"})) == 0
+
+
+def test_insert_check_and_batch_scan(session, monkeypatch):
+    db, uid = session
+    a = _patient(db, uid, "Кузнецов", "Олег", "Иванович", date(1955, 1, 7))
+    b = _patient(db, uid, "Кузнецов", "Олег", "Иванович", date(1955, 7, 1))
+    _patient(db, uid, "Кузнецов", "Павел", "Олегович", date(1955, 4, 9))
+    assert crud.pending_match_ids(db, b.id) == [a.id]
+
+    # пакетный проход находит то же, уже записанные пары не повторяет
+    monkeypatch.setattr(crud, "LINKAGE_ON_INSERT", False)
+    c = _patient(db, uid, "Кузнецова", "Анна", None, date(1980, 2, 2), sex="F")
+    d = _patient(db, uid, "Кузнецова", "Анна", "Олеговна", date(1980, 2, 2), sex="F")
+    assert crud.pending_match_ids(db, d.id) == []
+    stats = linkage.scan(db)
+    assert stats["matches"] == 1 and stats["blocks"] == 2 and stats["compared"] == 4
+    assert crud.pending_match_ids(db, d.id) == [c.id]
+    assert linkage.scan(db)["matches"] == 0
+
+    # большой блок — окном по отсортированным именам, а не все пары
+    monkeypatch.setattr(linkage, "LINKAGE_MAX_BLOCK", 2)
+    monkeypatch.setattr(linkage, "LINKAGE_WINDOW", 1)
+    db.query(models.PatientMatch).delete()
+    db.commit()
+    stats = linkage.scan(db)
+    assert stats["compared"] == 3 and stats["matches"] == 2
+
+
+def test_merge_repoints_edges_in_one_transaction(session):
+    db, uid = session
+    # дубль создан раньше: после слияния id семьи переходит к следующему по величине члену
+    dup = _patient(db, uid, "Орлов", "Игорь", None, date(1950, 6, 1), snils="123-456-789 00", smoking=True,
+                   traits=[{"name": "СГХС", "onset_age": 40}, {"name": "ИБС", "onset_age": 52}])
+    keep = _patient(db, uid, "Орлов", "Игорь", "Сергеевич", date(1950, 6, 1), traits=[{"name": "СГХС", "onset_age": 40}])
+    assert crud.pending_match_ids(db, keep.id) == [dup.id]
+    wife, son, daughter = (_patient(db, uid, "Орлова", n, sex="F") for n in ("Вера", "Мария", "Ольга"))
+    crud.create_relation(db, schemas.RelationCreate(parent_id=keep.id, child_id=son.id))
+    crud.create_relation(db, schemas.RelationCreate(parent_id=dup.id, child_id=son.id))
+    crud.create_relation(db, schemas.RelationCreate(parent_id=dup.id, child_id=daughter.id))
+    crud.create_relation(db, schemas.RelationCreate(parent_id=dup.id, child_id=keep.id))
+    crud.create_patient_link(db, schemas.PatientLinkCreate(patient1_id=wife.id, patient2_id=dup.id, link_type="spouse"))
+    crud.create_patient_link(db, schemas.PatientLinkCreate(patient1_id=keep.id, patient2_id=wife.id, link_type="spouse"))
+    db.add(models.ImportKey(source="site-b", external_id="42", patient_id=dup.id))
+    db.commit()
+    keep_id, dup_id = keep.id, dup.id
+
+    merged = crud.merge_patients(db, keep_id, dup_id)
+    assert merged.id == keep_id and merged.middle_name == "Сергеевич"
+    assert merged.snils == "123-456-789 00" and merged.smoking is True
+    assert db.get(models.Patient, dup_id) is None
+
+    r, l, t = models.Relation, models.PatientLink, models.Trait
+    assert sorted(db.execute(select(r.parent_id, r.child_id)).all()) == [(keep_id, son.id), (keep_id, daughter.id)]
+    assert [{a, b} for a, b in db.execute(select(l.patient1_id, l.patient2_id))] == [{keep_id, wife.id}]
+    assert sorted(db.execute(select(t.name).where(t.patient_id == keep_id)).scalars()) == ["ИБС", "СГХС"]
+    assert db.execute(select(models.ImportKey.patient_id)).scalar() == keep_id
+    assert db.query(models.PatientMatch).count() == 0
+    # семья — наименьший id оставшихся членов
+    assert {p.family_id for p in db.query(models.Patient)} == {keep_id}
+    assert families.family_of(db, daughter.id) == keep_id
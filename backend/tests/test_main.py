@@ -1,9 +1,12 @@
 # backend/tests/test_main.py
+import json
+import uuid
 import pytest
 from fastapi.testclient import TestClient
 from ..main import app
-from ..database import Base, engine, SessionLocal
-from .. import models
+from ..database import Base, engine, async_engine, SessionLocal
+from .. import models, auth, schemas
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 client = TestClient(app)
@@ -43,6 +46,475 @@ def test_create_patient_and_relations():
     id2 = p2.json()["id"]
     r = client.post("/relations", json={"parent_id": id1, "child_id": id2}, headers=headers)
     assert r.status_code == 200
+    # повтор связи — uq_relations_parent_child
+    r = client.post("/relations", json={"parent_id": id1, "child_id": id2}, headers=headers)
+    assert r.status_code == 400
     rels = client.get("/relations", headers=headers)
     assert rels.status_code == 200
     assert isinstance(rels.json(), list)
+
+def test_pedigree_component():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    ids = [client.post("/patients", json={"given_name": n, "family_name": "Pedigree"}, headers=headers).json()["id"] for n in ("Father", "Mother", "Child", "Stranger")]
+    client.post("/relations", json={"parent_id": ids[0], "child_id": ids[2]}, headers=headers)
+    client.post("/relations", json={"parent_id": ids[1], "child_id": ids[2]}, headers=headers)
+    client.post("/links", json={"patient1_id": ids[0], "patient2_id": ids[1], "link_type": "spouse"}, headers=headers)
+    r = client.get(f"/pedigree/{ids[2]}", headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    gens = {n["id"]: n["generation"] for n in data["nodes"]}
+    assert gens == {ids[0]: -1, ids[1]: -1, ids[2]: 0}
+    assert ids[3] not in gens
+    assert {"source": ids[0], "target": ids[1], "type": "spouse"} in data["links"]
+
+def test_pedigree_etag_and_invalidation():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    parent = client.post("/patients", json={"given_name": "Parent", "family_name": "Etag"}, headers=headers).json()["id"]
+    child = client.post("/patients", json={"given_name": "Child", "family_name": "Etag"}, headers=headers).json()["id"]
+    client.post("/relations", json={"parent_id": parent, "child_id": child}, headers=headers)
+    r1 = client.get(f"/pedigree/{child}", headers=headers)
+    etag = r1.headers["etag"]
+    r2 = client.get(f"/pedigree/{child}", headers={**headers, "If-None-Match": etag})
+    assert r2.status_code == 304
+    # правка родственника меняет семью — старый ETag больше не подходит
+    client.put(f"/patients/{parent}", json={"given_name": "Renamed"}, headers=headers)
+    r3 = client.get(f"/pedigree/{child}", headers={**headers, "If-None-Match": etag})
+    assert r3.status_code == 200
+    assert r3.headers["etag"] != etag
+    assert any(n["given_name"] == "Renamed" for n in r3.json()["nodes"])
+
+def test_bulk_import_reports_row_errors():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    source = f"test-import-{uuid.uuid4().hex}"
+    patients = "external_id;given_name;family_name;dob\nP1;Анна;Импорт;01.02.1960\nP2;Олег;Импорт;\nP3;;Импорт;\n"
+    r = client.post(f"/import/patients?source={source}", files={"file": ("cohort.csv", patients)}, headers=headers)
+    assert r.status_code == 200
+    report = r.json()
+    assert report["inserted"] == 2
+    assert [e["line"] for e in report["errors"]] == [4]
+    relations = '{"parent": "P1", "child": "P2"}\n{"parent": "P1", "child": "missing"}\n'
+    r = client.post(f"/import/relations?source={source}", files={"file": ("rel.ndjson", relations)}, headers=headers)
+    assert r.json()["inserted"] == 1
+    assert r.json()["error_count"] == 1
+    # повтор связи нарушает UNIQUE(patient1_id, patient2_id, link_type): на PostgreSQL это путь COPY,
+    # ошибка должна стать ошибкой строки, а не 500
+    links = "patient1;patient2;link_type\nP1;P2;spouse\nP1;P2;spouse\n"
+    r = client.post(f"/import/links?source={source}", files={"file": ("links.csv", links)}, headers=headers)
+    assert r.status_code == 200
+    assert r.json()["inserted"] == 1
+    assert [e["line"] for e in r.json()["errors"]] == [3]
+
+def test_export_patients_stream():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = client.get("/patients/export?format=ndjson", headers=headers)
+    assert r.status_code == 200
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    me = client.get("/users/me", headers=headers).json()
+    assert rows and all(row["created_by_id"] == me["id"] for row in rows)
+    r = client.get("/patients/export?format=csv", headers=headers)
+    assert r.text.splitlines()[0].startswith("id,given_name,family_name")
+
+def test_patients_keyset_pagination():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "sort": "family_name", "count": "exact"}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/patients", params=params, headers=headers)
+        assert r.status_code == 200
+        seen += [p["id"] for p in r.json()]
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == int(r.headers["x-total-count"])
+    assert client.get("/patients", params={"cursor": "broken"}, headers=headers).status_code == 400
+
+def test_search_folds_case_and_yo():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    snils = str(uuid.uuid4().int)[:11]
+    p = client.post("/patients", json={"given_name": "Пётр", "family_name": "Сёмин", "snils": snils}, headers=headers).json()
+    for term in ("семин петр", "СЁМИН", snils[:6]):
+        r = client.get("/patients", params={"search": term}, headers=headers)
+        assert r.status_code == 200
+        assert p["id"] in [x["id"] for x in r.json()]
+
+def test_search_keyset_pagination():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    for given in ("Ольга", "Олег", "Оксана"):
+        client.post("/patients", json={"given_name": given, "family_name": "Курсоров"}, headers=headers)
+    seen, cursor = [], None
+    while True:
+        params = {"search": "курсоров", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/patients", params=params, headers=headers)
+        assert r.status_code == 200
+        seen += [p["id"] for p in r.json()]
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) >= 3
+    r = client.get("/patients", params={"search": "курсоров", "sort": "family_name"}, headers=headers)
+    assert r.status_code == 400
+
+def test_patients_sparse_fields():
+    email = "testuser@example.com"
+    password = "testpass123"
+    r = client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = client.get("/patients", params={"fields": "family_name,given_name", "limit": 5}, headers=headers)
+    assert r.status_code == 200
+    assert all(set(p) == {"id", "family_name", "given_name"} for p in r.json())
+    r = client.get("/patients", params={"fields": "given_name", "include": "traits"}, headers=headers)
+    assert all(set(p) == {"id", "given_name", "traits"} for p in r.json())
+    assert client.get("/patients", params={"fields": "hashed_password"}, headers=headers).status_code == 400
+
+def test_metrics_endpoint():
+    client.get("/health")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    body = r.text
+    assert 'pedigree_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in body
+    assert 'pedigree_db_queries_per_request_count{route="/health"}' in body
+    assert "pedigree_db_pool_checkouts_total" in body
+    assert 'pedigree_cache_stat{cache="pedigree",stat="hits"}' in body
+
+def _new_user(role="researcher"):
+    email = f"principal-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/register", json={"email": email, "password": "testpass123", "full_name": "P", "role": role})
+    token = client.post("/token", data={"username": email, "password": "testpass123"}).json()["access_token"]
+    return email, {"Authorization": f"Bearer {token}"}
+
+def _set_user(email, **values):
+    with SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.email == email).one()
+        for k, v in values.items():
+            setattr(user, k, v)
+        db.commit()
+
+def test_principal_cache_skips_users_query():
+    email, headers = _new_user()
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        client.get("/users/me", headers=headers)
+        first = sum("FROM users" in s for s in statements)
+        client.get("/users/me", headers=headers)
+        second = sum("FROM users" in s for s in statements) - first
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert second == 0
+
+def test_principal_cache_invalidated_on_user_change():
+    email, headers = _new_user()
+    assert client.get("/users/me", headers=headers).json()["role"] == "researcher"
+    _set_user(email, role="admin")
+    assert auth.principal_cache.get(email) is None
+    assert client.get("/users/me", headers=headers).json()["role"] == "admin"
+    _set_user(email, is_active=False)
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+def test_trusted_role_claims_only_on_read_routes(monkeypatch):
+    email, headers = _new_user()
+    monkeypatch.setattr(auth, "TRUST_ROLE_CLAIMS", True)
+    _set_user(email, is_active=False)
+    # без снимка в кэше read-only маршрут верит токену
+    assert client.get("/patients", headers=headers).status_code == 200
+    # маршруты на get_current_user всегда проверяют пользователя в БД
+    assert client.get("/users/me", headers=headers).status_code == 401
+    r = client.post("/patients", json={"given_name": "X", "family_name": "Y"}, headers=headers)
+    assert r.status_code == 401
+    # снимок из кэша сильнее токена
+    assert client.get("/patients", headers=headers).status_code == 401
+
+def test_login_returns_503_when_hasher_queue_full(monkeypatch):
+    monkeypatch.setattr(auth.password_hasher, "max_pending", 0)
+    r = client.post("/token", data={"username": "testuser@example.com", "password": "testpass123"})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+
+def test_login_rehashes_with_current_cost():
+    from passlib.context import CryptContext
+
+    email, _ = _new_user()
+    cheap = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("testpass123")
+    _set_user(email, hashed_password=cheap)
+    r = client.post("/token", data={"username": email, "password": "testpass123"})
+    assert r.status_code == 200
+    with SessionLocal() as db:
+        stored = db.query(models.User).filter(models.User.email == email).one().hashed_password
+    assert stored != cheap
+    assert stored.split("$")[2] == "%02d" % auth.BCRYPT_ROUNDS
+    assert client.post("/token", data={"username": email, "password": "testpass123"}).status_code == 200
+
+def test_sync_pedigree_matches_api():
+    # синхронный путь (скрипты, импорт) и асинхронный API строят одну и ту же генограмму
+    from .. import crud
+
+    email, headers = _new_user()
+    a = client.post("/patients", json={"given_name": "A", "family_name": "Sync"}, headers=headers).json()
+    b = client.post("/patients", json={"given_name": "B", "family_name": "Sync"}, headers=headers).json()
+    client.post("/relations", json={"parent_id": a["id"], "child_id": b["id"]}, headers=headers)
+    api = client.get(f"/pedigree/{a['id']}", headers=headers).json()
+    with SessionLocal() as db:
+        payload = crud.build_pedigree(db, a["id"])
+    assert sorted(n["id"] for n in payload["nodes"]) == sorted(n["id"] for n in api["nodes"])
+    assert payload["links"] == api["links"]
+
+def test_family_submit_maps_temp_ids():
+    email, headers = _new_user()
+    grandpa = client.post("/patients", json={"given_name": "Grandpa", "family_name": "Batch"}, headers=headers).json()["id"]
+    family = {
+        "patients": [
+            {"temp_id": "f", "given_name": "Father", "family_name": "Batch", "traits": [{"name": "LDLR"}]},
+            {"temp_id": "m", "given_name": "Mother", "family_name": "Batch"},
+            {"temp_id": "c", "given_name": "Child", "family_name": "Batch"},
+        ],
+        "relations": [{"parent_id": "f", "child_id": "c"}, {"parent_id": "m", "child_id": "c"},
+                      {"parent_id": grandpa, "child_id": "f"}],
+        "links": [{"patient1_id": "f", "patient2_id": "m", "link_type": "spouse"}],
+    }
+    r = client.post("/families", json=family, headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert set(data["patients"]) == {"f", "m", "c"} and len(data["relations"]) == 3 and len(data["links"]) == 1
+    ids = data["patients"]
+    gens = {n["id"]: n["generation"] for n in client.get(f"/pedigree/{ids['c']}", headers=headers).json()["nodes"]}
+    assert gens == {ids["c"]: 0, ids["f"]: -1, ids["m"]: -1, grandpa: -2}
+    father = client.get(f"/patients/{ids['f']}", headers=headers).json()
+    assert [t["name"] for t in father["traits"]] == ["LDLR"]
+
+def test_batch_is_all_or_nothing():
+    email, headers = _new_user()
+    snils = f"{uuid.uuid4().int % 10**9:09d}"
+    family = {
+        "patients": [
+            {"temp_id": "a", "given_name": "A", "family_name": "Atomic", "snils": snils},
+            {"temp_id": "b", "given_name": "B", "family_name": "Atomic", "snils": snils},
+        ],
+        "relations": [{"parent_id": "a", "child_id": "x"}, {"parent_id": 10**9, "child_id": "b"}],
+    }
+    r = client.post("/families", json=family, headers=headers)
+    assert r.status_code == 400
+    locs = [e["loc"] for e in r.json()["detail"]]
+    assert ["patients", 1, "snils"] in locs
+    assert ["relations", 0, "child_id"] in locs and ["relations", 1, "parent_id"] in locs
+    assert client.get("/patients", params={"search": "Atomic"}, headers=headers).json() == []
+
+    ids = client.post("/patients/batch", json=[{"given_name": "P", "family_name": "Atomic"},
+                                               {"given_name": "Q", "family_name": "Atomic"}], headers=headers).json()["ids"]
+    assert len(ids) == 2
+    r = client.post("/links/batch", json=[{"patient1_id": ids[0], "patient2_id": ids[1], "link_type": "sibling"}] * 2,
+                    headers=headers)
+    assert r.status_code == 400
+    assert client.post("/relations/batch", json=[{"parent_id": ids[0], "child_id": ids[1]}],
+                       headers=headers).json()["ids"]
+
+def test_kinship_endpoint_follows_family_version():
+    email, headers = _new_user()
+    family = {
+        "patients": [{"temp_id": t, "given_name": t, "family_name": "Kinship"} for t in ("f", "m", "c")],
+        "relations": [{"parent_id": "f", "child_id": "c"}, {"parent_id": "m", "child_id": "c"}],
+    }
+    ids = client.post("/families", json=family, headers=headers).json()["patients"]
+    r = client.get(f"/pedigree/{ids['c']}/kinship", headers=headers)
+    assert r.status_code == 200
+    assert {x["id"]: x["degree"] for x in r.json()["relatives"]} == {ids["f"]: 1, ids["m"]: 1}
+    assert client.get(f"/pedigree/{ids['c']}/kinship", headers={**headers, "If-None-Match": r.headers["etag"]}).status_code == 304
+    sib = client.post("/patients", json={"given_name": "Sib", "family_name": "Kinship"}, headers=headers).json()["id"]
+    client.post("/relations", json={"parent_id": ids["f"], "child_id": sib}, headers=headers)
+    r = client.get(f"/pedigree/{ids['c']}/kinship", params={"matrix": "true"}, headers=headers).json()
+    # полусибс: φ = 1/8, вторая степень
+    assert {x["id"]: x["kinship"] for x in r["relatives"]}[sib] == 0.125
+    assert sorted(r["matrix"]["ids"]) == sorted([*ids.values(), sib])
+
+def test_pedigree_layout_is_cached_per_family_version():
+    email, headers = _new_user()
+    family = {
+        "patients": [{"temp_id": t, "given_name": t, "family_name": "Layout"} for t in ("f", "m", "a", "b")],
+        "relations": [{"parent_id": p, "child_id": c} for p in ("f", "m") for c in ("a", "b")],
+        "links": [{"patient1_id": "f", "patient2_id": "m", "link_type": "spouse"}],
+    }
+    ids = client.post("/families", json=family, headers=headers).json()["patients"]
+    r = client.get(f"/pedigree/{ids['a']}", params={"layout": "true"}, headers=headers)
+    assert r.status_code == 200
+    pos = {n["id"]: (n["x"], n["y"]) for n in r.json()["nodes"]}
+    assert pos[ids["f"]][1] == pos[ids["m"]][1] < pos[ids["a"]][1] == pos[ids["b"]][1]
+    assert r.json()["layout"]["crossings"] == 0
+    # без layout координат нет
+    assert client.get(f"/pedigree/{ids['a']}", headers=headers).json()["nodes"][0].get("x") is None
+    etag = r.headers["etag"]
+    assert client.get(f"/pedigree/{ids['a']}", params={"layout": "true"}, headers={**headers, "If-None-Match": etag}).status_code == 304
+    child = client.post("/patients", json={"given_name": "c", "family_name": "Layout"}, headers=headers).json()["id"]
+    client.post("/relations", json={"parent_id": ids["a"], "child_id": child}, headers=headers)
+    r = client.get(f"/pedigree/{ids['a']}", params={"layout": "true"}, headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert child in {n["id"] for n in r.json()["nodes"] if n["x"] is not None}
+
+
+def test_pedigree_depth_direction_and_expand():
+    email, headers = _new_user()
+    # дед + бабка -> отец; отец + мать -> пробанд -> внук
+    family = {
+        "patients": [{"temp_id": t, "given_name": t, "family_name": "Depth"} for t in ("gf", "gm", "f", "m", "p", "k")],
+        "relations": [{"parent_id": a, "child_id": b} for a, b in
+                      (("gf", "f"), ("gm", "f"), ("f", "p"), ("m", "p"), ("p", "k"))],
+        "links": [{"patient1_id": "f", "patient2_id": "m", "link_type": "spouse"}],
+    }
+    ids = client.post("/families", json=family, headers=headers).json()["patients"]
+    r = client.get(f"/pedigree/{ids['p']}", params={"depth": 1}, headers=headers).json()
+    nodes = {n["id"]: n for n in r["nodes"]}
+    assert set(nodes) == {ids["f"], ids["m"], ids["p"], ids["k"]}
+    assert nodes[ids["f"]]["has_more"] and not nodes[ids["m"]]["has_more"] and not nodes[ids["p"]]["has_more"]
+    r = client.get(f"/pedigree/{ids['p']}", params={"depth": 2, "direction": "ancestors"}, headers=headers).json()
+    assert {n["id"] for n in r["nodes"]} == {ids[t] for t in ("gf", "gm", "f", "m", "p")}
+    r = client.get(f"/pedigree/{ids['p']}", params={"depth": 1, "direction": "descendants", "include_spouses": "false"}, headers=headers).json()
+    assert {n["id"] for n in r["nodes"]} == {ids["p"], ids["k"]}
+    assert client.get(f"/pedigree/{ids['p']}", params={"direction": "sideways"}, headers=headers).status_code == 422
+
+    # раскрытие отца: его родители на поколение выше
+    r = client.get(f"/pedigree/{ids['p']}/expand/{ids['f']}", params={"generation": -1}, headers=headers).json()
+    gens = {n["id"]: n["generation"] for n in r["nodes"]}
+    assert gens[ids["gf"]] == gens[ids["gm"]] == -2
+    assert {n["id"] for n in r["nodes"] if n["is_proband"]} == {ids["p"]}
+    stranger = client.post("/patients", json={"given_name": "S", "family_name": "Depth"}, headers=headers).json()["id"]
+    assert client.get(f"/pedigree/{ids['p']}/expand/{stranger}", headers=headers).status_code == 404
+
+    # граница среза пересчитывается при новой связи за его пределами
+    client.post("/relations", json={"parent_id": ids["m"], "child_id": stranger}, headers=headers)
+    r = client.get(f"/pedigree/{ids['p']}", params={"depth": 1}, headers=headers).json()
+    assert {n["id"]: n["has_more"] for n in r["nodes"]}[ids["m"]]
+
+
+def test_fast_responses_match_response_models():
+    # быстрые ответы не проходят через response_model — схема должна принимать их как есть
+    email, headers = _new_user()
+    family = {
+        "patients": [{"temp_id": t, "given_name": t, "family_name": "Fast", "dob": "1970-01-02"} for t in ("f", "c")],
+        "relations": [{"parent_id": "f", "child_id": "c"}],
+    }
+    ids = client.post("/families", json=family, headers=headers).json()["patients"]
+    for url, schema in ((f"/pedigree/{ids['c']}", schemas.PedigreeOut),
+                        (f"/pedigree/{ids['c']}?layout=true&depth=1", schemas.PedigreeOut),
+                        (f"/pedigree/{ids['c']}/expand/{ids['f']}", schemas.PedigreeOut),
+                        (f"/pedigree/{ids['c']}/kinship", schemas.KinshipOut)):
+        r = client.get(url, headers=headers)
+        assert r.status_code == 200 and r.headers["content-type"] == "application/json"
+        schema.model_validate(r.json())
+    patients = client.get("/patients", params={"search": "Fast"}, headers=headers).json()
+    assert {p["dob"] for p in patients} == {"1970-01-02"}
+    for p in patients:
+        schemas.PatientOut.model_validate(p)
+
+
+def test_pedigree_columnar_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    email, headers = _new_user()
+    family = {
+        "patients": [{"temp_id": t, "given_name": t, "family_name": "Wire", "sex": "M"} for t in ("f", "m", "c")],
+        "relations": [{"parent_id": "f", "child_id": "c"}, {"parent_id": "m", "child_id": "c"}],
+        "links": [{"patient1_id": "f", "patient2_id": "m", "link_type": "spouse"}],
+    }
+    ids = client.post("/families", json=family, headers=headers).json()["patients"]
+    as_json = client.get(f"/pedigree/{ids['c']}", headers=headers)
+    r = client.get(f"/pedigree/{ids['c']}", headers={**headers, "Accept": "application/x-msgpack"})
+    assert r.headers["content-type"] == "application/x-msgpack" and r.headers["vary"] == "Accept"
+    assert r.headers["etag"] != as_json.headers["etag"]
+    cols = msgpack.unpackb(r.content)
+    k = cols["ids"].index(ids["c"])
+    assert cols["flags"][k] & 1 and cols["generation"][k] == 0 and cols["given_name"][k] == "c"
+    edges = {(cols["ids"][s], cols["ids"][t], cols["edge_types"][e]) for s, t, e in zip(cols["source"], cols["target"], cols["type"])}
+    assert edges == {(l["source"], l["target"], l["type"]) for l in as_json.json()["links"]}
+    assert client.get(f"/pedigree/{ids['c']}", headers={**headers, "Accept": "application/x-msgpack", "If-None-Match": r.headers["etag"]}).status_code == 304
+    laid = msgpack.unpackb(client.get(f"/pedigree/{ids['c']}", params={"layout": "true"}, headers={**headers, "Accept": "application/msgpack"}).content)
+    assert len(laid["x"]) == len(laid["ids"])
+    assert client.get(f"/pedigree/{ids['c']}", headers={**headers, "Accept": "text/html"}).status_code == 406
+    # JSON по-прежнему по умолчанию и при равном q
+    assert client.get(f"/pedigree/{ids['c']}", headers={**headers, "Accept": "application/json, application/x-msgpack"}).headers["content-type"] == "application/json"
+
+
+def test_duplicates_detected_on_insert_and_merged():
+    email, headers = _new_user()
+    person = {"given_name": "Ilya", "family_name": "Dubov", "middle_name": "Petrovich", "dob": "1948-04-11", "sex": "M"}
+    first = client.post("/patients", json=person, headers=headers)
+    assert "x-possible-duplicates" not in first.headers
+    second = client.post("/patients", json={**person, "family_name": "Dubovv", "dob": "1948-11-04"}, headers=headers)
+    keep, dup = first.json()["id"], second.json()["id"]
+    assert second.headers["x-possible-duplicates"] == str(keep)
+    assert [c["id"] for c in client.get(f"/patients/{keep}/duplicates", headers=headers).json()] == [dup]
+    matches = client.get("/duplicates", headers=headers).json()
+    assert [(m["patient_id"], m["candidate_id"]) for m in matches] == [(keep, dup)]
+
+    child = client.post("/patients", json={"given_name": "Olga", "family_name": "Dubova"}, headers=headers).json()["id"]
+    client.post("/relations", json={"parent_id": dup, "child_id": child}, headers=headers)
+    etag = client.get(f"/pedigree/{child}", headers=headers).headers["etag"]
+    r = client.post(f"/patients/{keep}/merge", json={"duplicate_id": dup}, headers=headers)
+    assert r.status_code == 200 and r.json()["relations_as_parent"][0]["child_id"] == child
+    assert client.get(f"/patients/{dup}", headers=headers).status_code == 404
+    # генограмма семьи пересобрана: вместо дубля — оставленный пациент
+    pedigree = client.get(f"/pedigree/{child}", headers={**headers, "If-None-Match": etag})
+    assert pedigree.status_code == 200 and {n["id"] for n in pedigree.json()["nodes"]} == {keep, child}
+    assert client.get("/duplicates", headers=headers).json() == []
+    assert client.post(f"/patients/{keep}/merge", json={"duplicate_id": keep}, headers=headers).status_code == 400
+
+
+def test_cohort_query_with_facets_and_generations():
+    email, headers = _new_user()
+    ldlr = lambda age: [{"name": "LDLR", "onset_age": age}]
+    people = {
+        "gp": {"given_name": "Ivan", "sex": "M", "family_hyperchol": True, "diabetes": True, "traits": ldlr(50)},
+        "father": {"given_name": "Petr", "sex": "M", "family_hyperchol": True, "diabetes": True, "weight": 90, "traits": ldlr(28)},
+        "child": {"given_name": "Anna", "sex": "F", "family_hyperchol": True, "diabetes": True, "weight": 60, "traits": ldlr(19)},
+        "sister": {"given_name": "Olga", "sex": "F", "diabetes": True},
+        "stranger": {"given_name": "Oleg", "sex": "M", "family_hyperchol": True, "diabetes": True, "traits": ldlr(20)},
+    }
+    ids = {k: client.post("/patients", json={"family_name": "Kogortov", **v}, headers=headers).json()["id"] for k, v in people.items()}
+    for parent, child in (("gp", "father"), ("father", "child"), ("father", "sister")):
+        client.post("/relations", json={"parent_id": ids[parent], "child_id": ids[child]}, headers=headers)
+
+    query = {"family_hyperchol": True, "diabetes": True, "traits": [{"name": "LDLR", "max_onset_age": 29}], "limit": 2}
+    r = client.post("/cohort", json=query, headers=headers).json()
+    assert r["total"] == 3 and [p["id"] for p in r["items"]] == [ids["father"], ids["child"]]
+    assert r["facets"]["sex"] == {"M": 2, "F": 1} and r["facets"]["traits"] == {"LDLR": 3} and r["facets"]["diabetes"] == 3
+    rest = client.post("/cohort", json={**query, "cursor": int(r["next_cursor"])}, headers=headers).json()
+    assert [p["id"] for p in rest["items"]] == [ids["stranger"]] and rest["next_cursor"] is None
+    heavy = client.post("/cohort", json={**query, "min_weight": 80}, headers=headers).json()
+    assert [p["id"] for p in heavy["items"]] == [ids["father"]]
+
+    # семья пробанда по поколениям
+    family = client.post("/cohort", json={"diabetes": True, "proband_id": ids["child"]}, headers=headers).json()
+    assert family["total"] == 4 and family["facets"]["generation"] == {"-2": 1, "-1": 1, "0": 2}
+    same = client.post("/cohort", json={"diabetes": True, "proband_id": ids["child"], "generations": [0]}, headers=headers).json()
+    assert {(p["id"], p["generation"]) for p in same["items"]} == {(ids["child"], 0), (ids["sister"], 0)}
+    assert same["facets"]["family_hyperchol"] == 1
+
+    assert client.post("/cohort", json={"generations": [0]}, headers=headers).status_code == 400
+    _, other = _new_user()
+    assert client.post("/cohort", json={"proband_id": ids["child"]}, headers=other).status_code == 404
+    assert client.post("/cohort", json=query, headers=other).json()["total"] == 0
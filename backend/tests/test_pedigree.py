@@ -0,0 +1,42 @@
+# backend/tests/test_pedigree.py
+from types import SimpleNamespace
+from ..pedigree import PedigreeGraph
+
+
+def rel(parent_id, child_id):
+    return SimpleNamespace(parent_id=parent_id, child_id=child_id)
+
+
+def link(a, b, link_type):
+    return SimpleNamespace(patient1_id=a, patient2_id=b, link_type=link_type)
+
+
+def test_generations_and_links():
+    # 1 + 2 -> 3, 3 <-> 4 сибсы, 3 + 5 супруги -> 6
+    g = PedigreeGraph.from_edges(
+        [rel(1, 3), rel(2, 3), rel(3, 6), rel(5, 6), rel(1, 3)],
+        [link(1, 2, "spouse"), link(3, 4, "sibling"), link(5, 3, "Spouse")],
+    )
+    gen = g.assign_generations(6)
+    assert gen == {6: 0, 3: -1, 5: -1, 1: -2, 2: -2, 4: -1}
+    assert g.generation_conflicts(gen) == []
+    assert len(g.links()) == 7
+    assert {"source": 5, "target": 3, "type": "spouse"} in g.links()
+
+
+def test_spouse_across_generations_is_reported():
+    g = PedigreeGraph.from_edges([rel(1, 2), rel(2, 3)], [link(1, 3, "spouse")])
+    gen = g.assign_generations(1)
+    conflicts = g.generation_conflicts(gen)
+    # 1 -> 2 -> 3 и при этом 1 и 3 супруги: одно из рёбер обязано противоречить
+    assert len(conflicts) == 1
+    assert conflicts[0]["type"] in ("spouse", "vertical")
+
+
+def test_recursive_cte_decided_by_dialect():
+    from sqlalchemy import create_engine
+    from sqlalchemy.dialects import postgresql
+    from ..crud import supports_recursive_cte
+
+    assert supports_recursive_cte(create_engine("sqlite://").dialect)
+    assert supports_recursive_cte(postgresql.dialect())
@@ -0,0 +1,51 @@
+# backend/tests/test_profiling.py
+import logging
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from .. import auth, profiling
+
+engine = create_engine("sqlite://")
+profiling.instrument_engine(engine)
+
+app = FastAPI()
+app.add_middleware(profiling.ProfilingMiddleware)
+
+
+@app.get("/items/{item_id}")
+def read_item(item_id: int):
+    with engine.connect() as conn:
+        for _ in range(3):
+            conn.execute(text("SELECT :x"), {"x": item_id})
+    return {"id": item_id}
+
+
+client = TestClient(app)
+
+
+def test_server_timing_counts_queries(monkeypatch):
+    monkeypatch.setattr(profiling, "SERVER_TIMING", True)
+    r = client.get("/items/1")
+    assert 'desc="3 queries"' in r.headers["server-timing"]
+
+
+def test_slow_request_logged_with_sql(monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="pedigree.slow"):
+        client.get("/items/2")
+    message = caplog.records[-1].getMessage()
+    assert "/items/{item_id}" in message and "3 queries" in message
+    assert "repeated x3: SELECT ?" in message
+
+
+def test_profile_header_admin_only(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    researcher = auth.create_access_token({"sub": "r@example.com", "role": "researcher"})
+    r = client.get("/items/3", headers={"X-Profile": "cprofile", "Authorization": f"Bearer {researcher}"})
+    assert "x-profile-file" not in r.headers
+    admin = auth.create_access_token({"sub": "a@example.com", "role": "admin"})
+    r = client.get("/items/3", headers={"X-Profile": "cprofile", "Authorization": f"Bearer {admin}"})
+    assert os.path.exists(tmp_path / r.headers["x-profile-file"])
@@ -0,0 +1,42 @@
+# backend/tests/test_query_plans.py
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from .. import migrate
+from ..benchmarks import plans
+from ..database import Base, engine
+
+
+def test_foreign_keys_are_indexed():
+    # схема из models: с каждого внешнего ключа начинается индекс (удаление пациента, обход семьи)
+    memory = create_engine("sqlite://")
+    Base.metadata.create_all(memory)
+    assert plans.unindexed_foreign_keys(memory) == []
+    indexes = {ix["name"]: ix for ix in inspect(memory).get_indexes("relations")}
+    assert indexes["uq_relations_parent_child"]["unique"]
+    memory.dispose()
+
+
+def test_seq_scan_detection():
+    plan = [{"Plan": {"Node Type": "Nested Loop", "Plans": [
+        {"Node Type": "Index Scan", "Relation Name": "patients"},
+        {"Node Type": "Seq Scan", "Relation Name": "relations"},
+        {"Node Type": "Seq Scan", "Relation Name": "users"},
+    ]}}]
+    assert plans.seq_scans(plan) == ["relations"]
+
+
+def test_migrations_are_ordered_and_split():
+    found = migrate.discover()
+    assert [m.version for m in found] == sorted(m.version for m in found)
+    concurrent = [m for m in found if not m.transactional]
+    assert concurrent and all("CONCURRENTLY" in s for m in concurrent for s in migrate.statements(m.sql))
+    assert migrate.statements("-- a; b\nSELECT 1;\n\nSELECT 2") == ["SELECT 1", "SELECT 2"]
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="EXPLAIN-планы проверяются на PostgreSQL")
+def test_hot_queries_use_indexes():
+    migrate.upgrade(engine, log=lambda *_: None)
+    plans.seed_database(2000)
+    assert plans.unindexed_foreign_keys(engine) == []
+    assert plans.check() == {}
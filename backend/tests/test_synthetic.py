@@ -0,0 +1,57 @@
+# backend/tests/test_synthetic.py
+from collections import Counter
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from .. import models, synthetic
+from ..benchmarks.suite import compare
+from ..database import Base
+from ..pedigree import PedigreeGraph
+
+
+def test_generator_is_deterministic_and_exact():
+    a = list(synthetic.generate(500, seed=3))
+    b = list(synthetic.generate(500, seed=3))
+    assert sum(len(f) for f in a) == 500
+    assert [p["snils"] for f in a for p in f.people] == [p["snils"] for f in b for p in f.people]
+
+
+def test_families_are_valid_pedigrees():
+    for family in synthetic.generate(1000, synthetic.FamilySpec(depth=5, consanguinity=0.3), seed=1):
+        parents = Counter(child for _, child in family.parents)
+        assert max(parents.values(), default=0) <= 2
+        g = PedigreeGraph.from_edges([], [])
+        for p, c in family.parents:
+            g.add_relation(p, c)
+        for h, w in family.spouses:
+            g.add_link(h, w, "spouse")
+        assert g.generation_conflicts(g.assign_generations(0)) == []
+
+
+def test_snils_checksum():
+    # пример из правил ПФР: 112-233-445 95
+    assert synthetic.snils(112233445) == "112-233-445 95"
+
+
+def test_load_writes_families():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = models.User(email="gen@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        families = list(synthetic.generate(300, seed=2))
+        manifest = synthetic.load(db, families, user.id, batch_size=100)
+        assert len(manifest) == len(families)
+        assert db.query(models.Patient).count() == 300
+        assert db.query(models.Relation).count() == sum(len(f.parents) for f in families)
+        assert db.query(models.Trait).count() == sum(len(f.traits) for f in families)
+
+
+def test_compare_flags_time_and_query_regressions():
+    baseline = {"results": {"a": {"median_ms": 10.0, "queries": 3}, "b": {"median_ms": 0.2, "queries": 1}}}
+    assert compare({"a": {"median_ms": 12.0, "queries": 3}}, baseline, 0.25) == []
+    assert len(compare({"a": {"median_ms": 14.0, "queries": 4}}, baseline, 0.25)) == 2
+    # рост на доли миллисекунды — шум, даже если в разы
+    assert compare({"b": {"median_ms": 0.9, "queries": 1}}, baseline, 0.25) == []
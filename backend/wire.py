@@ -0,0 +1,70 @@
+# backend/wire.py
+# Колоночный формат генограммы для больших семей (Accept: application/x-msgpack).
+# Вместо списка объектов с повторяющимися ключами — параллельные массивы по узлам:
+#   ids, generation, flags (битовая маска FLAG_*), sex, given_name, family_name, middle_name, snils, dob;
+# рёбра — индексы в ids: source[k], target[k], type[k] (индекс в edge_types).
+# Собирается прямо из графа PedigreeGraph и строк пациентов, без промежуточных dict на узел.
+# Декодер для фронтенда — frontend/src/pedigreeWire.ts.
+from .pedigree import HORIZONTAL, SPOUSE, VERTICAL
+
+FORMAT = "pedigree-columns/1"
+
+FLAG_PROBAND = 1
+FLAG_HYPERCHOL = 2
+FLAG_HAS_MORE = 4
+
+EDGE_TYPES = (VERTICAL, HORIZONTAL, SPOUSE)
+
+
+def pedigree_columns(patient_id: int, patients, graph, generation, conflicts, frontier=(), truncated=False):
+    rows = sorted((p for p in patients if p.id in graph.nodes), key=lambda p: p.id)
+    ids = [p.id for p in rows]
+    index = {pid: k for k, pid in enumerate(ids)}
+    frontier = set(frontier)
+
+    edge_types = list(EDGE_TYPES)
+    type_code = {t: k for k, t in enumerate(edge_types)}
+    source, target, kind = [], [], []
+    for a, b, t in graph.unique_edges():
+        if a not in index or b not in index:
+            continue
+        if t not in type_code:
+            type_code[t] = len(edge_types)
+            edge_types.append(t)
+        source.append(index[a])
+        target.append(index[b])
+        kind.append(type_code[t])
+
+    return {
+        "format": FORMAT,
+        "proband": patient_id,
+        "truncated": truncated,
+        "ids": ids,
+        "generation": [generation.get(pid, 0) for pid in ids],
+        "flags": [
+            (FLAG_PROBAND if p.id == patient_id else 0)
+            | (FLAG_HYPERCHOL if p.family_hyperchol else 0)
+            | (FLAG_HAS_MORE if p.id in frontier else 0)
+            for p in rows
+        ],
+        "sex": [p.sex for p in rows],
+        "given_name": [p.given_name for p in rows],
+        "family_name": [p.family_name for p in rows],
+        "middle_name": [p.middle_name for p in rows],
+        "snils": [p.snils for p in rows],
+        "dob": [p.dob.isoformat() if p.dob else None for p in rows],
+        "edge_types": edge_types,
+        "source": source,
+        "target": target,
+        "type": kind,
+        "conflicts": conflicts,
+    }
+
+
+def add_layout(columns, layout_payload):
+    # координаты из раскладки (layout.genogram_layout) в порядке ids
+    position = {n["id"]: (n["x"], n["y"]) for n in layout_payload["nodes"]}
+    columns["x"] = [position[pid][0] for pid in columns["ids"]]
+    columns["y"] = [position[pid][1] for pid in columns["ids"]]
+    columns["layout"] = layout_payload.get("layout")
+    return columns
@@ -1,4 +1,6 @@
 // frontend/src/api.ts
+import { MSGPACK, decodePedigree } from "./pedigreeWire";
+
 const API_BASE = process.env.REACT_APP_API_URL || "https://pedigree-8b1w.onrender.com";
 
 export async function register(
@@ -28,11 +30,14 @@ export async function login(email: string, password: string) {
   return res.json();
 }
 
-export async function getPatients(token: string, search: string = "") {
+export async function getPatients(token: string, search: string = "", fields?: string) {
   const url = new URL(`${API_BASE}/patients`);
   if (search) {
     url.searchParams.append("search", search);
   }
+  if (fields) {
+    url.searchParams.append("fields", fields);
+  }
 
   const res = await fetch(url.toString(), {
     headers: { Authorization: `Bearer ${token}` },
@@ -46,6 +51,42 @@ export async function getPatients(token: string, search: string = "") {
   return res.json();
 }
 
+export async function getPatientsPage(
+  token: string,
+  options: {
+    search?: string;
+    cursor?: string;
+    sort?: string;
+    limit?: number;
+    count?: "exact" | "estimate";
+    fields?: string;
+  } = {}
+) {
+  const url = new URL(`${API_BASE}/patients`);
+  Object.entries(options).forEach(([key, value]) => {
+    if (value !== undefined && value !== "") {
+      url.searchParams.append(key, String(value));
+    }
+  });
+
+  const res = await fetch(url.toString(), {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+
+  if (!res.ok) {
+    const error = await res.json();
+    throw new Error(error.detail || "Failed to fetch patients");
+  }
+
+  const total = res.headers.get("X-Total-Count");
+  return {
+    items: await res.json(),
+    nextCursor: res.headers.get("X-Next-Cursor"),
+    total: total !== null ? Number(total) : null,
+    totalIsEstimate: res.headers.get("X-Total-Count-Type") === "estimate",
+  };
+}
+
 export async function createPatient(token: string, patient: any) {
   const res = await fetch(`${API_BASE}/patients`, {
     method: "POST",
@@ -71,13 +112,18 @@ export async function createRelation(token: string, rel: any) {
 }
 
 export async function getPedigree(token: string, patientId: number) {
-  const res = await fetch(`${API_BASE}/pedigree/${patientId}`, {
-    headers: { Authorization: `Bearer ${token}` },
+  // layout=true: сервер возвращает готовые координаты узлов;
+  // колоночный MessagePack в несколько раз меньше JSON на больших семьях
+  const res = await fetch(`${API_BASE}/pedigree/${patientId}?layout=true`, {
+    headers: { Authorization: `Bearer ${token}`, Accept: `${MSGPACK}, application/json;q=0.9` },
   });
   if (!res.ok) {
     const err = await res.json();
     throw new Error(err.detail || "Failed to fetch pedigree");
   }
+  if ((res.headers.get("Content-Type") || "").startsWith(MSGPACK)) {
+    return decodePedigree(await res.arrayBuffer());
+  }
   return res.json();
 }
 
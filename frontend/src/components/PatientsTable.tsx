@@ -1,9 +1,12 @@
 // frontend/src/components/PatientsTable.tsx
 
 import React, { useEffect, useState } from "react";
-import { getPatients } from "../api";
+import { getPatientsPage } from "../api";
 import "../styles/PatientsTable.css";
 
+const TABLE_FIELDS = "family_name,given_name,middle_name,snils";
+const PAGE_SIZE = 50;
+
 interface PatientsTableProps {
   token: string;
   onBack: () => void;
@@ -14,15 +17,36 @@ const PatientsTable: React.FC<PatientsTableProps> = ({ token, onBack, onSelectPa
   const [patients, setPatients] = useState<any[]>([]);
   const [search, setSearch] = useState("");
   const [loading, setLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [total, setTotal] = useState<number | null>(null);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
 
-  const loadPatients = async () => {
+  // cursor не задан — первая страница (новый поиск), иначе дописываем следующую
+  const loadPatients = async (cursor?: string) => {
     setLoading(true);
     try {
-      const data = await getPatients(token, search);
-      setPatients(Array.isArray(data) ? data : []);
+      // таблице нужны только колонки — связи и трейты не запрашиваем
+      const page = await getPatientsPage(token, {
+        search,
+        cursor,
+        limit: PAGE_SIZE,
+        fields: TABLE_FIELDS,
+        count: cursor ? undefined : "estimate",
+      });
+      const items = Array.isArray(page.items) ? page.items : [];
+      setPatients((prev) => (cursor ? [...prev, ...items] : items));
+      setNextCursor(page.nextCursor);
+      if (!cursor) {
+        setTotal(page.total);
+        setTotalIsEstimate(page.totalIsEstimate);
+      }
     } catch (err) {
       console.error("Error loading patients", err);
-      setPatients([]);
+      if (!cursor) {
+        setPatients([]);
+        setTotal(null);
+      }
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
@@ -48,7 +72,14 @@ const PatientsTable: React.FC<PatientsTableProps> = ({ token, onBack, onSelectPa
         />
       </div>
 
-      {loading ? (
+      {total !== null && (
+        <p className="patients-total">
+          Показано {patients.length} из {totalIsEstimate ? "≈" : ""}
+          {total}
+        </p>
+      )}
+
+      {loading && patients.length === 0 ? (
         <p>Загрузка...</p>
       ) : (
         <table className="patients-table">
@@ -83,6 +114,16 @@ const PatientsTable: React.FC<PatientsTableProps> = ({ token, onBack, onSelectPa
           </tbody>
         </table>
       )}
+
+      {nextCursor && (
+        <button
+          onClick={() => loadPatients(nextCursor)}
+          disabled={loading}
+          className="patients-more-btn"
+        >
+          {loading ? "Загрузка..." : "Показать ещё"}
+        </button>
+      )}
     </div>
   );
 };
@@ -13,6 +13,11 @@ type Node = {
   generation: number;
   is_proband?: boolean;
   family_hyperchol?: boolean;
+  // координаты серверной раскладки (GET /pedigree/{id}?layout=true)
+  x?: number | null;
+  y?: number | null;
+  fx?: number | null;
+  fy?: number | null;
 };
 
 type Link = {
@@ -51,6 +56,14 @@ const PedigreeGraph: React.FC<{ data: { nodes: Node[]; links: Link[] }; width?:
 
     const nodes: Node[] = data.nodes.map((d) => ({ ...d }));
     const links: Link[] = data.links.slice();
+    // раскладка пришла с сервера — симуляция не нужна, узлы закреплены на своих местах
+    const precomputed = nodes.length > 0 && nodes.every((d) => d.x != null && d.y != null);
+    if (precomputed) {
+      nodes.forEach((d) => {
+        d.fx = d.x;
+        d.fy = d.y;
+      });
+    }
 
     // группа для графа (будет зумироваться)
     const zoomG = svg
@@ -79,6 +92,7 @@ const PedigreeGraph: React.FC<{ data: { nodes: Node[]; links: Link[] }; width?:
       .force("collision", d3.forceCollide().radius(35))
       .force("y", d3.forceY<Node>((d) => d.generation * 150).strength(0.5))
       .force("x", d3.forceX(width / 2).strength(0.05));
+    if (precomputed) simulation.stop();
 
     const link = zoomG
       .append("g")
@@ -102,16 +116,22 @@ const PedigreeGraph: React.FC<{ data: { nodes: Node[]; links: Link[] }; width?:
         d3
           .drag<SVGGElement, Node>()
           .on("start", (event, d) => {
-            if (!event.active) simulation.alphaTarget(0.3).restart();
+            if (!event.active && !precomputed) simulation.alphaTarget(0.3).restart();
             d.fx = d.x;
             d.fy = d.y;
           })
           .on("drag", (event, d) => {
             d.fx = event.x;
             d.fy = event.y;
+            if (precomputed) {
+              d.x = event.x;
+              d.y = event.y;
+              render();
+            }
           })
           .on("end", (event, d) => {
-            if (!event.active) simulation.alphaTarget(0);
+            if (!event.active && !precomputed) simulation.alphaTarget(0);
+            if (precomputed) return;
             d.fx = null;
             d.fy = null;
           })
@@ -142,7 +162,7 @@ const PedigreeGraph: React.FC<{ data: { nodes: Node[]; links: Link[] }; width?:
       row.append("text").attr("x", 20).attr("y", 12).text(it.label);
     });
 
-    simulation.on("tick", () => {
+    const render = () => {
       link
         .attr("x1", (d: any) => d.source.x)
         .attr("y1", (d: any) => d.source.y)
@@ -150,7 +170,9 @@ const PedigreeGraph: React.FC<{ data: { nodes: Node[]; links: Link[] }; width?:
         .attr("y2", (d: any) => d.target.y);
 
       node.attr("transform", (d) => `translate(${d.x},${d.y})`);
-    });
+    };
+    simulation.on("tick", render);
+    if (precomputed) render();
   }, [data, width, height]);
 
   return (
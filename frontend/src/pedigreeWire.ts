@@ -0,0 +1,143 @@
+// frontend/src/pedigreeWire.ts
+// Колоночная генограмма (GET /pedigree/{id}, Accept: application/x-msgpack) -> { nodes, links }.
+// Формат описан в backend/wire.py. Минимальный декодер MessagePack без зависимостей:
+// ответ сервера содержит только nil, bool, целые, float, строки, массивы и словари.
+
+export const MSGPACK = "application/x-msgpack";
+
+const FLAG_PROBAND = 1;
+const FLAG_HYPERCHOL = 2;
+const FLAG_HAS_MORE = 4;
+
+const utf8 = new TextDecoder("utf-8");
+
+class Reader {
+  private view: DataView;
+  private bytes: Uint8Array;
+  private pos = 0;
+
+  constructor(buffer: ArrayBuffer) {
+    this.view = new DataView(buffer);
+    this.bytes = new Uint8Array(buffer);
+  }
+
+  read(): any {
+    const b = this.view.getUint8(this.pos++);
+    if (b <= 0x7f) return b;
+    if (b >= 0xe0) return b - 0x100;
+    if ((b & 0xf0) === 0x80) return this.map(b & 0x0f);
+    if ((b & 0xf0) === 0x90) return this.array(b & 0x0f);
+    if ((b & 0xe0) === 0xa0) return this.str(b & 0x1f);
+    switch (b) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return this.bin(this.uint(1));
+      case 0xc5: return this.bin(this.uint(2));
+      case 0xc6: return this.bin(this.uint(4));
+      case 0xca: return this.float(4);
+      case 0xcb: return this.float(8);
+      case 0xcc: return this.uint(1);
+      case 0xcd: return this.uint(2);
+      case 0xce: return this.uint(4);
+      case 0xcf: return this.uint(8);
+      case 0xd0: return this.int(1);
+      case 0xd1: return this.int(2);
+      case 0xd2: return this.int(4);
+      case 0xd3: return this.int(8);
+      case 0xd9: return this.str(this.uint(1));
+      case 0xda: return this.str(this.uint(2));
+      case 0xdb: return this.str(this.uint(4));
+      case 0xdc: return this.array(this.uint(2));
+      case 0xdd: return this.array(this.uint(4));
+      case 0xde: return this.map(this.uint(2));
+      case 0xdf: return this.map(this.uint(4));
+    }
+    throw new Error(`msgpack: unsupported type 0x${b.toString(16)}`);
+  }
+
+  private uint(size: number): number {
+    const v = this.view;
+    const p = this.pos;
+    this.pos += size;
+    if (size === 1) return v.getUint8(p);
+    if (size === 2) return v.getUint16(p);
+    if (size === 4) return v.getUint32(p);
+    return Number(v.getBigUint64(p));
+  }
+
+  private int(size: number): number {
+    const v = this.view;
+    const p = this.pos;
+    this.pos += size;
+    if (size === 1) return v.getInt8(p);
+    if (size === 2) return v.getInt16(p);
+    if (size === 4) return v.getInt32(p);
+    return Number(v.getBigInt64(p));
+  }
+
+  private float(size: number): number {
+    const p = this.pos;
+    this.pos += size;
+    return size === 4 ? this.view.getFloat32(p) : this.view.getFloat64(p);
+  }
+
+  private str(length: number): string {
+    const s = utf8.decode(this.bytes.subarray(this.pos, this.pos + length));
+    this.pos += length;
+    return s;
+  }
+
+  private bin(length: number): Uint8Array {
+    const b = this.bytes.slice(this.pos, this.pos + length);
+    this.pos += length;
+    return b;
+  }
+
+  private array(length: number): any[] {
+    const out = new Array(length);
+    for (let i = 0; i < length; i++) out[i] = this.read();
+    return out;
+  }
+
+  private map(length: number): Record<string, any> {
+    const out: Record<string, any> = {};
+    for (let i = 0; i < length; i++) {
+      const key = this.read();
+      out[key] = this.read();
+    }
+    return out;
+  }
+}
+
+export function decodeMsgpack(buffer: ArrayBuffer): any {
+  return new Reader(buffer).read();
+}
+
+// колонки -> тот же вид, что у JSON-ответа PedigreeOut
+export function columnsToPedigree(c: any) {
+  const nodes = c.ids.map((id: number, i: number) => ({
+    id,
+    given_name: c.given_name[i],
+    family_name: c.family_name[i],
+    middle_name: c.middle_name[i],
+    dob: c.dob[i],
+    snils: c.snils[i],
+    sex: c.sex[i],
+    generation: c.generation[i],
+    is_proband: (c.flags[i] & FLAG_PROBAND) !== 0,
+    family_hyperchol: (c.flags[i] & FLAG_HYPERCHOL) !== 0,
+    has_more: (c.flags[i] & FLAG_HAS_MORE) !== 0,
+    ...(c.x ? { x: c.x[i], y: c.y[i] } : {}),
+  }));
+  const links = c.source.map((s: number, k: number) => ({
+    source: c.ids[s],
+    target: c.ids[c.target[k]],
+    type: c.edge_types[c.type[k]],
+  }));
+  return { nodes, links, conflicts: c.conflicts || [], truncated: !!c.truncated, layout: c.layout || null };
+}
+
+export function decodePedigree(buffer: ArrayBuffer) {
+  return columnsToPedigree(decodeMsgpack(buffer));
+}